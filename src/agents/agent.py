@@ -1,61 +1,197 @@
 """Module with the definition of the graph agent, the relationship between nodes, and the interaction in each node."""
 
+import asyncio
+import functools
 import json
 import time
 
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.outputs import ChatGenerationChunk, LLMResult
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import (
+    get_async_callback_manager_for_config,
+    get_callback_manager_for_config,
+    get_executor_for_config,
+)
 from langgraph.graph import END, START, StateGraph
-from langgraph.prebuilt import ToolNode
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import Send
 from pydantic import BaseModel
 
-from src.agents.state import FightState
+from src.agents.combat import FIGHTERS_PER_FIGHT, MAX_ROUNDS, Attack, CombatEngine
+from src.agents.history import FightHistory, HistoryContext, count_tokens
+from src.agents.state import (
+    FightDraws,
+    FighterAnalysis,
+    FighterBranch,
+    FighterStats,
+    FightState,
+    RoundDraws,
+)
 from src.prompts.prompts import (
+    ATTACK_HIT_PROMPT,
+    ATTACK_MISS_PROMPT,
+    CURRENT_MODIFIERS_PROMPT,
+    EMPTY_MOVE_PROMPT,
     FIGHT_EVOLUTION_PROMPT,
+    FIGHTER_DESCRIPTION_PROMPT,
+    FIGHTER_MOVE_PROMPT,
+    FIGHTER_STATS_PROMPT,
     FIGHTERS_MOVES_PROMPT,
-    NARRATOR_PROMPT,
-    ORCHESTRATOR_PROMPT,
+    FIGHTERS_STATS_PROMPT,
+    FIGHT_HISTORY_PROMPT,
+    MODIFIERS_PROMPT,
+    NARRATOR_INSTRUCTIONS_PROMPT,
+    ORCHESTRATOR_INSTRUCTIONS_PROMPT,
+    ROUND_OUTCOME_PROMPT,
+    ROUND_START_PROMPT,
     SCENARIO_PROMPT,
-    UPDATER_PROMPT,
 )
 from src.utils.databases import (
-    add_exp_to_winner,
+    FightResult,
     add_fighter,
-    create_tables,
     get_fighter_info,
-    update_leaderboard,
-    update_scores,
+    record_fight_results,
+    roster_stats,
 )
 from src.utils.logger import logger
-from src.utils.utils import log_state, pop_persisted_keys, tprint
+from src.utils.metrics import (
+    record_llm_call,
+    record_prompt_prefix,
+    record_tool_call,
+    record_tool_memo_hit,
+)
+from src.utils.pacing import NoPacing
+from src.utils.roster import FightersFile
+from src.utils.utils import log_state, resolve_tool, run_blocking, tool_reference
+
+# Static instructions of each role, the same for every fight and round
+ORCHESTRATOR_INSTRUCTIONS = SystemMessage(content=ORCHESTRATOR_INSTRUCTIONS_PROMPT)
+NARRATOR_INSTRUCTIONS = SystemMessage(content=NARRATOR_INSTRUCTIONS_PROMPT)
+
+
+def record_fight_result(result):
+    """Write the result of a fight right away, the default `on_result` of the agent."""
+    record_fight_results([result])
 
 
 class AgenticFight:
-    MAX_ROUNDS = 3
+    MAX_ROUNDS = MAX_ROUNDS
+    MAX_MOVE_CHARS = 280
+    # Model calls of the orchestrator in a round, each one followed by its tool calls
+    MAX_TOOL_ITERATIONS = 2
 
-    def __init__(self, model, tools, checkpointer=None):
+    def __init__(
+        self,
+        model,
+        tools,
+        checkpointer=None,
+        on_result=None,
+        pacing=None,
+        cache=None,
+        history=None,
+        combat=None,
+        store=None,
+        metrics=None,
+        batcher=None,
+        max_tool_iterations=None,
+        executor=None,
+    ):
+        # The narrator uses the model as is, the orchestrator with the tools. The
+        # special_hits tool already runs in the branch of each fighter, so only the
+        # other tools are left to the orchestrator (None if there are none)
         self.model = model
+        self.tools = {tool.name: tool for tool in tools}
+        orchestrator_tools = [tool for tool in tools if tool.name != "special_hits"]
+        self.model_with_tools = (
+            model.bind_tools(orchestrator_tools) if orchestrator_tools else None
+        )
+        # Optional StructuredOutputCache for the narrator outputs
+        self.cache = cache
+        # Bounded fight history sent in the prompts
+        self.history = history or FightHistory()
+        # Deterministic damage engine: the LLM only narrates the rounds
+        self.combat = combat or CombatEngine()
+        # Fighters file, read again only when it changes
+        self.fighters_file = FightersFile()
+        # Delay after each node: none by default, see src/utils/pacing.py
+        self.pacing = pacing or NoPacing()
+        # Callback receiving the FightResult of each finished fight. By default, the
+        # result is written right away; a tournament can buffer them instead.
+        self.on_result = on_result or record_fight_result
+        # Optional FightStore recording every fight and round, see src/utils/fight_store.py
+        self.store = store
+        # Optional FightMetrics recording the latency of each node, see src/utils/metrics.py
+        self.metrics = metrics
+        # Optional StructuredOutputBatcher of RoundResult, sending the narrations of
+        # concurrent fights together instead of streaming them, see src/utils/llm_batching.py
+        self.batcher = batcher
+        # Cap of the orchestrator <-> tools loop of each round, 0 to skip the model
+        self.max_tool_iterations = (
+            self.MAX_TOOL_ITERATIONS
+            if max_tool_iterations is None
+            else max_tool_iterations
+        )
+
+        # Optional executor of the blocking I/O of the asynchronous nodes (databases,
+        # files and cache), instead of the default executor of the event loop
+        self.executor = executor
+
+        # Checkpointer of the graph, compiled on its first use, see `graph`
+        self.checkpointer = checkpointer
+
+    # Graph
+    ########
+    @functools.cached_property
+    def graph(self) -> CompiledStateGraph:
+        """Graph of the fight, compiled on its first use and then reused by every fight.
+
+        Compiling it lazily keeps it out of the startup, and lets a process worker that
+        unpickled the agent set its own store, cache or metrics before the first fight.
+        """
+        return self.build_graph()
 
-        # Graph
+    def build_graph(self) -> CompiledStateGraph:
+        """Build and compile the graph of the fight, with the nodes of the agent.
+
+        Returns:
+            CompiledStateGraph: The graph, interrupted before the moves of each round.
+        """
         builder = StateGraph(FightState)
 
-        # Set nodes
-        builder.add_node("prepare_fight", self.prepare_fight)
-        builder.add_node("characters_moves", self.characters_moves)
-        builder.add_node("orchestrator", self.orchestrator)
-        builder.add_node("tools", ToolNode(tools))
-        builder.add_node("narrator", self.narrator)
-        builder.add_node("updater", self.updater)
+        # Set nodes, wrapped to record their metrics when there are any
+        nodes = {
+            "prepare_fight": (self.prepare_fight, self.aprepare_fight),
+            "characters_moves": (self.characters_moves, self.acharacters_moves),
+            "fighter_analysis": (self.fighter_analysis, self.afighter_analysis),
+            "orchestrator": (self.orchestrator, self.aorchestrator),
+            "narrator": (self.narrator, self.anarrator),
+            "updater": (self.updater, self.aupdater),
+        }
+        for name, funcs in nodes.items():
+            if self.metrics is not None:
+                funcs = [
+                    self.metrics.instrument(name, func, ends_fight=name == "updater")
+                    for func in funcs
+                ]
+            builder.add_node(name, RunnableLambda(*funcs))
 
         # Logic
         builder.add_edge(START, "prepare_fight")
         builder.add_edge("prepare_fight", "characters_moves")
-        builder.add_edge("characters_moves", "orchestrator")
+        # One parallel branch per fighter, joined in the orchestrator
         builder.add_conditional_edges(
-            "orchestrator",
-            self.route_tools,
-            {"tools": "tools", "narrator": "narrator"},
+            "characters_moves", self.dispatch_fighters, ["fighter_analysis"]
         )
-        builder.add_edge("tools", "orchestrator")
+        builder.add_edge("fighter_analysis", "orchestrator")
+        builder.add_edge("orchestrator", "narrator")
         builder.add_conditional_edges(
             "narrator",
             self.fight_continues,
@@ -64,190 +200,477 @@ class AgenticFight:
         builder.add_edge("updater", END)
 
         # Compile graph
-        self.graph = builder.compile(
-            interrupt_before=["characters_moves"], checkpointer=checkpointer
+        return builder.compile(
+            interrupt_before=["characters_moves"], checkpointer=self.checkpointer
         )
 
+    # Pickling
+    ###########
+    # The agent is sent to process workers by pickling it. The compiled graph holds
+    # closures of LangGraph, so it is left out and compiled again on its first use in
+    # the worker. The tools are sent as references to their module. The model,
+    # checkpointer and other components must be picklable themselves: the fake model,
+    # SQLiteSaver and FightersFile reopen their connections and locks in the worker,
+    # while ChatOpenAI, the store, cache, batcher, metrics and executor are made in each
+    # worker.
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state.pop("graph", None)
+        state["executor"] = None
+        state["tools"] = {
+            name: tool_reference(tool) for name, tool in self.tools.items()
+        }
+        return state
+
+    def __setstate__(self, state: dict):
+        state["tools"] = {
+            name: resolve_tool(reference) for name, reference in state["tools"].items()
+        }
+        self.__dict__.update(state)
+
     # Nodes
     ########
-    @staticmethod
-    def prepare_fight(state: FightState):
-        # Create database and tables, if they do not exist
-        create_tables()
-        logger.info("Tables created!")
-
-        # Get fighters info and try to update the fighters table
-        with open("./src/prompts/fighters.json", "r", encoding="utf-8") as f:
-            fighters_info = json.load(f)
-        add_fighter(fighters_info["fighter1"])
-        add_fighter(fighters_info["fighter2"])
-        logger.info("Fighters added to database!")
-
-        # Get latest fighter info
-        fighter1_info = get_fighter_info(fighters_info["fighter1"]["name"])
-        fighter2_info = get_fighter_info(fighters_info["fighter2"]["name"])
-        state.update(
-            {
-                "fighter1_name": fighter1_info["name"],
-                "fighter1_description": fighter1_info["description"],
-                "fighter1_health": fighter1_info["health"],
-                "fighter1_strength": fighter1_info["strength"],
-                "fighter1_agility": fighter1_info["agility"],
-                "fighter1_intelligence": fighter1_info["intelligence"],
-                "fighter1_armor": fighter1_info["armor"],
-                "fighter1_tiredness": fighter1_info["tiredness"],
-                "fighter2_name": fighter2_info["name"],
-                "fighter2_description": fighter2_info["description"],
-                "fighter2_health": fighter2_info["health"],
-                "fighter2_strength": fighter2_info["strength"],
-                "fighter2_agility": fighter2_info["agility"],
-                "fighter2_intelligence": fighter2_info["intelligence"],
-                "fighter2_armor": fighter2_info["armor"],
-                "fighter2_tiredness": fighter2_info["tiredness"],
-            }
+    # Every node has a synchronous and an asynchronous version: the graph runs the first
+    # with invoke/stream, and the second with ainvoke/astream, without blocking the loop.
+    def prepare_fight(self, state: FightState, config: RunnableConfig):
+        update = self.fight_setup(self.load_fighters(state.get("fighter_names")))
+        update["draws"] = self.draw_fight(config, len(update["fighters"]))
+        self.record_fight(config, update)
+
+        log_state(logger, update)
+        self.pacing.pause()
+
+        return update
+
+    async def aprepare_fight(self, state: FightState, config: RunnableConfig):
+        # Database and file I/O run in a worker thread
+        fighters_info = await run_blocking(
+            self.executor, self.load_fighters, state.get("fighter_names")
+        )
+        update = self.fight_setup(fighters_info)
+        update["draws"] = self.draw_fight(config, len(update["fighters"]))
+        if self.store is not None:
+            await run_blocking(self.executor, self.record_fight, config, update)
+
+        log_state(logger, update)
+        await self.pacing.apause()
+
+        return update
+
+    def characters_moves(self, state: FightState):
+        # Human feedback node
+        update = self.round_start(state)
+
+        log_state(logger, update)
+        self.pacing.pause()
+
+        return update
+
+    async def acharacters_moves(self, state: FightState):
+        update = self.round_start(state)
+
+        log_state(logger, update)
+        await self.pacing.apause()
+
+        return update
+
+    def fighter_analysis(self, branch: FighterBranch):
+        # Branch of a single fighter: all the fighters are analyzed in parallel
+        tool_call = self.special_hits_call(branch)
+        tool_message = self.call_tool(tool_call) if tool_call else None
+        update = self.fighter_analysis_update(branch, tool_message)
+
+        log_state(logger, update)
+
+        return update
+
+    async def afighter_analysis(self, branch: FighterBranch):
+        tool_call = self.special_hits_call(branch)
+        tool_message = await self.acall_tool(tool_call) if tool_call else None
+        update = self.fighter_analysis_update(branch, tool_message)
+
+        log_state(logger, update)
+
+        return update
+
+    def orchestrator(self, state: FightState, config: RunnableConfig):
+        update = self.join_analyses(state)
+        if self.max_tool_iterations and self.model_with_tools is not None:
+            context = self.orchestrator_context({**state, **update})
+            tool_results = self.run_tools(context, config, self.round_draws(state))
+            update = self.orchestrator_update(update, tool_results)
+
+        log_state(logger, update)
+        self.pacing.pause()
+
+        return update
+
+    async def aorchestrator(self, state: FightState):
+        update = self.join_analyses(state)
+        if self.max_tool_iterations and self.model_with_tools is not None:
+            context = self.orchestrator_context({**state, **update})
+            tool_results = await self.arun_tools(context, self.round_draws(state))
+            update = self.orchestrator_update(update, tool_results)
+
+        log_state(logger, update)
+        await self.pacing.apause()
+
+        return update
+
+    def narrator(self, state: FightState, config: RunnableConfig):
+        health, context = self.narrator_context(state, config)
+
+        # The narration is streamed, so it can be shown while it is generated
+        result = self.stream_narration(context, config)
+        update = self.narrator_update(state, health, result)
+        self.record_round(config, state, update)
+
+        log_state(logger, update)
+        self.pacing.pause()
+
+        return update
+
+    async def anarrator(self, state: FightState, config: RunnableConfig):
+        health, context = self.narrator_context(state, config)
+        result = await self.astream_narration(context, config)
+        update = self.narrator_update(state, health, result)
+        if self.store is not None:
+            await run_blocking(self.executor, self.record_round, config, state, update)
+
+        log_state(logger, update)
+        await self.pacing.apause()
+
+        return update
+
+    def updater(self, state: FightState, config: RunnableConfig):
+        # The combat engine decides the result of the fight: the model only narrates
+        result = self.fight_result(state)
+        update = self.updater_update(result)
+        self.record_outcome(config, state, result)
+
+        # Update leaderboard, scores and winner's exp in a single transaction
+        self.on_result(
+            FightResult(winner=result.winner, loser=result.loser, draw=result.draw)
+        )
+
+        log_state(logger, update)
+        self.pacing.pause()
+
+        return update
+
+    async def aupdater(self, state: FightState, config: RunnableConfig):
+        result = self.fight_result(state)
+        update = self.updater_update(result)
+        if self.store is not None:
+            await run_blocking(
+                self.executor, self.record_outcome, config, state, result
+            )
+
+        await run_blocking(
+            self.executor,
+            self.on_result,
+            FightResult(winner=result.winner, loser=result.loser, draw=result.draw),
         )
+
+        log_state(logger, update)
+        await self.pacing.apause()
+
+        return update
+
+    # Nodes' steps
+    ###############
+    def load_fighters(self, fighter_names: list[str] = None) -> list[dict]:
+        """Load the latest info of the fighters, from the roster cache of the database.
+
+        If the fighters are not given, every fighter of the fighters file fights, and
+        the fighters table is updated with them whenever the file changes. The tables
+        must exist: they are created once at startup, see `create_tables`.
+
+        Args:
+            fighter_names (list[str], optional): Names of the fighters. Defaults to None.
+
+        Returns:
+            list[dict]: The info of each fighter.
+        """
+        if not fighter_names:
+            fighters_info, changed = self.fighters_file.load()
+            if changed:
+                for fighter_info in fighters_info.values():
+                    add_fighter(fighter_info)
+                logger.info("Fighters added to database!")
+
+            fighter_names = [fighter["name"] for fighter in fighters_info.values()]
+
+        fighters_info = [get_fighter_info(name) for name in fighter_names]
         logger.info("Fighters info retrieved and updated!")
+        logger.debug(f"Roster cache: {roster_stats()}")
+
+        return fighters_info
+
+    @staticmethod
+    def fight_setup(fighters_info: list[dict]) -> dict:
+        """Build the initial state of a fight from the info of its fighters."""
+        # Checked before any model call: the result of the fight is between two fighters
+        if len(fighters_info) != FIGHTERS_PER_FIGHT:
+            raise ValueError(
+                f"A fight has {FIGHTERS_PER_FIGHT} fighters, not {len(fighters_info)}"
+            )
+
+        fighters, health = [], []
+        for fighter_info in fighters_info:
+            fighters.append(
+                FighterStats(
+                    name=fighter_info["name"],
+                    description=fighter_info["description"],
+                    strength=fighter_info["strength"],
+                    agility=fighter_info["agility"],
+                    intelligence=fighter_info["intelligence"],
+                    armor=fighter_info["armor"],
+                    tiredness=fighter_info["tiredness"],
+                )
+            )
+            health.append(fighter_info["health"])
 
         # Add prompts
-        state["fight_evolution"] = [
-            FIGHT_EVOLUTION_PROMPT.format(
-                scenario=SCENARIO_PROMPT,
-                fighter1_name=state["fighter1_name"],
-                fighter1_description=state["fighter1_description"],
-                fighter2_name=state["fighter2_name"],
-                fighter2_description=state["fighter2_description"],
+        fighters_descriptions = "\n\n".join(
+            FIGHTER_DESCRIPTION_PROMPT.format(
+                number=number, name=fighter.name, description=fighter.description
             )
-        ]
+            for number, fighter in enumerate(fighters, start=1)
+        )
+        prompt_prefix = FIGHT_EVOLUTION_PROMPT.format(
+            scenario=SCENARIO_PROMPT, fighters_descriptions=fighters_descriptions
+        )
         logger.info("Prompts assigned!")
 
         # Set some state variables
-        state["round"] = 0
-        state["modifiers"] = ""
+        return {
+            "fighters": fighters,
+            "health": health,
+            "fight_evolution": [prompt_prefix],
+            "prompt_prefix": prompt_prefix,
+            "round": 0,
+            "modifiers": "",
+            "history_summary": "",
+            "summarized_rounds": 0,
+        }
 
-        state = pop_persisted_keys(state, keys=["messages"])
-        log_state(logger, state)
-        time.sleep(3)
+    def round_start(self, state: FightState) -> dict:
+        """Start a new round with the moves given by the players."""
+        round_number = state["round"] + 1
+        fight_evolution = [ROUND_START_PROMPT.format(round=round_number)]
+        logger.info(fight_evolution[-1])
 
-        return state
+        messages = [HumanMessage(content=self.render_moves(state))]
+        logger.info(messages[-1].content)
+
+        return {
+            "round": round_number,
+            "fight_evolution": fight_evolution,
+            "messages": messages,
+        }
+
+    def draw_fight(self, config: RunnableConfig, fighters: int) -> FightDraws:
+        """Draw the random numbers of a fight, from the seed of the engine and its thread_id."""
+        return self.combat.draw_fight(
+            config["configurable"].get("thread_id", ""), fighters, self.MAX_ROUNDS
+        )
 
     @staticmethod
-    def characters_moves(state: FightState):
-        # Human feedback node
+    def round_draws(state: FightState) -> RoundDraws | None:
+        """Random draws of the current round, for the tools."""
+        draws = state.get("draws")
+        return draws.round(state["round"]) if draws is not None else None
 
-        state["round"] += 1
-        state["fight_evolution"] = [f"COMIENZA LA RONDA {state['round']}!"]
-        logger.info(f"COMIENZA LA RONDA {state['round']}!")
-
-        state["messages"] = [
-            HumanMessage(
-                content=FIGHTERS_MOVES_PROMPT.format(
-                    fighter1_name=state["fighter1_name"],
-                    fighter1_move=state["fighter1_move"],
-                    fighter2_name=state["fighter2_name"],
-                    fighter2_move=state["fighter2_move"],
-                )
-            )
-        ]
+    def special_hits_call(self, branch: FighterBranch) -> dict | None:
+        """Tool call of the special_hits tool for the fighter of a branch, if the tool is available."""
+        if "special_hits" not in self.tools:
+            return None
 
-        logger.info(state["messages"][-1].content)
-        log_state(logger, state)
-        time.sleep(3)
+        number = branch["index"] + 1
+        return {
+            "name": "special_hits",
+            "args": {"fighter": number, "draws": branch.get("draws")},
+            "id": f"special_hits-{branch['round']}-{number}",
+            "type": "tool_call",
+        }
 
-        return state
+    def fighter_analysis_update(
+        self, branch: FighterBranch, tool_message: ToolMessage = None
+    ) -> dict:
+        """Analysis of the fighter of a branch, from its move and its special_hits tool message."""
+        hit_multiplier, modifiers = 1.0, ""
+        if tool_message is not None:
+            hit_multiplier, modifiers = tool_message.artifact, tool_message.content
+
+        return {
+            "analyses": {
+                branch["index"]: FighterAnalysis(
+                    move=self.validate_move(branch["move"]),
+                    hit_multiplier=hit_multiplier,
+                    modifiers=modifiers,
+                )
+            }
+        }
 
-    def orchestrator(self, state: FightState):
-        query_modifiers = ORCHESTRATOR_PROMPT.format(
-            fight_evolution=state["fight_evolution"],
-            fighters_moves=state["messages"][-1].content,
-            modifiers=state["modifiers"],
+    @staticmethod
+    def join_analyses(state: FightState) -> dict:
+        """Join the analyses of the fighter branches."""
+        analyses = [state["analyses"][i] for i in range(len(state["fighters"]))]
+        modifiers = "\n".join(
+            analysis.modifiers for analysis in analyses if analysis.modifiers
         )
+        logger.info(f"Modifiers - {modifiers}")
 
-        # TODO: solve generation issue
-        import random
+        return {
+            "moves": [analysis.move for analysis in analyses],
+            "modifiers": modifiers,
+            "hit_multipliers": [analysis.hit_multiplier for analysis in analyses],
+        }
 
-        state["modifiers"] = (
-            f"Fighter {random.choice(['1', '2'])} hit multiplier: {random.choices([0.5, 1, 1.5, 2], weights=[0.1, 0.6, 0.2, 0.1], k=1)[0]}"
+    def orchestrator_context(self, state: FightState) -> list[BaseMessage]:
+        """Prompt of the orchestrator, which adds modifiers to the round with its tools."""
+        context, _ = self.bounded_prompt(
+            ORCHESTRATOR_INSTRUCTIONS,
+            state,
+            [
+                FIGHTERS_MOVES_PROMPT.format(fighters_moves=self.render_moves(state)),
+                CURRENT_MODIFIERS_PROMPT.format(modifiers=state["modifiers"]),
+            ],
         )
-        # result = self.model.invoke([HumanMessage(content=query_modifiers)])
-        # logger.warning(result)
+        return context
 
-        # state["messages"] = [result]
+    @staticmethod
+    def orchestrator_update(
+        update: dict, tool_results: list[tuple[dict, ToolMessage]]
+    ) -> dict:
+        """Apply the tool results of the orchestrator to the joined analyses.
 
-        logger.info(f"Modifiers - {state['modifiers']}")
+        A modifier multiplies the hit multiplier of its fighter, which the special hit
+        of the fighter branch set. The content of every result is added to the
+        modifiers, for the narrator. A call repeated with the same arguments only
+        counts once, with its last result.
 
-        state = pop_persisted_keys(state, keys=["fight_evolution"])
-        log_state(logger, state)
-        time.sleep(3)
+        Args:
+            update (dict): The joined analyses of the fighter branches.
+            tool_results (list[tuple[dict, ToolMessage]]): The tool calls of the orchestrator and their tool messages.
 
-        return state
+        Returns:
+            dict: The update of the orchestrator.
+        """
+        hit_multipliers = list(update["hit_multipliers"])
+        modifiers = [update["modifiers"]] if update["modifiers"] else []
+        latest = {
+            (tool_call["name"], json.dumps(tool_call["args"], sort_keys=True)): (
+                tool_call,
+                tool_message,
+            )
+            for tool_call, tool_message in tool_results
+        }
+        for tool_call, tool_message in latest.values():
+            if tool_message.status == "error":
+                continue
+            modifiers.append(tool_message.content)
 
-    def narrator(self, state: FightState):
-        context = NARRATOR_PROMPT.format(
-            fight_evolution=state["fight_evolution"],
-            fighter1_name=state["fighter1_name"],
-            fighter1_move=state["fighter1_move"],
-            fighter2_name=state["fighter2_name"],
-            fighter2_move=state["fighter2_move"],
-            modifiers=state["modifiers"],
-            fighter1_health=state["fighter1_health"],
-            fighter1_strength=state["fighter1_strength"],
-            fighter1_agility=state["fighter1_agility"],
-            fighter1_intelligence=state["fighter1_intelligence"],
-            fighter1_armor=state["fighter1_armor"],
-            fighter1_tiredness=state["fighter1_tiredness"],
-            fighter2_health=state["fighter2_health"],
-            fighter2_strength=state["fighter2_strength"],
-            fighter2_agility=state["fighter2_agility"],
-            fighter2_intelligence=state["fighter2_intelligence"],
-            fighter2_armor=state["fighter2_armor"],
-            fighter2_tiredness=state["fighter2_tiredness"],
-        )
-
-        result = self.model.with_structured_output(RoundResult).invoke(context)
-        state["fighter1_health"] = result.health_remaining_fighter1
-        state["fighter2_health"] = result.health_remaining_fighter2
-
-        state["fight_evolution"] = [result.round_development]
-        logger.info(result.round_development)
+            index = tool_call["args"].get("fighter")
+            if not isinstance(index, int) or not 1 <= index <= len(hit_multipliers):
+                continue
+            if tool_call["name"] == "modifiers":
+                hit_multipliers[index - 1] *= tool_message.artifact
+        logger.info(f"Orchestrator modifiers - {modifiers}")
 
-        # Reset modifiers state
-        state["modifiers"] = ""
+        return {
+            **update,
+            "modifiers": "\n".join(modifiers),
+            "hit_multipliers": hit_multipliers,
+        }
 
-        state = pop_persisted_keys(state, keys=["messages"])
-        log_state(logger, state)
-        time.sleep(3)
+    def narrator_context(
+        self, state: FightState, config: RunnableConfig
+    ) -> tuple[list[float], list[BaseMessage]]:
+        """Compute the damage of the round and the prompt of the narrator.
 
-        return state
+        Args:
+            state (FightState): The current state of the fight.
+            config (RunnableConfig): The config of the node, with the thread_id of the fight.
 
-    def updater(self, state: FightState):
-        # Get results from the fight
-        fight_evolution = ["FIN DE LA PELEA!"]
-        logger.info(fight_evolution)
+        Returns:
+            tuple[list[float], list[BaseMessage]]: Health of each fighter after the round, and the prompt.
+        """
+        # Fights checkpointed before their draws draw them again, from the same seed
+        draws = state.get("draws") or self.draw_fight(config, len(state["fighters"]))
+        rng = self.combat.round_rng(draws.seed, state["round"])
+        health, attacks = self.combat.resolve_round(
+            rng,
+            state["fighters"],
+            state["health"],
+            state.get("hit_multipliers") or [1.0] * len(state["fighters"]),
+        )
+        logger.info(f"Health after round {state['round']}: {health}")
 
-        context = UPDATER_PROMPT.format(fight_evolution=state["fight_evolution"])
-        result = self.model.with_structured_output(EndOfFight).invoke(context)
-        logger.info(result)
+        context, history = self.bounded_prompt(
+            NARRATOR_INSTRUCTIONS,
+            state,
+            [
+                FIGHTERS_MOVES_PROMPT.format(fighters_moves=self.render_moves(state)),
+                MODIFIERS_PROMPT.format(modifiers=state["modifiers"]),
+                ROUND_OUTCOME_PROMPT.format(
+                    round_outcome=self.render_attacks(state, attacks)
+                ),
+                FIGHTERS_STATS_PROMPT.format(
+                    fighters_stats=self.render_stats({**state, "health": health})
+                ),
+            ],
+        )
+        logger.info(
+            f"Fight history: {history.tokens} tokens "
+            f"({history.saved_tokens} saved in round {state['round']})"
+        )
 
-        state["winner"] = result.winner
-        state["loser"] = result.loser
+        return health, context
 
-        fight_evolution.append(
-            f"GANADOR: {state['winner']}\nPERDEDOR: {state['loser']}"
+    def narrator_update(
+        self, state: FightState, health: list[float], result: "RoundResult"
+    ) -> dict:
+        """Add the narration of the round to the fight evolution."""
+        # Fold the rounds out of the verbatim window into the summary
+        history_summary, summarized_rounds = self.history.fold(
+            state["fight_evolution"] + [result.round_development],
+            state["history_summary"],
+            state["summarized_rounds"],
         )
-        state["fight_evolution"] = [fight_evolution]
+        logger.info(result.round_development)
 
-        logger.info(fight_evolution)
+        return {
+            "health": health,
+            "fight_evolution": [result.round_development],
+            "history_summary": history_summary,
+            "summarized_rounds": summarized_rounds,
+            # Reset modifiers state
+            "modifiers": "",
+        }
+
+    def fight_result(self, state: FightState) -> "EndOfFight":
+        """Result of the fight, from the final health of the fighters."""
+        logger.info(["FIN DE LA PELEA!"])
 
-        # Update leaderboard
-        if not result.draw:
-            update_leaderboard(state["winner"], state["loser"])
-        else:
-            # TODO: define case when draw
-            pass
-        update_scores()
+        winner, loser, draw = self.combat.fight_result(
+            state["fighters"], state["health"]
+        )
+        return EndOfFight(winner=winner, loser=loser, draw=draw)
 
-        # Add exp to winner
-        add_exp_to_winner(state["winner"])
+    @staticmethod
+    def updater_update(result: "EndOfFight") -> dict:
+        """Add the result of the fight to the state."""
+        logger.info(result)
+
+        fight_evolution = [
+            "FIN DE LA PELEA!",
+            f"EMPATE: {result.winner} y {result.loser}"
+            if result.draw
+            else f"GANADOR: {result.winner}\nPERDEDOR: {result.loser}",
+        ]
+        logger.info(fight_evolution)
 
         # Update tiredness
         # TODO: add tiredness logic
@@ -258,30 +681,533 @@ class AgenticFight:
         # Reset state variables
         # TODO: reset state variables
 
-        state = pop_persisted_keys(state, keys=["messages"])
-        log_state(logger, state)
-        time.sleep(3)
+        return {
+            "winner": result.winner,
+            "loser": result.loser,
+            "fight_evolution": fight_evolution,
+        }
 
-        return state
+    def record_fight(self, config: RunnableConfig, update: dict):
+        """Record the start of a fight in the store, if there is one."""
+        if self.store is None:
+            return
+        self.store.add_fight(
+            config["configurable"].get("thread_id", ""),
+            update["fighters"],
+            update["health"],
+            update["fight_evolution"][0],
+            update.get("draws"),
+        )
+
+    def record_round(self, config: RunnableConfig, state: FightState, update: dict):
+        """Record a narrated round in the store, if there is one."""
+        if self.store is None:
+            return
+        self.store.add_round(
+            config["configurable"].get("thread_id", ""),
+            state["round"],
+            state["moves"],
+            state["modifiers"],
+            state.get("hit_multipliers") or [1.0] * len(state["fighters"]),
+            update["health"],
+            update["fight_evolution"][-1],
+            state.get("analyses"),
+        )
+
+    def record_outcome(
+        self, config: RunnableConfig, state: FightState, result: "EndOfFight"
+    ):
+        """Record the outcome of a fight in the store, if there is one."""
+        if self.store is None:
+            return
+        self.store.add_outcome(
+            config["configurable"].get("thread_id", ""),
+            result.winner,
+            result.loser,
+            result.draw,
+            state["round"],
+        )
+
+    # Helpers
+    ##########
+    @classmethod
+    def validate_move(cls, move: str) -> str:
+        """Clean up the move of a fighter: collapse whitespace and bound its length.
+
+        Args:
+            move (str): The move, as written by the player.
+
+        Returns:
+            str: The validated move, or a default one if it was empty.
+        """
+        move = " ".join(str(move or "").split())
+        return move[: cls.MAX_MOVE_CHARS] or EMPTY_MOVE_PROMPT
+
+    @staticmethod
+    def render_moves(state: FightState) -> str:
+        """Render the moves of every fighter for a prompt."""
+        return "\n\n".join(
+            FIGHTER_MOVE_PROMPT.format(number=number, name=fighter.name, move=move)
+            for number, (fighter, move) in enumerate(
+                zip(state["fighters"], state["moves"]), start=1
+            )
+        )
+
+    @staticmethod
+    def render_attacks(state: FightState, attacks: list[Attack]) -> str:
+        """Render the outcome of the attacks of a round for a prompt."""
+        return "\n".join(
+            (ATTACK_HIT_PROMPT if attack.hit else ATTACK_MISS_PROMPT).format(
+                attacker=state["fighters"][attack.attacker].name,
+                target=state["fighters"][attack.target].name,
+                multiplier=attack.multiplier,
+                damage=attack.damage,
+            )
+            for attack in attacks
+        )
+
+    @staticmethod
+    def render_stats(state: FightState) -> str:
+        """Render the current stats of every fighter for a prompt."""
+        return "\n\n".join(
+            FIGHTER_STATS_PROMPT.format(
+                number=number,
+                name=fighter.name,
+                health=health,
+                strength=fighter.strength,
+                agility=fighter.agility,
+                intelligence=fighter.intelligence,
+                armor=fighter.armor,
+                tiredness=fighter.tiredness,
+            )
+            for number, (fighter, health) in enumerate(
+                zip(state["fighters"], state["health"]), start=1
+            )
+        )
+
+    def history_context(
+        self, state: FightState, preamble: bool = True, reserved_tokens: int = 0
+    ) -> HistoryContext:
+        """Render the bounded fight history for a prompt.
+
+        Args:
+            state (FightState): The current state of the fight.
+            preamble (bool, optional): Whether to start with the scenario and fighters. Defaults to True.
+            reserved_tokens (int, optional): Tokens of the rest of the prompt, out of the token budget. Defaults to 0.
+
+        Returns:
+            HistoryContext: The rendered history.
+        """
+        return self.history.render(
+            state["fight_evolution"],
+            state["history_summary"],
+            state["summarized_rounds"],
+            preamble,
+            reserved_tokens,
+        )
+
+    def bounded_prompt(
+        self, instructions: SystemMessage, state: FightState, parts: list[str]
+    ) -> tuple[list[BaseMessage], HistoryContext]:
+        """Build a prompt that starts with the fight history, within the token budget.
+
+        The budget bounds the whole prompt. Only the history can be trimmed, so it gets
+        the tokens that the instructions, the prompt prefix and the parts of the round
+        leave.
+
+        Args:
+            instructions (SystemMessage): The static instructions of the role.
+            state (FightState): The current state of the fight.
+            parts (list[str]): The parts of the prompt that change every round, after the history.
+
+        Returns:
+            tuple[list[BaseMessage], HistoryContext]: The prompt, and the history in it.
+        """
+        reserved_tokens = (
+            count_tokens(instructions.content)
+            + count_tokens(self.prompt_prefix(state))
+            + count_tokens(FIGHT_HISTORY_PROMPT.format(fight_evolution=""))
+            + sum(count_tokens(part) for part in parts)
+        )
+        history = self.history_context(state, False, reserved_tokens)
+        if reserved_tokens + history.tokens > self.history.token_budget:
+            logger.warning(
+                f"Prompt of {reserved_tokens + history.tokens} tokens, over the budget "
+                f"of {self.history.token_budget} even with the history trimmed"
+            )
+
+        context = self.prompt(
+            instructions,
+            state,
+            [FIGHT_HISTORY_PROMPT.format(fight_evolution=history.text), *parts],
+        )
+        return context, history
+
+    @staticmethod
+    def prompt_prefix(state: FightState) -> str:
+        """Scenario and fighters of the fight, the same in every prompt of the fight."""
+        # Fights checkpointed before the prompt prefix have it as their first entry
+        return state.get("prompt_prefix") or state["fight_evolution"][0]
 
-    # Conditional edges' conditions
     @staticmethod
-    def route_tools(state: FightState):
+    def prompt(
+        instructions: SystemMessage, state: FightState, parts: list[str]
+    ) -> list[BaseMessage]:
+        """Build a prompt whose start is the same for every round of the fight.
+
+        The instructions and the prompt prefix of the fight come first, unchanged from
+        one round to the next, so that the provider can cache them. The parts of the
+        round come last, in a single message.
+
+        Args:
+            instructions (SystemMessage): The static instructions of the role.
+            state (FightState): The current state of the fight.
+            parts (list[str]): The parts of the prompt that change every round.
+
+        Returns:
+            list[BaseMessage]: The prompt.
         """
-        Used in the conditional_edge to route to the ToolNode if the last message
-        has tool calls. Otherwise, route to the 'narrator'.
+        prefix = AgenticFight.prompt_prefix(state)
+        record_prompt_prefix(count_tokens(instructions.content) + count_tokens(prefix))
+        return [
+            instructions,
+            HumanMessage(content=prefix),
+            HumanMessage(content=[{"type": "text", "text": part} for part in parts]),
+        ]
+
+    def call_tool(self, tool_call: dict) -> ToolMessage:
+        """Run a tool call, recording its latency."""
+        start = time.perf_counter()
+        tool_message = self.tools[tool_call["name"]].invoke(tool_call)
+        record_tool_call(tool_call["name"], time.perf_counter() - start)
+        return tool_message
+
+    async def acall_tool(self, tool_call: dict) -> ToolMessage:
+        """Asynchronous version of `call_tool`."""
+        start = time.perf_counter()
+        tool_message = await self.tools[tool_call["name"]].ainvoke(tool_call)
+        record_tool_call(tool_call["name"], time.perf_counter() - start)
+        return tool_message
+
+    def run_tools(
+        self,
+        context: list[BaseMessage],
+        config: RunnableConfig,
+        draws: RoundDraws | None = None,
+    ) -> list[tuple[dict, ToolMessage]]:
+        """Let the model call the tools until it answers, or up to `max_tool_iterations` model calls.
+
+        The tool calls of an answer run in parallel, and the results of deterministic
+        tools are reused for the same arguments within the round, including the
+        identical calls of a single answer, which run once.
+
+        Args:
+            context (list[BaseMessage]): The prompt of the model.
+            config (RunnableConfig): The config of the node, for the thread pool of the tool calls.
+            draws (RoundDraws, optional): Random draws of the round, given to the tools that take them. Defaults to None.
+
+        Returns:
+            list[tuple[dict, ToolMessage]]: The tool calls and their tool messages, in order.
         """
-        if isinstance(state, list):
-            ai_message = state[-1]
-        elif messages := state["messages"]:
-            ai_message = messages[-1]
-        else:
-            raise ValueError(f"No messages found in input state to tool_edge: {state}")
+        messages, results, memo = list(context), [], {}
+        for _ in range(self.max_tool_iterations):
+            start = time.perf_counter()
+            ai_message = self.model_with_tools.invoke(messages)
+            record_llm_call(time.perf_counter() - start, ai_message.usage_metadata)
+            if not ai_message.tool_calls:
+                return results
+
+            unique_calls, indexes = self.unique_tool_calls(ai_message.tool_calls)
+            with get_executor_for_config(config) as executor:
+                unique_messages = list(
+                    executor.map(
+                        lambda tool_call: self.memoized_tool_call(
+                            tool_call, memo, draws
+                        ),
+                        unique_calls,
+                    )
+                )
+            tool_messages = self.share_tool_messages(
+                ai_message.tool_calls, indexes, unique_messages
+            )
+            messages += [ai_message, *tool_messages]
+            results += zip(ai_message.tool_calls, tool_messages)
+
+        logger.info(
+            f"Orchestrator stopped after {self.max_tool_iterations} model calls"
+        )
+        return results
 
-        if hasattr(ai_message, "tool_calls") and len(ai_message.tool_calls) > 0:
-            return "tools"
+    async def arun_tools(
+        self, context: list[BaseMessage], draws: RoundDraws | None = None
+    ) -> list[tuple[dict, ToolMessage]]:
+        """Asynchronous version of `run_tools`."""
+        messages, results, memo = list(context), [], {}
+        for _ in range(self.max_tool_iterations):
+            start = time.perf_counter()
+            ai_message = await self.model_with_tools.ainvoke(messages)
+            record_llm_call(time.perf_counter() - start, ai_message.usage_metadata)
+            if not ai_message.tool_calls:
+                return results
 
-        return "narrator"
+            unique_calls, indexes = self.unique_tool_calls(ai_message.tool_calls)
+            unique_messages = await asyncio.gather(
+                *(
+                    self.amemoized_tool_call(tool_call, memo, draws)
+                    for tool_call in unique_calls
+                )
+            )
+            tool_messages = self.share_tool_messages(
+                ai_message.tool_calls, indexes, unique_messages
+            )
+            messages += [ai_message, *tool_messages]
+            results += zip(ai_message.tool_calls, tool_messages)
+
+        logger.info(
+            f"Orchestrator stopped after {self.max_tool_iterations} model calls"
+        )
+        return results
+
+    def unique_tool_calls(self, tool_calls: list[dict]) -> tuple[list[dict], list[int]]:
+        """Drop the repeated calls of deterministic tools with the same arguments in a model answer.
+
+        Args:
+            tool_calls (list[dict]): The tool calls of the answer.
+
+        Returns:
+            tuple[list[dict], list[int]]: The tool calls to run, and the index among them of the call whose result each tool call takes.
+        """
+        unique_calls, indexes, positions = [], [], {}
+        for tool_call in tool_calls:
+            key = self.memo_key(tool_call)
+            if key in positions:
+                record_tool_memo_hit(tool_call["name"])
+                indexes.append(positions[key])
+                continue
+            if key is not None:
+                positions[key] = len(unique_calls)
+            indexes.append(len(unique_calls))
+            unique_calls.append(tool_call)
+        return unique_calls, indexes
+
+    @staticmethod
+    def share_tool_messages(
+        tool_calls: list[dict], indexes: list[int], unique_messages: list[ToolMessage]
+    ) -> list[ToolMessage]:
+        """Tool message of each tool call, from the results of the calls that ran, see `unique_tool_calls`."""
+        return [
+            tool_message
+            if tool_message.tool_call_id == tool_call["id"]
+            else tool_message.model_copy(update={"tool_call_id": tool_call["id"]})
+            for tool_call, tool_message in zip(
+                tool_calls, (unique_messages[index] for index in indexes)
+            )
+        ]
+
+    def memoized_tool_call(
+        self, tool_call: dict, memo: dict, draws: RoundDraws | None = None
+    ) -> ToolMessage:
+        """Run a tool call of the model, reusing the result of the same call of a deterministic tool.
+
+        Args:
+            tool_call (dict): The tool call.
+            memo (dict): The results of the deterministic tool calls of the round.
+            draws (RoundDraws, optional): Random draws of the round, given to the tools that take them. Defaults to None.
+
+        Returns:
+            ToolMessage: The result, or the error for the model if the call failed.
+        """
+        key = self.memo_key(tool_call)
+        if key in memo:
+            record_tool_memo_hit(tool_call["name"])
+            return memo[key].model_copy(update={"tool_call_id": tool_call["id"]})
+
+        try:
+            tool_message = self.call_tool(self.with_draws(tool_call, draws))
+        except Exception as error:
+            return self.tool_error(tool_call, error)
+        if key is not None:
+            memo[key] = tool_message
+        return tool_message
+
+    async def amemoized_tool_call(
+        self, tool_call: dict, memo: dict, draws: RoundDraws | None = None
+    ) -> ToolMessage:
+        """Asynchronous version of `memoized_tool_call`."""
+        key = self.memo_key(tool_call)
+        if key in memo:
+            record_tool_memo_hit(tool_call["name"])
+            return memo[key].model_copy(update={"tool_call_id": tool_call["id"]})
+
+        try:
+            tool_message = await self.acall_tool(self.with_draws(tool_call, draws))
+        except Exception as error:
+            return self.tool_error(tool_call, error)
+        if key is not None:
+            memo[key] = tool_message
+        return tool_message
+
+    def with_draws(self, tool_call: dict, draws: RoundDraws | None) -> dict:
+        """Add the draws of the round to the arguments of a tool call, if its tool takes them."""
+        tool = self.tools.get(tool_call["name"])
+        if draws is None or tool is None or "draws" not in tool.args:
+            return tool_call
+        return {**tool_call, "args": {**tool_call["args"], "draws": draws}}
+
+    def memo_key(self, tool_call: dict) -> tuple[str, str] | None:
+        """Key of a tool call in the memo of the round, None if its tool is not deterministic."""
+        tool = self.tools.get(tool_call["name"])
+        if tool is None or not (tool.metadata or {}).get("deterministic"):
+            return None
+        return tool.name, json.dumps(tool_call["args"], sort_keys=True)
+
+    @staticmethod
+    def tool_error(tool_call: dict, error: Exception) -> ToolMessage:
+        """Tool message of a failed tool call, so that the model can correct it."""
+        logger.warning(f"Tool call {tool_call['name']} failed: {error!r}")
+        return ToolMessage(
+            content=f"Error: {error!r}",
+            name=tool_call["name"],
+            tool_call_id=tool_call["id"],
+            status="error",
+        )
+
+    def stream_narration(self, context, config: RunnableConfig) -> "RoundResult":
+        """Stream the narration of a round from the model, going through the cache if there is one.
+
+        The tokens reach the graph consumers that stream with `stream_mode="messages"`,
+        and the time to the first token is logged. A narration from the cache reaches
+        them as a single chunk.
+
+        Args:
+            context: The prompt for the model.
+            config (RunnableConfig): The config of the node, to propagate the stream callbacks.
+
+        Returns:
+            RoundResult: The whole narration of the round.
+        """
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, RoundResult, context)
+            if (result := self.cache.get(key, RoundResult)) is not None:
+                logger.debug("RoundResult retrieved from cache")
+                self.replay_narration(context, config, result)
+                return result
+
+        start = time.perf_counter()
+        time_to_first_token = None
+        tokens, usage = [], {}
+        for chunk in self.model.stream(context, config):
+            if time_to_first_token is None and chunk.content:
+                time_to_first_token = time.perf_counter() - start
+            tokens.append(chunk.content)
+            add_usage(usage, chunk)
+        elapsed = time.perf_counter() - start
+        record_llm_call(elapsed, usage)
+        logger.info(
+            f"Narration time to first token: {time_to_first_token or 0:.2f}s "
+            f"(total {elapsed:.2f}s)"
+        )
+
+        result = RoundResult(round_development="".join(tokens))
+        if self.cache is not None:
+            self.cache.put(key, result)
+        return result
+
+    async def astream_narration(self, context, config: RunnableConfig) -> "RoundResult":
+        """Asynchronous version of `stream_narration`, with the cache I/O in a worker thread.
+
+        With a batcher, the narration is requested together with the ones of the other
+        fights of the event loop, and it is not streamed. A narration from the cache is
+        streamed as a single chunk, with or without a batcher.
+
+        Args:
+            context: The prompt for the model.
+            config (RunnableConfig): The config of the node, to propagate the stream callbacks.
+
+        Returns:
+            RoundResult: The whole narration of the round.
+        """
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, RoundResult, context)
+            result = await run_blocking(self.executor, self.cache.get, key, RoundResult)
+            if result is not None:
+                logger.debug("RoundResult retrieved from cache")
+                await self.areplay_narration(context, config, result)
+                return result
+
+        if self.batcher is not None:
+            result, elapsed, usage = await self.batcher.submit(context)
+            record_llm_call(elapsed, usage)
+            logger.info(f"Narration batched (model request {elapsed:.2f}s)")
+            if self.cache is not None:
+                await run_blocking(self.executor, self.cache.put, key, result)
+            return result
+
+        start = time.perf_counter()
+        time_to_first_token = None
+        tokens, usage = [], {}
+        async for chunk in self.model.astream(context, config):
+            if time_to_first_token is None and chunk.content:
+                time_to_first_token = time.perf_counter() - start
+            tokens.append(chunk.content)
+            add_usage(usage, chunk)
+        elapsed = time.perf_counter() - start
+        record_llm_call(elapsed, usage)
+        logger.info(
+            f"Narration time to first token: {time_to_first_token or 0:.2f}s "
+            f"(total {elapsed:.2f}s)"
+        )
+
+        result = RoundResult(round_development="".join(tokens))
+        if self.cache is not None:
+            await run_blocking(self.executor, self.cache.put, key, result)
+        return result
+
+    @staticmethod
+    def replay_narration(context, config: RunnableConfig, result: "RoundResult"):
+        """Send a cached narration to the stream callbacks, as a model run of a single chunk."""
+        (run_manager,) = get_callback_manager_for_config(config).on_chat_model_start(
+            {}, [context], name="narration_cache"
+        )
+        chunk = ChatGenerationChunk(
+            message=AIMessageChunk(content=result.round_development)
+        )
+        run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+        run_manager.on_llm_end(LLMResult(generations=[[chunk]]))
+
+    @staticmethod
+    async def areplay_narration(context, config: RunnableConfig, result: "RoundResult"):
+        """Asynchronous version of `replay_narration`."""
+        (run_manager,) = await get_async_callback_manager_for_config(
+            config
+        ).on_chat_model_start({}, [context], name="narration_cache")
+        chunk = ChatGenerationChunk(
+            message=AIMessageChunk(content=result.round_development)
+        )
+        await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+        await run_manager.on_llm_end(LLMResult(generations=[[chunk]]))
+
+    # Conditional edges' conditions
+    @classmethod
+    def dispatch_fighters(cls, state: FightState) -> list[Send]:
+        """Fan out the round: send each fighter and its move to its own analysis branch."""
+        moves = list(state["moves"]) + [""] * (
+            len(state["fighters"]) - len(state["moves"])
+        )
+        draws = cls.round_draws(state)
+        return [
+            Send(
+                "fighter_analysis",
+                FighterBranch(
+                    index=index,
+                    fighter=fighter,
+                    move=move,
+                    round=state["round"],
+                    draws=draws,
+                ),
+            )
+            for index, (fighter, move) in enumerate(zip(state["fighters"], moves))
+        ]
 
     @classmethod
     def fight_continues(cls, state: FightState):
@@ -292,20 +1218,34 @@ class AgenticFight:
             return "updater"
 
         # If any fighter has no health left, fight is over
-        if state["fighter1_health"] <= 0 or state["fighter2_health"] <= 0:
+        if any(health <= 0 for health in state["health"]):
             return "updater"
 
         return "characters_moves"
 
 
+def add_usage(usage: dict, chunk):
+    """Add the token usage of a streamed chunk, if it has any, to the usage of the stream."""
+    _add_counts(usage, getattr(chunk, "usage_metadata", None) or {})
+
+
+def _add_counts(total: dict, counts: dict):
+    for key, value in counts.items():
+        if isinstance(value, int):
+            total[key] = total.get(key, 0) + value
+        elif isinstance(value, dict):
+            # Token details, such as the prompt tokens read from the provider cache
+            _add_counts(total.setdefault(key, {}), value)
+
+
 # Structured ouputs
 class RoundResult(BaseModel):
     round_development: str
-    health_remaining_fighter1: int
-    health_remaining_fighter2: int
 
 
 class EndOfFight(BaseModel):
+    """Result of a fight, decided by the combat engine from the final health."""
+
     winner: str
     loser: str
     draw: bool
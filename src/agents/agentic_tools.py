@@ -2,33 +2,64 @@
 
 import random
 import time
-from typing import Literal
+from typing import Annotated
 
-from langchain_core.tools import tool
+from langchain_core.tools import InjectedToolArg, tool
+
+from src.agents.combat import HIT_MULTIPLIERS, HIT_WEIGHTS, MODIFIER_WEIGHTS, MODIFIERS
+from src.agents.state import RoundDraws
 
 # from langgraph.types import Command # to be used if we want to update the state of the graph
 # from langchain_core.messages import ToolMessage
 
 
-@tool(name_or_callable="special_hits")
-def special_hits(fighter: Literal["fighter_1", "fighter_2"]) -> str:
+@tool(name_or_callable="special_hits", response_format="content_and_artifact")
+def special_hits(
+    fighter: int, draws: Annotated[RoundDraws | None, InjectedToolArg] = None
+) -> tuple[str, float]:
     """Tool that randomly generates a special hit multiplier for a specific fighter.
 
     Args:
-        fighter (Literal["fighter_1", "fighter_2"]): literal string representing the fighter to update.
+        fighter (int): number of the fighter to update, starting at 1.
+        draws (RoundDraws, optional): random draws of the round, given by the agent, not the model.
+
+    Returns:
+        tuple[str, float]: a string with the special hit multiplier, and the multiplier itself as artifact.
+    """
+    if draws is not None and 1 <= fighter <= len(draws.special_hits):
+        hit_multiplier = draws.special_hits[fighter - 1]
+    else:
+        # Outside of a fight
+        hit_multiplier = random.choices(HIT_MULTIPLIERS, weights=HIT_WEIGHTS, k=1)[0]
+
+    return f"Fighter {fighter} hit multiplier: {hit_multiplier}", hit_multiplier
+
+
+@tool(name_or_callable="modifiers", response_format="content_and_artifact")
+def modifiers(
+    fighter: int, draws: Annotated[RoundDraws | None, InjectedToolArg] = None
+) -> tuple[str, float]:
+    """Tool that generates a modifier of the round for a specific fighter, such as a slip or a second wind.
+
+    Args:
+        fighter (int): number of the fighter to update, starting at 1.
+        draws (RoundDraws, optional): random draws of the round, given by the agent, not the model.
 
     Returns:
-        str: a string with the special hit multiplier.
+        tuple[str, float]: a string with the modifier, and its damage multiplier as artifact.
     """
-    hit_multiplier = random.choices(
-        [0.5, 1, 1.5, 2], weights=[0.1, 0.6, 0.2, 0.1], k=1
-    )[0]
+    if draws is not None and 1 <= fighter <= len(draws.modifiers):
+        description, multiplier = MODIFIERS[draws.modifiers[fighter - 1]]
+    else:
+        # Outside of a fight
+        description, multiplier = random.choices(
+            MODIFIERS, weights=MODIFIER_WEIGHTS, k=1
+        )[0]
 
-    return f"{fighter} hit multiplier: {hit_multiplier}"
+    return f"Fighter {fighter} modifier: {description} (x{multiplier})", multiplier
 
 
-@tool(name_or_callable="modifiers")
-def modifiers():
-    """This function is not useful for now."""
-    # TODO: add extra modifiers
-    pass
+# With the draws of the round, the same arguments always give the same result, so the
+# calls of a round can be memoized
+special_hits.metadata = {"deterministic": True}
+modifiers.metadata = {"deterministic": True}
@@ -0,0 +1,273 @@
+"""Module with the deterministic combat engine, which computes the damage of each round.
+
+The LLM only narrates the rounds: the health of the fighters is computed here from
+their stats and the hit multipliers of the orchestrator, with a seeded random
+generator, so the same fight always gives the same numbers, and the result of the
+fight is decided from the final health. The random draws of the
+tools of a fight are also generated here, as a block, from the same seed.
+"""
+
+import hashlib
+import random
+from dataclasses import dataclass
+
+from src.agents.state import FightDraws, FighterStats, RoundDraws
+
+MAX_ROUNDS = 3
+# The results, the leaderboard and the head-to-head records are between two fighters
+FIGHTERS_PER_FIGHT = 2
+
+# Distribution of the special hit multipliers
+HIT_MULTIPLIERS = (0.5, 1, 1.5, 2)
+HIT_WEIGHTS = (0.1, 0.6, 0.2, 0.1)
+
+# Modifiers of the modifiers tool: what happens to the fighter, and its damage multiplier
+MODIFIERS = (
+    ("nada fuera de lo normal", 1.0),
+    ("resbala en el suelo mojado", 0.8),
+    ("se le mete polvo en los ojos", 0.9),
+    ("el público le anima con fuerza", 1.1),
+    ("recupera el aliento", 1.2),
+)
+MODIFIER_WEIGHTS = (0.5, 0.15, 0.15, 0.1, 0.1)
+
+# Damage formula
+DAMAGE_PER_STRENGTH = 3.0
+ARMOR_SCALE = 10.0  # armor points that absorb half of the damage
+BASE_HIT_CHANCE = 0.75
+HIT_CHANCE_PER_AGILITY = 0.05
+HIT_CHANCE_PER_TIREDNESS = 0.02
+MIN_HIT_CHANCE, MAX_HIT_CHANCE = 0.2, 0.95
+
+
+@dataclass(slots=True)
+class Attack:
+    """Outcome of the attack of a fighter during a round."""
+
+    attacker: int
+    target: int
+    hit: bool
+    multiplier: float
+    damage: float
+
+
+def hit_chance(attacker: FighterStats, target: FighterStats) -> float:
+    """Probability that an attack lands, from the agility and tiredness of both fighters.
+
+    Args:
+        attacker (FighterStats): The attacking fighter.
+        target (FighterStats): The defending fighter.
+
+    Returns:
+        float: The probability of hitting.
+    """
+    chance = (
+        BASE_HIT_CHANCE
+        + HIT_CHANCE_PER_AGILITY * (attacker.agility - target.agility)
+        - HIT_CHANCE_PER_TIREDNESS * (attacker.tiredness - target.tiredness)
+    )
+    return min(max(chance, MIN_HIT_CHANCE), MAX_HIT_CHANCE)
+
+
+def hit_damage(
+    attacker: FighterStats, target: FighterStats, multiplier: float
+) -> float:
+    """Damage of an attack that lands, reduced by the armor of the target.
+
+    Args:
+        attacker (FighterStats): The attacking fighter.
+        target (FighterStats): The defending fighter.
+        multiplier (float): Special hit multiplier of the attacker.
+
+    Returns:
+        float: The health lost by the target.
+    """
+    reduction = ARMOR_SCALE / (ARMOR_SCALE + target.armor)
+    return round(attacker.strength * DAMAGE_PER_STRENGTH * multiplier * reduction, 1)
+
+
+class CombatEngine:
+    """Seeded, deterministic damage engine."""
+
+    def __init__(self, seed: int = 0):
+        """Initialize the engine.
+
+        Args:
+            seed (int, optional): Seed of every fight resolved by the engine. Defaults to 0.
+        """
+        self.seed = seed
+
+    def fight_seed(self, fight_id: str) -> str:
+        """Seed of a fight, which only depends on the seed of the engine and the fight.
+
+        Args:
+            fight_id (str): Identifier of the fight, e.g. its thread_id.
+
+        Returns:
+            str: The seed of the fight.
+        """
+        return hashlib.sha256(f"{self.seed}:{fight_id}".encode()).hexdigest()[:16]
+
+    @staticmethod
+    def round_rng(fight_seed: str, round_number: int) -> random.Random:
+        """Random generator of a round, which only depends on the seed of the fight and the round.
+
+        Args:
+            fight_seed (str): The seed of the fight, see `fight_seed`.
+            round_number (int): The number of the round.
+
+        Returns:
+            random.Random: The generator of the round.
+        """
+        return random.Random(f"{fight_seed}:{round_number}")
+
+    def draw_fight(
+        self, fight_id: str, fighters: int, max_rounds: int = MAX_ROUNDS
+    ) -> FightDraws:
+        """Draw the special hits and modifiers of every fighter and round of a fight at once.
+
+        Args:
+            fight_id (str): Identifier of the fight, e.g. its thread_id.
+            fighters (int): Number of fighters.
+            max_rounds (int, optional): Maximum number of rounds. Defaults to MAX_ROUNDS.
+
+        Returns:
+            FightDraws: The seed and the draws of the fight.
+        """
+        seed = self.fight_seed(fight_id)
+        rng = random.Random(seed)
+        count = fighters * max_rounds
+        special_hits = self.draw_multipliers(rng, count)
+        modifiers = rng.choices(
+            range(len(MODIFIERS)), weights=MODIFIER_WEIGHTS, k=count
+        )
+
+        return FightDraws(
+            seed=seed,
+            rounds=[
+                RoundDraws(
+                    special_hits=special_hits[start : start + fighters],
+                    modifiers=modifiers[start : start + fighters],
+                )
+                for start in range(0, count, fighters)
+            ],
+        )
+
+    @staticmethod
+    def draw_multipliers(rng: random.Random, count: int) -> list[float]:
+        """Draw special hit multipliers with the same distribution as the special_hits tool.
+
+        Args:
+            rng (random.Random): The random generator.
+            count (int): Number of multipliers to draw.
+
+        Returns:
+            list[float]: The multipliers.
+        """
+        return rng.choices(HIT_MULTIPLIERS, weights=HIT_WEIGHTS, k=count)
+
+    @staticmethod
+    def resolve_round(
+        rng: random.Random,
+        fighters: list[FighterStats],
+        health: list[float],
+        multipliers: list[float],
+    ) -> tuple[list[float], list[Attack]]:
+        """Resolve a round: every fighter still standing attacks another one.
+
+        Args:
+            rng (random.Random): The random generator of the round.
+            fighters (list[FighterStats]): The fighters.
+            health (list[float]): Health of each fighter at the beginning of the round.
+            multipliers (list[float]): Special hit multiplier of each fighter.
+
+        Returns:
+            tuple[list[float], list[Attack]]: Health of each fighter at the end of the round, and the attacks.
+        """
+        standing = [i for i, value in enumerate(health) if value > 0]
+        new_health = list(health)
+        attacks = []
+        for attacker in standing:
+            targets = [i for i in standing if i != attacker]
+            if not targets:
+                break
+            target = targets[0] if len(targets) == 1 else rng.choice(targets)
+
+            hit = rng.random() < hit_chance(fighters[attacker], fighters[target])
+            damage = (
+                hit_damage(fighters[attacker], fighters[target], multipliers[attacker])
+                if hit
+                else 0.0
+            )
+            new_health[target] = max(round(new_health[target] - damage, 1), 0.0)
+            attacks.append(Attack(attacker, target, hit, multipliers[attacker], damage))
+
+        return new_health, attacks
+
+    @staticmethod
+    def fight_result(
+        fighters: list[FighterStats], health: list[float]
+    ) -> tuple[str, str, bool]:
+        """Decide the result of a fight from the final health of the fighters.
+
+        The fighter with the most health left wins. If both fighters have the same
+        health, it is a draw.
+
+        Args:
+            fighters (list[FighterStats]): The two fighters.
+            health (list[float]): Final health of each fighter.
+
+        Returns:
+            tuple[str, str, bool]: The names of the winner and the loser, and whether it is a draw.
+
+        Raises:
+            ValueError: If the fight does not have two fighters.
+        """
+        if len(fighters) != FIGHTERS_PER_FIGHT:
+            raise ValueError(
+                f"A fight has {FIGHTERS_PER_FIGHT} fighters, not {len(fighters)}"
+            )
+        winner, loser = (0, 1) if health[0] >= health[1] else (1, 0)
+        return fighters[winner].name, fighters[loser].name, health[0] == health[1]
+
+    def simulate_fight(
+        self,
+        fighters: list[FighterStats],
+        health: list[float],
+        fight_id: str = "",
+        max_rounds: int = MAX_ROUNDS,
+        modifiers: bool = True,
+    ) -> tuple[list[float], int]:
+        """Simulate the numbers of a whole fight, without any LLM.
+
+        The special hits and modifiers of every fighter and round are drawn as a block,
+        and the fight stops after `max_rounds` rounds or when any fighter has no health
+        left, like `AgenticFight.fight_continues`. In a fight, the orchestrator model
+        decides which fighters get a modifier: the simulation applies the modifier of
+        every fighter in every round, as if it always called the modifiers tool, or
+        none of them.
+
+        Args:
+            fighters (list[FighterStats]): The fighters.
+            health (list[float]): Initial health of each fighter.
+            fight_id (str, optional): Identifier of the fight. Defaults to "".
+            max_rounds (int, optional): Maximum number of rounds. Defaults to MAX_ROUNDS.
+            modifiers (bool, optional): Whether to apply the drawn modifiers, on top of the special hits. Defaults to True.
+
+        Returns:
+            tuple[list[float], int]: Final health of each fighter, and number of rounds.
+        """
+        draws = self.draw_fight(fight_id, len(fighters), max_rounds)
+        for round_number in range(1, max_rounds + 1):
+            rng = self.round_rng(draws.seed, round_number)
+            round_draws = draws.round(round_number)
+            multipliers = list(round_draws.special_hits)
+            if modifiers:
+                # Applied like the orchestrator applies the results of the modifiers tool
+                for index, modifier in enumerate(round_draws.modifiers):
+                    multipliers[index] *= MODIFIERS[modifier][1]
+            health, _ = self.resolve_round(rng, fighters, health, multipliers)
+            if any(value <= 0 for value in health):
+                break
+
+        return health, round_number
@@ -0,0 +1,361 @@
+"""Module with a deterministic, offline stand-in for the chat model of the fights.
+
+`FakeFightModel` is a LangChain chat model, so the graph runs through the same code
+paths as with `ChatOpenAI`: `bind_tools`, `with_structured_output` (for `RoundResult`
+and its batches), streaming and token usage. Its answers only depend on the prompt and
+its seed, and it waits a configurable latency before answering, like a remote model.
+
+It also simulates the prompt caching of the providers: the prefixes of the prompts it
+has seen, cut at message boundaries, are kept in an LRU cache, and the tokens of the
+longest cached prefix of a prompt are reported as `cache_read` and are not charged the
+time per input token.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from src.agents.history import count_tokens
+from src.prompts.prompts import BATCH_REQUEST_PROMPT, FIGHTER_DESCRIPTION_PROMPT
+from src.utils.utils import message_text
+
+# Names of the fighters, as written in the fight evolution by FIGHTER_DESCRIPTION_PROMPT
+FIGHTER_NAME = re.compile(
+    re.escape(FIGHTER_DESCRIPTION_PROMPT.split("{number}")[0]) + r"\d+, (.+?): "
+)
+
+# Header of each request of a batch, see src/utils/llm_batching.py
+BATCH_REQUEST = re.compile(
+    re.escape(BATCH_REQUEST_PROMPT.split("{number}")[0]) + r"\d+:\n"
+)
+
+NARRATION_SENTENCES = (
+    "{a} lanza un golpe directo, pero {b} lo esquiva en el último momento.",
+    "{b} responde con una patada giratoria que hace tambalearse a {a}.",
+    "El público contiene la respiración mientras {a} recupera el equilibrio.",
+    "{a} y {b} se miran fijamente, midiendo cada movimiento.",
+    "Un tropiezo inesperado de {b} le da a {a} una oportunidad de oro.",
+    "{b} bloquea el ataque con los antebrazos y contraataca sin dudar.",
+    "La niebla se espesa y ninguno de los dos luchadores quiere ceder.",
+    "{a} finge un ataque por la izquierda y golpea por la derecha.",
+)
+
+
+class FakeFightModel(BaseChatModel):
+    """Offline chat model answering the prompts of the fight deterministically.
+
+    - With a tool choice (e.g. `with_structured_output`), it calls the tool, with the
+      arguments of `RoundResult` and batches of `RoundResult` filled from the prompt.
+    - With tools and no tool choice, it calls every tool once, then answers.
+    - Otherwise, it answers with a narration of the fighters of the prompt.
+    """
+
+    latency: float = 0.0
+    """Seconds before the first token of each answer."""
+    token_latency: float = 0.0
+    """Seconds between the streamed tokens."""
+    seed: int = 0
+    """Seed of the answers: the same prompt and seed always give the same answer."""
+    sentences: int = 3
+    """Number of sentences of each narration."""
+    input_token_latency: float = 0.0
+    """Seconds per prompt token that is not read from the prompt cache."""
+    prompt_cache_size: int = 4096
+    """Number of prompt prefixes kept in the prompt cache, 0 to disable it."""
+
+    _prompt_cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _prompt_cache_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-fight"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"seed": self.seed, "sentences": self.sentences}
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        """Bind the tools, as `ChatOpenAI.bind_tools` does."""
+        return self.bind(
+            tools=[convert_to_openai_tool(tool) for tool in tools],
+            tool_choice=tool_choice,
+            **kwargs,
+        )
+
+    # Pickling
+    ###########
+    # The prompt cache and its lock belong to a process: a copy sent to a process worker
+    # starts with an empty cache, like a new connection to the provider
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()
+        state["__pydantic_private__"] = {
+            name: value
+            for name, value in (state["__pydantic_private__"] or {}).items()
+            if name not in ("_prompt_cache", "_prompt_cache_lock")
+        }
+        return state
+
+    def __setstate__(self, state: dict):
+        super().__setstate__(state)
+        self._prompt_cache = OrderedDict()
+        self._prompt_cache_lock = threading.Lock()
+
+    # Generation
+    #############
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self.answer(messages, **kwargs)
+        time.sleep(self._duration(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self.answer(messages, **kwargs)
+        await asyncio.sleep(self._duration(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        message = self.answer(messages, **kwargs)
+        time.sleep(self._first_token(message))
+        for chunk in self._chunks(message):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            time.sleep(self.token_latency)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        message = self.answer(messages, **kwargs)
+        await asyncio.sleep(self._first_token(message))
+        for chunk in self._chunks(message):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(self.token_latency)
+
+    def _first_token(self, message: AIMessage) -> float:
+        """Seconds before the first token: the latency, and reading the uncached prompt."""
+        usage = message.usage_metadata
+        uncached = usage["input_tokens"] - usage["input_token_details"]["cache_read"]
+        return self.latency + self.input_token_latency * uncached
+
+    def _duration(self, message: AIMessage) -> float:
+        """Seconds to generate a whole answer: the first token, then one token per word."""
+        words = len(message.content.split()) + sum(
+            len(_json(call["args"]).split()) for call in message.tool_calls
+        )
+        return self._first_token(message) + self.token_latency * words
+
+    @staticmethod
+    def _chunks(message: AIMessage) -> Iterator[ChatGenerationChunk]:
+        """Split an answer into word chunks, with the tool calls and usage in the last one."""
+        words = message.content.split(" ") if message.content else []
+        for word in words[:-1]:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=words[-1] if words else "",
+                tool_call_chunks=[
+                    {
+                        "name": call["name"],
+                        "args": _json(call["args"]),
+                        "id": call["id"],
+                        "index": index,
+                    }
+                    for index, call in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata,
+            )
+        )
+
+    # Answers
+    ##########
+    def answer(
+        self,
+        messages: list[BaseMessage],
+        tools: list = None,
+        tool_choice=None,
+        **kwargs,
+    ) -> AIMessage:
+        """Answer a prompt, deterministically.
+
+        Args:
+            messages (list[BaseMessage]): The prompt.
+            tools (list, optional): The bound tools, in the OpenAI format. Defaults to None.
+            tool_choice (optional): The bound tool choice. Defaults to None.
+
+        Returns:
+            AIMessage: The answer, with its token usage.
+        """
+        texts = [message_text(message) for message in messages]
+        prompt = "\n".join(texts)
+        rng = random.Random(f"{self.seed}:{prompt}")
+        names = list(dict.fromkeys(FIGHTER_NAME.findall(prompt))) or [
+            "Luchador 1",
+            "Luchador 2",
+        ]
+
+        content, tool_calls = "", []
+        if tools and tool_choice not in (None, "auto", "none"):
+            # Forced tool call: the named tool, or the first one
+            name = tool_choice if isinstance(tool_choice, str) else None
+            tool = next(
+                (tool for tool in tools if tool["function"]["name"] == name), tools[0]
+            )
+            tool_calls = [self.tool_call(tool, rng, names, prompt)]
+        elif (
+            tools
+            and tool_choice in (None, "auto")
+            and not isinstance(messages[-1], ToolMessage)
+        ):
+            # Agent loop: every tool once, then the answer
+            tool_calls = [self.tool_call(tool, rng, names, prompt) for tool in tools]
+        else:
+            content = self.narration(rng, names)
+
+        output = content + "".join(_json(call["args"]) for call in tool_calls)
+        input_tokens, output_tokens = count_tokens(prompt), count_tokens(output)
+        return AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_token_details": {
+                    "cache_read": self.cached_tokens(messages, texts)
+                },
+            },
+        )
+
+    def cached_tokens(self, messages: list[BaseMessage], texts: list[str]) -> int:
+        """Read a prompt from the prompt cache, then add its prefixes to it.
+
+        Args:
+            messages (list[BaseMessage]): The prompt.
+            texts (list[str]): The text of each message of the prompt.
+
+        Returns:
+            int: The tokens of the longest prefix of the prompt that was already cached.
+        """
+        if not self.prompt_cache_size:
+            return 0
+
+        # Key and tokens of each prefix, ending at each message
+        digest, keys, tokens, total = hashlib.sha256(), [], [], 0
+        for message, text in zip(messages, texts):
+            digest.update(f"{message.type}\0{text}\0".encode("utf-8"))
+            keys.append(digest.hexdigest())
+            total += count_tokens(text)
+            tokens.append(total)
+
+        cached = 0
+        with self._prompt_cache_lock:
+            for key, prefix_tokens in zip(keys, tokens):
+                if key in self._prompt_cache:
+                    self._prompt_cache.move_to_end(key)
+                    cached = prefix_tokens
+                else:
+                    self._prompt_cache[key] = True
+            while len(self._prompt_cache) > self.prompt_cache_size:
+                self._prompt_cache.popitem(last=False)
+        # The prompt tokens count the separators between the messages too
+        return min(cached, count_tokens("\n".join(texts)))
+
+    def narration(self, rng: random.Random, names: list[str]) -> str:
+        """A narration of a round between the first two fighters of the prompt."""
+        a, b = rng.sample(names, 2) if len(names) > 1 else (names[0], names[0])
+        return " ".join(
+            sentence.format(a=a, b=b)
+            for sentence in rng.sample(NARRATION_SENTENCES, self.sentences)
+        )
+
+    def tool_call(
+        self, tool: dict, rng: random.Random, names: list[str], prompt: str
+    ) -> dict:
+        """A call of a tool, with arguments that follow its JSON schema."""
+        function = tool["function"]
+        name = function["name"]
+        if name == "RoundResult":
+            args = {"round_development": self.narration(rng, names)}
+        elif name == "RoundResultBatch":
+            # One narration per request of the batch, with the fighters of its fight
+            args = {
+                "results": [
+                    {
+                        "round_development": self.narration(
+                            rng, FIGHTER_NAME.findall(request) or names
+                        )
+                    }
+                    for request in BATCH_REQUEST.split(prompt)[1:]
+                ]
+            }
+        else:
+            properties = function.get("parameters", {}).get("properties", {})
+            args = {key: _fake_value(schema, rng) for key, schema in properties.items()}
+
+        return {
+            "name": name,
+            "args": args,
+            "id": f"call_{rng.getrandbits(48):012x}",
+            "type": "tool_call",
+        }
+
+
+def _fake_value(schema: dict, rng: random.Random):
+    # A value of a JSON schema: the first option of enums, small numbers otherwise
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "integer":
+        return rng.randint(1, 2)
+    if kind == "number":
+        return round(rng.uniform(0, 1), 2)
+    if kind == "boolean":
+        return False
+    if kind == "array":
+        return []
+    if kind == "object":
+        return {}
+    return "ok"
+
+
+def _json(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
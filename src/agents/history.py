@@ -0,0 +1,173 @@
+"""Module with the management of the fight history sent to the LLM in each prompt.
+
+`fight_evolution` keeps the whole fight, but the prompts only get the initial scenario, a
+rolling summary of the oldest rounds and the latest rounds verbatim. The token budget
+bounds each whole prompt: the history gets the tokens that the rest of the prompt leaves.
+"""
+
+import re
+from typing import NamedTuple
+
+from src.prompts.prompts import HISTORY_SUMMARY_PROMPT, ROUND_START_PROMPT
+
+# Rough number of characters per token, good enough to enforce a budget
+CHARS_PER_TOKEN = 4
+
+ROUND_START = ROUND_START_PROMPT.split("{")[0]
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def split_rounds(fight_evolution: list) -> tuple[str, list[list[str]]]:
+    """Split the fight evolution into the initial scenario and the entries of each round.
+
+    Args:
+        fight_evolution (list): The fight evolution, as stored in the state.
+
+    Returns:
+        tuple[str, list[list[str]]]: The initial scenario and the entries of each round.
+    """
+    if not fight_evolution:
+        return "", []
+
+    preamble, rounds = str(fight_evolution[0]), []
+    for entry in fight_evolution[1:]:
+        entry = str(entry)
+        if entry.startswith(ROUND_START) or not rounds:
+            rounds.append([])
+        rounds[-1].append(entry)
+
+    return preamble, rounds
+
+
+class HistoryContext(NamedTuple):
+    """Fight history rendered for a prompt."""
+
+    text: str
+    tokens: int
+    full_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.full_tokens - self.tokens
+
+
+class FightHistory:
+    """Keep the prompts' fight history bounded: latest rounds verbatim, older ones summarized."""
+
+    def __init__(
+        self, keep_rounds: int = 2, token_budget: int = 1500, summary_chars: int = 240
+    ):
+        """Initialize the history manager.
+
+        Args:
+            keep_rounds (int, optional): Number of latest rounds kept verbatim. Defaults to 2.
+            token_budget (int, optional): Maximum tokens of each whole prompt, the history being trimmed to fit. Defaults to 1500.
+            summary_chars (int, optional): Maximum characters of the summary of a round. Defaults to 240.
+        """
+        self.keep_rounds = keep_rounds
+        self.token_budget = token_budget
+        self.summary_chars = summary_chars
+
+    def summarize_round(self, number: int, entries: list[str]) -> str:
+        """Summarize a round with the first sentence of its narration.
+
+        Args:
+            number (int): The number of the round.
+            entries (list[str]): The entries of the round in the fight evolution.
+
+        Returns:
+            str: A one-line summary of the round.
+        """
+        narration = " ".join(
+            entry for entry in entries if not entry.startswith(ROUND_START)
+        )
+        first_sentence = SENTENCE_END.split(narration.strip(), maxsplit=1)[0]
+        return f"Ronda {number}: {first_sentence[: self.summary_chars]}"
+
+    def fold(
+        self, fight_evolution: list, summary: str, summarized_rounds: int
+    ) -> tuple[str, int]:
+        """Fold into the summary the rounds that no longer fit in the verbatim window.
+
+        Only the rounds that were not summarized yet are processed, so the summary is
+        updated incrementally.
+
+        Args:
+            fight_evolution (list): The whole fight evolution.
+            summary (str): The current summary.
+            summarized_rounds (int): Number of rounds already in the summary.
+
+        Returns:
+            tuple[str, int]: The updated summary and number of summarized rounds.
+        """
+        _, rounds = split_rounds(fight_evolution)
+        lines = [summary] if summary else []
+        for index in range(summarized_rounds, len(rounds) - self.keep_rounds):
+            lines.append(self.summarize_round(index + 1, rounds[index]))
+
+        return "\n".join(lines), max(summarized_rounds, len(rounds) - self.keep_rounds)
+
+    def render(
+        self,
+        fight_evolution: list,
+        summary: str,
+        summarized_rounds: int,
+        preamble: bool = True,
+        reserved_tokens: int = 0,
+    ) -> HistoryContext:
+        """Render the fight history for a prompt, within the token budget.
+
+        The history gets the budget minus the tokens of the rest of the prompt. The
+        initial scenario is always kept. If the budget is exceeded, the oldest lines of
+        the summary are dropped first, then the oldest verbatim rounds.
+
+        Args:
+            fight_evolution (list): The whole fight evolution.
+            summary (str): The summary of the oldest rounds.
+            summarized_rounds (int): Number of rounds in the summary.
+            preamble (bool, optional): Whether to start with the initial scenario, False when it is already in the prompt prefix. Defaults to True.
+            reserved_tokens (int, optional): Tokens of the rest of the prompt. Defaults to 0.
+
+        Returns:
+            HistoryContext: The rendered history and its size compared to the whole history.
+        """
+        scenario, rounds = split_rounds(fight_evolution)
+        summary_lines = summary.splitlines() if summary else []
+        recent = ["\n".join(entries) for entries in rounds[summarized_rounds:]]
+
+        def build():
+            parts = [scenario] if preamble else []
+            if summary_lines:
+                parts.append(
+                    HISTORY_SUMMARY_PROMPT.format(summary="\n".join(summary_lines))
+                )
+            return "\n\n".join(parts + recent)
+
+        budget = self.token_budget - reserved_tokens
+        text = build()
+        while count_tokens(text) > budget and (summary_lines or recent):
+            if summary_lines:
+                summary_lines.pop(0)
+            else:
+                recent.pop(0)
+            text = build()
+
+        return HistoryContext(
+            text=text,
+            tokens=count_tokens(text),
+            full_tokens=count_tokens(
+                str(fight_evolution if preamble else fight_evolution[1:])
+            ),
+        )
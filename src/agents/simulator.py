@@ -0,0 +1,207 @@
+"""Module with a vectorized Monte Carlo simulator of every matchup of the fighters table.
+
+The simulator applies the same rules as the combat engine (src/agents/combat.py), but
+to every pair of fighters and every trial at once, as NumPy arrays. Like
+`CombatEngine.simulate_fight`, it applies a special hit and a modifier to every attack,
+as if the orchestrator always called the modifiers tool (`--no-modifiers` to leave them
+out). The winner of a simulated fight is the fighter with more health left at the end
+of it. Run it from the root directory:
+
+    python -m src.agents.simulator --trials 100000
+"""
+
+import argparse
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.agents.combat import (
+    ARMOR_SCALE,
+    BASE_HIT_CHANCE,
+    DAMAGE_PER_STRENGTH,
+    HIT_CHANCE_PER_AGILITY,
+    HIT_CHANCE_PER_TIREDNESS,
+    HIT_MULTIPLIERS,
+    HIT_WEIGHTS,
+    MAX_HIT_CHANCE,
+    MAX_ROUNDS,
+    MIN_HIT_CHANCE,
+    MODIFIER_WEIGHTS,
+    MODIFIERS,
+)
+from src.utils.databases import list_fighters
+
+
+@dataclass
+class MatchupResult:
+    """Outcome of the simulation of every matchup."""
+
+    names: list[str]
+    win_probability: np.ndarray  # [i, j]: probability that fighter i beats fighter j
+    draw_probability: np.ndarray  # [i, j]: probability that fighter i and j draw
+    trials: int
+    elapsed: float
+
+    @property
+    def fights(self) -> int:
+        n = len(self.names)
+        return n * (n - 1) // 2 * self.trials
+
+    @property
+    def fights_per_second(self) -> float:
+        return self.fights / self.elapsed if self.elapsed else float("inf")
+
+
+def simulate_matchups(
+    fighters: list[dict],
+    trials: int = 10_000,
+    max_rounds: int = MAX_ROUNDS,
+    seed: int = 0,
+    batch_size: int = 1_000_000,
+    modifiers: bool = True,
+) -> MatchupResult:
+    """Simulate `trials` fights of every pair of fighters.
+
+    Args:
+        fighters (list[dict]): The fighters, as returned by `list_fighters`.
+        trials (int, optional): Number of fights of each pair. Defaults to 10_000.
+        max_rounds (int, optional): Maximum number of rounds of a fight. Defaults to MAX_ROUNDS.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+        batch_size (int, optional): Maximum number of fights simulated at once, to bound memory. Defaults to 1_000_000.
+        modifiers (bool, optional): Whether to draw a modifier for every attack, on top of its special hit. Defaults to True.
+
+    Returns:
+        MatchupResult: The win and draw probabilities of every matchup.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+
+    stats = {
+        key: np.array([fighter[key] for fighter in fighters], dtype=np.float64)
+        for key in ("health", "strength", "agility", "armor", "tiredness")
+    }
+    first, second = np.triu_indices(len(fighters), k=1)
+
+    def pair_constants(attacker, target):
+        chance = np.clip(
+            BASE_HIT_CHANCE
+            + HIT_CHANCE_PER_AGILITY
+            * (stats["agility"][attacker] - stats["agility"][target])
+            - HIT_CHANCE_PER_TIREDNESS
+            * (stats["tiredness"][attacker] - stats["tiredness"][target]),
+            MIN_HIT_CHANCE,
+            MAX_HIT_CHANCE,
+        )
+        damage = (
+            stats["strength"][attacker]
+            * DAMAGE_PER_STRENGTH
+            * ARMOR_SCALE
+            / (ARMOR_SCALE + stats["armor"][target])
+        )
+        return chance[:, None], damage[:, None]
+
+    chance_first, damage_first = pair_constants(first, second)
+    chance_second, damage_second = pair_constants(second, first)
+    multipliers = np.array(HIT_MULTIPLIERS, dtype=np.float64)
+    cumulative_weights = np.cumsum(HIT_WEIGHTS) / np.sum(HIT_WEIGHTS)
+    modifier_multipliers = np.array([value for _, value in MODIFIERS], dtype=np.float64)
+    modifier_cumulative_weights = np.cumsum(MODIFIER_WEIGHTS) / np.sum(MODIFIER_WEIGHTS)
+
+    def draw(values, cumulative, shape):
+        # Clip the draws that float rounding puts past the last cumulative weight
+        index = np.searchsorted(cumulative, rng.random(shape), side="right")
+        return values[np.minimum(index, len(values) - 1)]
+
+    def attack(chance, damage, shape):
+        multiplier = draw(multipliers, cumulative_weights, shape)
+        if modifiers:
+            multiplier = multiplier * draw(
+                modifier_multipliers, modifier_cumulative_weights, shape
+            )
+        hit = rng.random(shape) < chance
+        return np.where(hit, np.round(damage * multiplier, 1), 0.0)
+
+    wins_first = np.zeros(len(first))
+    wins_second = np.zeros(len(first))
+    draws = np.zeros(len(first))
+    chunk = max(1, batch_size // max(len(first), 1))
+    for done in range(0, trials, chunk):
+        shape = (len(first), min(chunk, trials - done))
+        health_first = np.broadcast_to(stats["health"][first][:, None], shape).copy()
+        health_second = np.broadcast_to(stats["health"][second][:, None], shape).copy()
+        ongoing = np.ones(shape, dtype=bool)
+
+        for _ in range(max_rounds):
+            damage_to_second = attack(chance_first, damage_first, shape)
+            damage_to_first = attack(chance_second, damage_second, shape)
+            health_first = np.where(
+                ongoing,
+                np.maximum(np.round(health_first - damage_to_first, 1), 0.0),
+                health_first,
+            )
+            health_second = np.where(
+                ongoing,
+                np.maximum(np.round(health_second - damage_to_second, 1), 0.0),
+                health_second,
+            )
+            # A fight stops as soon as any fighter has no health left
+            ongoing &= (health_first > 0) & (health_second > 0)
+            if not ongoing.any():
+                break
+
+        wins_first += (health_first > health_second).sum(axis=1)
+        wins_second += (health_second > health_first).sum(axis=1)
+        draws += (health_first == health_second).sum(axis=1)
+
+    n = len(fighters)
+    win_probability = np.full((n, n), np.nan)
+    draw_probability = np.full((n, n), np.nan)
+    win_probability[first, second] = wins_first / trials
+    win_probability[second, first] = wins_second / trials
+    draw_probability[first, second] = draw_probability[second, first] = draws / trials
+
+    return MatchupResult(
+        names=[fighter["name"] for fighter in fighters],
+        win_probability=win_probability,
+        draw_probability=draw_probability,
+        trials=trials,
+        elapsed=time.perf_counter() - start,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trials", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-modifiers",
+        action="store_true",
+        help="apply the special hits only, as if the orchestrator never called the "
+        "modifiers tool",
+    )
+    args = parser.parse_args()
+
+    # Load every fighter once
+    fighters = list_fighters()
+    if len(fighters) < 2:
+        raise SystemExit("At least two fighters are needed to simulate matchups")
+
+    result = simulate_matchups(
+        fighters, trials=args.trials, seed=args.seed, modifiers=not args.no_modifiers
+    )
+
+    width = max(len(name) for name in result.names)
+    print("Win probability (row beats column):")
+    print(" " * width, *(f"{name[:8]:>8}" for name in result.names))
+    for name, row in zip(result.names, result.win_probability):
+        cells = ("       -" if np.isnan(p) else f"{p:8.3f}" for p in row)
+        print(f"{name:>{width}}", *cells)
+    print(
+        f"\n{result.fights:,} fights in {result.elapsed:.2f}s "
+        f"({result.fights_per_second:,.0f} fights/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,102 @@
 import operator
+from dataclasses import dataclass
 from typing import Annotated
 
 from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, SystemMessage
 from typing_extensions import TypedDict
 
 
+@dataclass(slots=True)
+class FighterStats:
+    """Stats of a fighter, fixed for the whole fight (health is tracked apart)."""
+
+    name: str
+    description: str
+    strength: int
+    agility: int
+    intelligence: int
+    armor: int
+    tiredness: int = 0
+
+
+@dataclass(slots=True)
+class FighterAnalysis:
+    """Outcome of the analysis branch of a fighter in a round."""
+
+    move: str  # validated move
+    hit_multiplier: float
+    modifiers: str  # what the branch adds to the round, for the narrator
+
+
+@dataclass(slots=True)
+class RoundDraws:
+    """Random draws of a round, one per fighter, for the tools of the fight."""
+
+    special_hits: list[float]  # hit multipliers of the special_hits tool
+    modifiers: list[int]  # indices of the modifiers of the modifiers tool
+
+
+@dataclass(slots=True)
+class FightDraws:
+    """Random draws of a whole fight, generated as a block when it starts.
+
+    They only depend on the seed of the fight, so a fight resumed from its checkpoint,
+    or replayed with the same seed and thread_id, draws the same numbers.
+    """
+
+    seed: str  # seed of the fight, also of the random generators of its rounds
+    rounds: list[RoundDraws]
+
+    def round(self, round_number: int) -> RoundDraws | None:
+        """Draws of a round, None if the fight has no draws for it."""
+        if 1 <= round_number <= len(self.rounds):
+            return self.rounds[round_number - 1]
+        return None
+
+
+def merge_analyses(
+    left: dict[int, FighterAnalysis], right: dict[int, FighterAnalysis]
+) -> dict[int, FighterAnalysis]:
+    """Join the analyses of the fighter branches, by fighter index."""
+    return {**(left or {}), **(right or {})}
+
+
+class FighterBranch(TypedDict):
+    """Input of the analysis branch of a fighter, sent by `AgenticFight.dispatch_fighters`."""
+
+    index: int
+    fighter: FighterStats
+    move: str
+    round: int
+    draws: RoundDraws | None
+
+
 class FightState(TypedDict):
     messages: Annotated[list[AnyMessage], operator.add]
     fight_evolution: Annotated[list[str], operator.add]
 
     round: int = 0
     modifiers: str
+    hit_multipliers: list[float]  # per fighter, see src/agents/combat.py
+    # Written in parallel by the fighter branches of each round
+    analyses: Annotated[dict[int, FighterAnalysis], merge_analyses]
+
+    # Random draws of the fight, see `CombatEngine.draw_fight`
+    draws: FightDraws
+
+    # Scenario and fighters, rendered once per fight: the cacheable prefix of the prompts
+    prompt_prefix: str
+
+    # Rolling summary of the oldest rounds, see src/agents/history.py
+    history_summary: str
+    summarized_rounds: int
 
     winner: str
     loser: str
 
-    # Fighter 1
-    fighter1_name: str
-    fighter1_description: str
-    fighter1_health: float
-    fighter1_strength: int
-    fighter1_agility: int
-    fighter1_intelligence: int
-    fighter1_armor: int
-    fighter1_tiredness: int = 0
-    fighter1_move: str
-
-    # Fighter 2
-    fighter2_name: str
-    fighter2_description: str
-    fighter2_health: float
-    fighter2_strength: int
-    fighter2_agility: int
-    fighter2_intelligence: int
-    fighter2_armor: int
-    fighter2_tiredness: int = 0
-    fighter2_move: str
+    # Fighters, in the same order in every list. Only `health` and `moves` change
+    # during the fight, so each round only checkpoints those two small lists.
+    fighter_names: list[str]  # optional input, to choose the fighters
+    fighters: list[FighterStats]
+    health: list[float]
+    moves: list[str]
@@ -0,0 +1,129 @@
+"""Benchmark of the batched narrations: throughput, narrator latency and model requests.
+
+The fights use the offline fake model, whose answers take a fixed round-trip latency
+plus a time per generated word, so a combined request of N narrations is slower than a
+single one but faster than N in a row. Each configuration runs the same tournament, with
+the narrations streamed one by one, or batched with several sizes and windows. Run it
+from the root directory:
+
+    python -m src.benchmarks.batching --fights 64 --concurrency 64 --latency 0.3
+"""
+
+import argparse
+import asyncio
+import logging
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.agents.agent import AgenticFight, RoundResult
+from src.agents.agentic_tools import special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+from src.tournament import run_tournament
+from src.utils.llm_batching import StructuredOutputBatcher
+from src.utils.logger import logger
+from src.utils.metrics import FightMetrics, Histogram
+
+
+def time_tournament(
+    model: FakeFightModel, fights: int, concurrency: int, batcher=None
+) -> dict:
+    """Run a tournament of `fights` fights.
+
+    Returns:
+        dict: The throughput, the narrator latency and the batches of the tournament.
+    """
+    metrics = FightMetrics()
+    abot = AgenticFight(
+        model,
+        [special_hits],
+        checkpointer=MemorySaver(),
+        metrics=metrics,
+        batcher=batcher,
+    )
+
+    loop_time = asyncio.run(_timed(abot, fights, concurrency))
+    narrator = next(
+        Histogram.from_dict(entry)
+        for entry in metrics.to_json()["histograms"]
+        if entry["name"] == "fight_node_seconds"
+        and entry["labels"].get("node") == "narrator"
+    )
+    stats = batcher.stats() if batcher is not None else {}
+    return {
+        "fights_per_second": fights / loop_time,
+        "narrator_mean_ms": narrator.sum / narrator.count * 1e3,
+        "narrator_max_ms": narrator.max * 1e3,
+        "narrations": narrator.count,
+        "model_requests": stats.get("model_requests", narrator.count),
+        "mean_batch_size": stats.get("mean_batch_size", 1.0),
+        "mean_wait_ms": stats.get("mean_wait_ms", 0.0),
+    }
+
+
+async def _timed(abot: AgenticFight, fights: int, concurrency: int) -> float:
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    states = await run_tournament(abot, [FIGHTERS] * fights, MOVES, concurrency)
+    assert all(state is not None for state in states)
+    return loop.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fights", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--windows", type=float, nargs="+", default=[0.02, 0.1])
+    args = parser.parse_args()
+
+    # Silence the per-node logs of the fights
+    logger.setLevel(logging.WARNING)
+
+    model = FakeFightModel(latency=args.latency, token_latency=args.token_latency)
+    configs = [("streamed", None)]
+    for window in args.windows:
+        for size in args.batch_sizes:
+            configs.append(
+                (
+                    f"batch {size}, {window * 1e3:.0f}ms",
+                    dict(max_batch=size, window=window),
+                )
+            )
+    configs.append(
+        (
+            f"abatch {max(args.batch_sizes)}, {max(args.windows) * 1e3:.0f}ms",
+            dict(
+                max_batch=max(args.batch_sizes),
+                window=max(args.windows),
+                combine=False,
+            ),
+        )
+    )
+
+    print(
+        f"{args.fights} fights, {args.concurrency} at once, model latency "
+        f"{args.latency}s + {args.token_latency * 1e3:.0f}ms per word\n"
+    )
+    print(
+        f"{'':>18} {'fights/s':>9} {'narrator':>9} {'max':>9} {'requests':>9} "
+        f"{'batch':>6} {'wait':>8}"
+    )
+    with temporary_database():
+        for name, config in configs:
+            batcher = None
+            if config is not None:
+                batcher = StructuredOutputBatcher(model, RoundResult, **config)
+            result = time_tournament(model, args.fights, args.concurrency, batcher)
+            print(
+                f"{name:>18} {result['fights_per_second']:>9.1f} "
+                f"{result['narrator_mean_ms']:>7.0f}ms {result['narrator_max_ms']:>7.0f}ms "
+                f"{result['model_requests']:>9} {result['mean_batch_size']:>6.1f} "
+                f"{result['mean_wait_ms']:>6.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark of the size of the checkpoints written during a fight.
+
+Run it from the root directory:
+
+    python -m src.benchmarks.checkpoint_size --rounds 3
+"""
+
+import argparse
+import asyncio
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.benchmarks.common import MOVES, FIGHTERS, temporary_database
+from src.tournament import run_fight
+
+
+def checkpoint_bytes(checkpointer: MemorySaver, thread_id: str) -> tuple[int, int]:
+    """Measure the serialized checkpoints and pending writes of a thread.
+
+    Returns:
+        tuple[int, int]: The number of checkpoints and their total size in bytes.
+    """
+    checkpoints = checkpointer.storage[thread_id][""].values()
+    size = sum(
+        len(checkpoint[1]) + len(metadata[1]) for checkpoint, metadata, _ in checkpoints
+    )
+    size += sum(
+        len(value[1])
+        for (thread, _, _), writes in checkpointer.writes.items()
+        if thread == thread_id
+        for _, _, value, _ in writes.values()
+    )
+    return len(checkpoints), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    AgenticFight.MAX_ROUNDS = args.rounds
+    checkpointer = MemorySaver()
+    with temporary_database():
+        abot = AgenticFight(FakeFightModel(), [special_hits], checkpointer=checkpointer)
+        asyncio.run(run_fight(abot, "checkpoint-size", FIGHTERS, MOVES))
+
+    count, size = checkpoint_bytes(checkpointer, "checkpoint-size")
+    print(f"{count} checkpoints, {size:,} bytes")
+    print(f"{size / args.rounds:,.0f} bytes per round")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Benchmark of the combat engine, which computes the damage of each round without any LLM.
+
+Run it from the root directory:
+
+    python -m src.benchmarks.combat --fights 100000
+"""
+
+import argparse
+import time
+
+from src.agents.combat import CombatEngine
+from src.agents.state import FighterStats
+
+FIGHTERS = [
+    FighterStats("Carlos", "", strength=3, agility=5, intelligence=6, armor=3),
+    FighterStats("Alejandro", "", strength=4, agility=3, intelligence=6, armor=4),
+]
+HEALTH = [50.0, 60.0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fights", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = CombatEngine(seed=args.seed)
+    rounds = 0
+    start = time.perf_counter()
+    for i in range(args.fights):
+        _, fight_rounds = engine.simulate_fight(FIGHTERS, HEALTH, fight_id=str(i))
+        rounds += fight_rounds
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.fights:,} fights, {rounds:,} rounds in {elapsed:.2f}s")
+    print(
+        f"{elapsed / rounds * 1e6:.1f} µs/round, {args.fights / elapsed:,.0f} fights/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
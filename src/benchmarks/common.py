@@ -0,0 +1,42 @@
+"""Shared helpers of the benchmarks: the fighters and moves of the fights, and a throwaway database.
+
+The fights of the benchmarks run on the offline fake model, see src/agents/fake_llm.py.
+"""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from src.utils.databases import (
+    FightersRepository,
+    add_fighter,
+    create_tables,
+    get_repository,
+    set_repository,
+)
+
+FIGHTERS = ("Carlos", "Alejandro")
+MOVES = [["Un puñetazo directo", "Una patada giratoria"], ["Un cabezazo", "Esquivar"]]
+
+
+# Narration of the benchmarks that write rounds without running the graph
+NARRATION = "Los dos luchadores intercambian golpes."
+
+
+@contextmanager
+def temporary_database():
+    """Point the default repository to a temporary database with the default fighters."""
+    previous = get_repository()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repository = FightersRepository(os.path.join(tmp_dir, "benchmark.db"))
+        set_repository(repository)
+        try:
+            create_tables()
+            with open("./src/prompts/fighters.json", "r", encoding="utf-8") as f:
+                for fighter in json.load(f).values():
+                    add_fighter(fighter)
+            yield repository
+        finally:
+            repository.close()
+            set_repository(previous)
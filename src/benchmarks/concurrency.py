@@ -0,0 +1,87 @@
+"""Benchmark of the throughput of concurrent fights on a single event loop.
+
+The fights use the offline fake model, which answers after a fixed latency like a remote
+LLM would, and a SQLite checkpointer, so the measured time includes the graph, the
+database and the checkpoints. Throughput grows with the concurrency until the event
+loop or the database is saturated. Run it from the root directory:
+
+    python -m src.benchmarks.concurrency --latency 0.2 --max-concurrency 256
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+from src.tournament import run_tournament
+from src.utils.checkpointer import SQLiteSaver
+from src.utils.logger import logger
+
+
+def time_concurrent_fights(
+    latency: float, concurrency: int, fights: int, checkpoints: str
+) -> float:
+    """Run `fights` fights with at most `concurrency` fights at once.
+
+    Returns:
+        float: The number of finished fights per second.
+    """
+    # Threads of the blocking I/O, one per fight at once
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    checkpointer = SQLiteSaver(checkpoints, executor=executor)
+    abot = AgenticFight(
+        FakeFightModel(latency=latency),
+        [special_hits],
+        checkpointer=checkpointer,
+        executor=executor,
+    )
+
+    start = time.perf_counter()
+    states = asyncio.run(
+        run_tournament(abot, [FIGHTERS] * fights, MOVES, concurrency=concurrency)
+    )
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    checkpointer.db.close()
+
+    return sum(state is not None for state in states) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--max-concurrency", type=int, default=256)
+    parser.add_argument("--fights-per-slot", type=int, default=2)
+    args = parser.parse_args()
+
+    # Silence the per-node logs of the fights
+    logger.setLevel(logging.WARNING)
+
+    print(f"Model latency: {args.latency}s per call")
+    print(f"{'concurrency':>11} {'fights/s':>9} {'speed-up':>9}")
+    baseline = None
+    concurrency = 1
+    with temporary_database(), tempfile.TemporaryDirectory() as tmp_dir:
+        while concurrency <= args.max_concurrency:
+            throughput = time_concurrent_fights(
+                args.latency,
+                concurrency,
+                concurrency * args.fights_per_slot,
+                os.path.join(tmp_dir, f"checkpoints-{concurrency}.db"),
+            )
+            baseline = baseline or throughput
+            print(
+                f"{concurrency:>11} {throughput:>9.1f} {throughput / baseline:>8.1f}x"
+            )
+            concurrency *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Benchmark of the end-of-match database writes, with and without the pooled repository.
+
+Run it from the root directory:
+
+    python -m src.benchmarks.database --fights 500 --threads 4 --batch-size 50
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.databases import FightersRepository, FightResult
+
+FIGHTERS = [
+    {
+        "name": f"Fighter {i}",
+        "description": "Benchmark fighter",
+        "stats": {
+            "health": 50,
+            "strength": 3,
+            "speed": 5,
+            "agility": 4,
+            "intelligence": 5,
+            "armor": 3,
+            "level": 1,
+            "exp": 0,
+            "tiredness": 0,
+        },
+    }
+    for i in range(16)
+]
+
+
+def legacy_end_of_match(path: str, winner: str, loser: str):
+    """End-of-match writes as they were done before the repository: a new connection per query."""
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute(
+        """INSERT INTO leaderboard (fighter, latest_oponent, wins, defeats, draws, score)
+        VALUES (?, ?, 1, 0, 0, 3)
+        ON CONFLICT (fighter) DO UPDATE SET latest_oponent = excluded.latest_oponent, wins = wins + 1""",
+        (winner, loser),
+    )
+    conn.execute(
+        """INSERT INTO leaderboard (fighter, latest_oponent, wins, defeats, draws, score)
+        VALUES (?, ?, 0, 1, 0, -2)
+        ON CONFLICT (fighter) DO UPDATE SET latest_oponent = excluded.latest_oponent, defeats = defeats + 1""",
+        (loser, winner),
+    )
+    conn.commit()
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("UPDATE leaderboard SET score = wins*3 - defeats*2 + draws")
+    conn.commit()
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("UPDATE fighters SET exp = exp + 10 WHERE name = ?", (winner,))
+    conn.commit()
+
+
+def pooled_end_of_match(repository: FightersRepository, winner: str, loser: str):
+    """End-of-match writes through the pooled repository."""
+    repository.update_leaderboard(winner, loser)
+    repository.update_scores()
+    repository.add_exp_to_winner(winner)
+
+
+def batched_end_of_match(repository: FightersRepository, fights: list[tuple[str, str]]):
+    """End-of-match writes of a batch of fights, recorded in a single transaction."""
+    repository.record_fight_results(
+        [FightResult(winner=winner, loser=loser) for winner, loser in fights]
+    )
+
+
+def run(name: str, end_of_match, fights: int, threads: int) -> float:
+    """Run `fights` end-of-match writes in `threads` threads and report the throughput.
+
+    Returns:
+        float: The number of fights written per second.
+    """
+    pairs = [
+        (FIGHTERS[i % len(FIGHTERS)]["name"], FIGHTERS[(i + 1) % len(FIGHTERS)]["name"])
+        for i in range(fights)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda pair: end_of_match(*pair), pairs))
+    elapsed = time.perf_counter() - start
+
+    fights_per_second = fights / elapsed
+    print(
+        f"{name:>8}: {fights} fights in {elapsed:.3f}s -> {fights_per_second:,.0f} fights/s"
+    )
+    return fights_per_second
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fights", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "benchmark.db")
+        repository = FightersRepository(path, pool_size=args.threads)
+        repository.create_tables()
+        for fighter in FIGHTERS:
+            repository.add_fighter(fighter)
+
+        legacy = run(
+            "legacy",
+            lambda winner, loser: legacy_end_of_match(path, winner, loser),
+            args.fights,
+            args.threads,
+        )
+        pooled = run(
+            "pooled",
+            lambda winner, loser: pooled_end_of_match(repository, winner, loser),
+            args.fights,
+            args.threads,
+        )
+
+        # Batches of fights, each of them flushed in a single transaction
+        def end_of_batch(winner, loser):
+            pending.append((winner, loser))
+            if len(pending) >= args.batch_size:
+                batch = pending[:]
+                del pending[:]
+                batched_end_of_match(repository, batch)
+
+        pending = []
+        batched = run("batched", end_of_batch, args.fights, 1)
+        if pending:
+            batched_end_of_match(repository, pending)
+        repository.close()
+
+    print(
+        f"speed-up: x{pooled / legacy:.1f} (pooled), x{batched / legacy:.1f} (batched)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark of the fight store: batched ingestion of rounds and streaming export.
+
+Run it from the root directory:
+
+    python -m src.benchmarks.fight_store --rounds 1000000
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from src.agents.state import FighterStats
+from src.benchmarks.common import FIGHTERS, MOVES, NARRATION
+from src.utils.fight_store import FightStore
+
+ROUNDS_PER_FIGHT = 3
+
+
+def ingest(store: FightStore, rounds: int) -> float:
+    """Record `rounds` rounds, in fights of ROUNDS_PER_FIGHT rounds.
+
+    Returns:
+        float: The number of rounds recorded per second.
+    """
+    fighters = [
+        FighterStats(name, "Benchmark fighter", 3, 4, 5, 3) for name in FIGHTERS
+    ]
+    start = time.perf_counter()
+    for index in range(0, rounds, ROUNDS_PER_FIGHT):
+        fight_id = f"fight-{index // ROUNDS_PER_FIGHT}"
+        store.add_fight(fight_id, fighters, [50, 50], "Escenario")
+        for number in range(1, min(ROUNDS_PER_FIGHT, rounds - index) + 1):
+            store.add_round(
+                fight_id,
+                number,
+                MOVES[number % len(MOVES)],
+                "Fighter 1 hit multiplier: 1.5",
+                [1.5, 1.0],
+                [50 - 10 * number, 50 - 5 * number],
+                NARRATION,
+            )
+    store.flush()
+    return rounds / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=1_000_000)
+    parser.add_argument("--flush-every", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = FightStore(os.path.join(tmp_dir, "benchmark.db"), args.flush_every)
+        print(f"ingestion: {ingest(store, args.rounds):,.0f} rounds/s")
+
+        for format in ("jsonl", "csv"):
+            output = os.path.join(tmp_dir, f"rounds.{format}")
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = time.perf_counter()
+            with open(output, "w", encoding="utf-8", newline="") as f:
+                count = store.export(f, format)
+            elapsed = time.perf_counter() - start
+            growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - max_rss
+            print(
+                f"{format:>9}: {count:,} rounds in {elapsed:.1f}s "
+                f"({os.path.getsize(output) / 2**20:,.0f} MiB), "
+                f"max RSS growth {growth:,} KiB"
+            )
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark of the leaderboard queries with a large number of fighters and fights.
+
+The fights are recorded in batches with `record_fight_results`, then the top-N, rank
+and head-to-head queries are timed with the score index, without it, and on the
+in-memory ranking. Run it from the root directory:
+
+    python -m src.benchmarks.leaderboard --fighters 100000 --fights 2000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from src.utils.databases import FightersRepository, FightResult
+
+
+def record_fights(
+    repository: FightersRepository, names: list[str], fights: int, batch_size: int
+) -> float:
+    """Record `fights` random fights between the fighters, in batches.
+
+    Returns:
+        float: The number of fights recorded per second.
+    """
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for done in range(0, fights, batch_size):
+        batch = []
+        for _ in range(min(batch_size, fights - done)):
+            winner, loser = rng.sample(names, 2)
+            batch.append(FightResult(winner, loser, draw=rng.random() < 0.1))
+        repository.record_fight_results(batch)
+    return fights / (time.perf_counter() - start)
+
+
+def time_query(query, args: list, repeat: int = 200) -> float:
+    """Run a query with each of the arguments, one after the other.
+
+    Returns:
+        float: The mean time of a query, in microseconds.
+    """
+    start = time.perf_counter()
+    for i in range(repeat):
+        query(*args[i % len(args)])
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def time_queries(repository: FightersRepository, names: list[str], fighters: int):
+    """Time every leaderboard query, on the database and in memory."""
+    rng = random.Random(1)
+    sample = [(rng.choice(names),) for _ in range(100)]
+    pairs = [tuple(rng.sample(names, 2)) for _ in range(100)]
+    deep_page = [(10, fighters // 2)]
+
+    rows = {
+        "top 10": (repository.top_fighters, [(10, 0)]),
+        f"page at {fighters // 2:,}": (repository.top_fighters, deep_page),
+        "rank": (repository.fighter_rank, sample),
+        "head-to-head": (repository.head_to_head, pairs),
+    }
+    for name, (query, args) in rows.items():
+        print(f"{name:>16}: {time_query(query, args):10.1f} us")
+
+    start = time.perf_counter()
+    ranking = repository.ranking()
+    print(f"{'ranking load':>16}: {(time.perf_counter() - start) * 1e3:10.1f} ms")
+    rows = {
+        "top 10 (memory)": (ranking.top, [(10, 0)]),
+        "page (memory)": (ranking.top, deep_page),
+        "rank (memory)": (ranking.rank, sample),
+    }
+    for name, (query, args) in rows.items():
+        print(f"{name:>16}: {time_query(query, args, repeat=10_000):10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fighters", type=int, default=100_000)
+    parser.add_argument("--fights", type=int, default=2_000_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    names = [f"Fighter {i}" for i in range(args.fighters)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repository = FightersRepository(os.path.join(tmp_dir, "benchmark.db"))
+        repository.create_tables()
+
+        throughput = record_fights(repository, names, args.fights, args.batch_size)
+        print(f"{args.fights:,} fights recorded: {throughput:,.0f} fights/s")
+
+        print("\nWith the score index:")
+        time_queries(repository, names, args.fighters)
+
+        # The in-memory ranking follows the new results without reading the table
+        start = time.perf_counter()
+        record_fights(repository, names, args.batch_size, args.batch_size)
+        elapsed = time.perf_counter() - start
+        ranking = repository.ranking()
+        assert [s.fighter for s in ranking.top(100)] == [
+            s.fighter for s in repository.top_fighters(100)
+        ]
+        print(f"{'batch + ranking':>16}: {elapsed * 1e3:10.1f} ms")
+
+        with repository.transaction() as conn:
+            conn.execute("DROP INDEX leaderboard_score")
+        print("\nWithout the score index:")
+        repository.invalidate_ranking()
+        time_queries(repository, names, args.fighters)
+        repository.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark of the graph metrics: the per-node report of offline fights and the instrumentation overhead.
+
+The fights use the offline fake model, which reports its token usage like a real model,
+and run with and without `FightMetrics` to measure what the instrumentation costs. Run
+it from the root directory:
+
+    python -m src.benchmarks.metrics --fights 200 --latency 0.01
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+from src.tournament import run_tournament
+from src.utils.logger import logger
+from src.utils.metrics import FightMetrics, report
+
+
+def time_fights(
+    fights: int, latency: float, concurrency: int, metrics: FightMetrics = None
+) -> float:
+    """Run `fights` fights, with or without metrics.
+
+    Returns:
+        float: The mean time of a fight, in milliseconds.
+    """
+    abot = AgenticFight(
+        FakeFightModel(latency=latency),
+        [special_hits],
+        checkpointer=MemorySaver(),
+        metrics=metrics,
+    )
+    start = time.perf_counter()
+    states = asyncio.run(
+        run_tournament(abot, [FIGHTERS] * fights, MOVES, concurrency=concurrency)
+    )
+    assert all(state is not None for state in states)
+    return (time.perf_counter() - start) / fights * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fights", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Silence the per-node logs of the fights
+    logger.setLevel(logging.WARNING)
+
+    with temporary_database():
+        # Warm up the imports, the roster cache and the graph compilation
+        time_fights(2, 0, 1)
+
+        metrics = FightMetrics()
+        time_fights(args.fights, args.latency, args.concurrency, metrics)
+        print(report(metrics.to_json()))
+        fight = next(
+            entry
+            for entry in metrics.to_json()["histograms"]
+            if entry["name"] == "fight_tokens"
+        )
+        print(
+            f"\n{fight['count']} fights, {fight['sum'] / fight['count']:,.0f} tokens each"
+        )
+
+        # Overhead, with no model latency so that it is not hidden by the LLM time
+        print(f"\n{'':>16} {'ms/fight':>9}")
+        without = min(
+            time_fights(args.fights, 0, args.concurrency) for _ in range(args.repeat)
+        )
+        with_metrics = min(
+            time_fights(args.fights, 0, args.concurrency, FightMetrics())
+            for _ in range(args.repeat)
+        )
+        print(f"{'without metrics':>16} {without:>9.2f}")
+        print(f"{'with metrics':>16} {with_metrics:>9.2f}")
+        print(f"{'overhead':>16} {with_metrics / without - 1:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
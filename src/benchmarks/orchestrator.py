@@ -0,0 +1,167 @@
+"""Benchmark of the tool-calling orchestrator: parallel tool calls, loop cap and tool latency.
+
+First, an answer with several calls of a slow tool (a stand-in for a tool behind an
+API) is run by `AgenticFight.arun_tools`, which runs the calls in parallel, and by a
+loop of `acall_tool`, one call after the other. Then whole fights run on the offline
+fake model with several caps of the orchestrator <-> tools loop, reporting the latency
+of the orchestrator node, the latency of each tool and the memoized calls. Run it from
+the root directory:
+
+    python -m src.benchmarks.orchestrator --calls 8 --tool-latency 0.02
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import modifiers, special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+from src.tournament import run_tournament
+from src.utils.logger import logger
+from src.utils.metrics import FightMetrics, Histogram
+
+
+class ScriptedModel(FakeFightModel):
+    """Fake model calling the first tool `calls` times, then answering."""
+
+    calls: int = 1
+    """Number of calls of the first tool, one per fighter number."""
+
+    def answer(self, messages, tools=None, tool_choice=None, **kwargs):
+        # The answer of the fake model, for its token usage
+        message = super().answer(messages, **kwargs)
+        if not tools or (messages and isinstance(messages[-1], ToolMessage)):
+            return message
+        return AIMessage(
+            content="",
+            usage_metadata=message.usage_metadata,
+            tool_calls=[
+                {
+                    "name": tools[0]["function"]["name"],
+                    "args": {"fighter": number},
+                    "id": f"call_{number}",
+                    "type": "tool_call",
+                }
+                for number in range(1, self.calls + 1)
+            ],
+        )
+
+
+def slow_tool_for(latency: float):
+    @tool(name_or_callable="slow_tool")
+    async def slow_tool(fighter: int) -> str:
+        """Tool that answers after a delay, like a remote API.
+
+        Args:
+            fighter (int): number of the fighter, starting at 1.
+        """
+        await asyncio.sleep(latency)
+        return f"Fighter {fighter}: ok"
+
+    return slow_tool
+
+
+async def time_tool_calls(calls: int, latency: float) -> tuple[float, float]:
+    """Run `calls` calls of the slow tool, in parallel and one after the other.
+
+    Returns:
+        tuple[float, float]: The seconds of the parallel and the sequential runs.
+    """
+    abot = AgenticFight(ScriptedModel(calls=calls), [slow_tool_for(latency)])
+    start = time.perf_counter()
+    results = await abot.arun_tools([])
+    parallel = time.perf_counter() - start
+    assert len(results) == calls
+
+    start = time.perf_counter()
+    for tool_call, _ in results:
+        await abot.acall_tool(tool_call)
+    return parallel, time.perf_counter() - start
+
+
+def time_fights(model: FakeFightModel, fights: int, iterations: int) -> dict:
+    """Run a tournament with a cap of the orchestrator loop.
+
+    Returns:
+        dict: The throughput, the orchestrator and tool latencies and the memoized calls.
+    """
+    metrics = FightMetrics()
+    abot = AgenticFight(
+        model,
+        [special_hits, modifiers],
+        checkpointer=MemorySaver(),
+        metrics=metrics,
+        max_tool_iterations=iterations,
+    )
+    start = time.perf_counter()
+    states = asyncio.run(run_tournament(abot, [FIGHTERS] * fights, MOVES, fights))
+    elapsed = time.perf_counter() - start
+    assert all(state is not None for state in states)
+
+    data = metrics.to_json()
+    histograms = {
+        (entry["name"], entry["labels"].get("node") or entry["labels"].get("tool")): (
+            Histogram.from_dict(entry)
+        )
+        for entry in data["histograms"]
+    }
+    orchestrator = histograms["fight_node_seconds", "orchestrator"]
+    tools = {
+        name: histogram.sum / histogram.count * 1e6
+        for (metric, name), histogram in histograms.items()
+        if metric == "fight_tool_call_seconds"
+    }
+    return {
+        "fights_per_second": fights / elapsed,
+        "orchestrator_ms": orchestrator.sum / orchestrator.count * 1e3,
+        "tool_us": tools,
+        "memo_hits": sum(
+            entry["value"]
+            for entry in data["counters"]
+            if entry["name"] == "fight_tool_memo_hits_total"
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=8)
+    parser.add_argument("--tool-latency", type=float, default=0.02)
+    parser.add_argument("--fights", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--iterations", type=int, nargs="+", default=[0, 1, 2])
+    args = parser.parse_args()
+
+    # Silence the per-node logs of the fights
+    logger.setLevel(logging.WARNING)
+
+    parallel, sequential = asyncio.run(time_tool_calls(args.calls, args.tool_latency))
+    print(
+        f"{args.calls} calls of a {args.tool_latency * 1e3:.0f}ms tool: "
+        f"{parallel * 1e3:.0f}ms in parallel, {sequential * 1e3:.0f}ms one by one\n"
+    )
+
+    print(f"{args.fights} fights, model latency {args.latency}s")
+    print(f"{'iterations':>10} {'fights/s':>9} {'orchestrator':>13} {'memo':>5}  tools")
+    model = FakeFightModel(latency=args.latency)
+    with temporary_database():
+        for iterations in args.iterations:
+            result = time_fights(model, args.fights, iterations)
+            tools = ", ".join(
+                f"{name} {latency:.0f}us" for name, latency in result["tool_us"].items()
+            )
+            print(
+                f"{iterations:>10} {result['fights_per_second']:>9.1f} "
+                f"{result['orchestrator_ms']:>11.1f}ms {result['memo_hits']:>5}  {tools}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark of the wall-clock time of a whole fight, with and without pacing.
+
+The fights use the offline fake model, so the measured time is the graph's own
+overhead plus the pacing delays. Run it from the root directory:
+
+    python -m src.benchmarks.pacing --fights 5 --delay 0.5
+"""
+
+import argparse
+import asyncio
+import time
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+from src.tournament import run_fight
+from src.utils.pacing import DelayPacing, NoPacing
+
+
+def time_fights(pacing, fights: int) -> float:
+    """Run `fights` fights one after the other.
+
+    Returns:
+        float: The mean wall-clock time per fight, in seconds.
+    """
+    abot = AgenticFight(
+        FakeFightModel(), [special_hits], checkpointer=MemorySaver(), pacing=pacing
+    )
+
+    start = time.perf_counter()
+    for i in range(fights):
+        asyncio.run(run_fight(abot, f"pacing-{i}", FIGHTERS, MOVES))
+    return (time.perf_counter() - start) / fights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fights", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with temporary_database():
+        without_pacing = time_fights(NoPacing(), args.fights)
+        with_pacing = time_fights(DelayPacing(args.delay), args.fights)
+
+    print(f"   no pacing: {without_pacing * 1000:8.1f} ms/fight")
+    print(f"{args.delay}s pacing: {with_pacing * 1000:8.1f} ms/fight")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Benchmark of the prompt layout: a cached prefix per fight, then the parts of the round.
+
+"Before" is the former layout, rebuilt here from the same prompts: a single message with
+the instructions, the whole history (starting with the scenario and fighters) and the
+parts of the round. "After" is the layout of `AgenticFight.prompt`: the instructions and
+the prompt prefix of the fight, then the parts of the round in their own message.
+
+The fights run on the offline fake model, whose prompt cache keeps the prefixes of the
+prompts at message boundaries, like the cache breakpoints of the providers, and which
+charges a time per uncached prompt token. For each layout, it reports the time to build
+a narrator prompt, the share of prompt tokens read from the cache, the narrator latency
+and the estimated cost of a fight. For reference, it also reports the share of each
+prompt that starts like the previous prompt of the fight, which a cache of token
+prefixes could reuse whatever the message boundaries. Run it from the root directory:
+
+    python -m src.benchmarks.prompt_prefix --fights 32 --input-token-latency 0.0002
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.agents.history import count_tokens
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+from src.prompts.prompts import NARRATOR_INSTRUCTIONS_PROMPT
+from src.tournament import run_tournament
+from src.utils.logger import logger
+from src.utils.metrics import FightMetrics, Histogram
+from src.utils.utils import prompt_text
+
+# Price of a million tokens (USD): prompt, cached prompt (half price) and completion
+PROMPT_PRICE = 2.50
+CACHED_PRICE = 1.25
+COMPLETION_PRICE = 10.00
+
+
+class RecordedFight(AgenticFight):
+    """Agent keeping the text of the narrator prompts of each fight, in order."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prompts = {}
+
+    def narrator_context(self, state, config):
+        health, context = super().narrator_context(state, config)
+        thread_id = config["configurable"]["thread_id"]
+        self.prompts.setdefault(thread_id, []).append(prompt_text(context))
+        return health, context
+
+
+class SingleMessageFight(RecordedFight):
+    """Agent with the former prompt layout: everything in a single message."""
+
+    @staticmethod
+    def prompt(instructions, state, parts):
+        history = "\n\n".join(parts)
+        return [HumanMessage(content=f"{instructions.content}\n\n{history}")]
+
+    def history_context(self, state, preamble=True, reserved_tokens=0):
+        # The former prompts started the history with the scenario and fighters
+        return super().history_context(state, True, reserved_tokens)
+
+
+def build_time(abot: AgenticFight, state: dict, calls: int) -> float:
+    """Mean time to build the narrator prompt of a state, in microseconds."""
+    config = {"configurable": {"thread_id": "benchmark"}}
+    start = time.perf_counter()
+    for _ in range(calls):
+        abot.narrator_context(state, config)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def common_prefix_share(prompts: dict[str, list[str]]) -> float:
+    """Share of the prompts that starts like the previous prompt of their fight."""
+    shared = total = 0
+    for fight_prompts in prompts.values():
+        for previous, prompt in zip(fight_prompts, fight_prompts[1:]):
+            shared += len(os.path.commonprefix([previous, prompt]))
+            total += len(prompt)
+    return shared / (total or 1)
+
+
+def run(layout: type[RecordedFight], model: FakeFightModel, fights: int) -> dict:
+    """Run a tournament with a prompt layout.
+
+    Returns:
+        dict: The prompt tokens, the cached share, the latency and the cost of the tournament.
+    """
+    metrics = FightMetrics()
+    abot = layout(model, [special_hits], checkpointer=MemorySaver(), metrics=metrics)
+    states = asyncio.run(run_tournament(abot, [FIGHTERS] * fights, MOVES, fights))
+    assert all(state is not None for state in states)
+
+    data = metrics.to_json()
+    tokens = {"prompt": 0, "completion": 0, "prefix": 0, "cached": 0}
+    for entry in data["counters"]:
+        if entry["name"] == "fight_llm_tokens_total":
+            tokens[entry["labels"]["kind"]] += entry["value"]
+    narrator = next(
+        Histogram.from_dict(entry)
+        for entry in data["histograms"]
+        if entry["name"] == "fight_node_seconds"
+        and entry["labels"].get("node") == "narrator"
+    )
+    cost = (
+        (tokens["prompt"] - tokens["cached"]) * PROMPT_PRICE
+        + tokens["cached"] * CACHED_PRICE
+        + tokens["completion"] * COMPLETION_PRICE
+    ) / 1e6
+
+    common_prefix = common_prefix_share(abot.prompts)
+
+    # A state of the last round, to time the prompt build alone
+    state = {**states[0], "round": states[0]["round"] - 1}
+    return {
+        "build_us": build_time(abot, state, 2000),
+        "prompt_tokens": tokens["prompt"] / fights,
+        "prefix_tokens": tokens["prefix"] / fights,
+        "cached_share": tokens["cached"] / (tokens["prompt"] or 1),
+        "common_prefix_share": common_prefix,
+        "narrator_ms": narrator.sum / narrator.count * 1e3,
+        "cost_per_fight": cost / fights,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fights", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--input-token-latency", type=float, default=0.0002)
+    args = parser.parse_args()
+
+    # Silence the per-node logs of the fights
+    logger.setLevel(logging.WARNING)
+
+    instructions = count_tokens(NARRATOR_INSTRUCTIONS_PROMPT)
+    print(
+        f"{args.fights} fights, model latency {args.latency}s + "
+        f"{args.input_token_latency * 1e6:.0f}us per uncached prompt token, "
+        f"{instructions} tokens of instructions\n"
+    )
+    print(
+        f"{'':>8} {'build':>9} {'prompt':>8} {'prefix':>8} {'cached':>7} "
+        f"{'common':>7} {'narrator':>9} {'cost/fight':>11}"
+    )
+    with temporary_database():
+        for name, layout in (("before", SingleMessageFight), ("after", RecordedFight)):
+            # A new model for each layout, with an empty prompt cache
+            model = FakeFightModel(
+                latency=args.latency, input_token_latency=args.input_token_latency
+            )
+            result = run(layout, model, args.fights)
+            print(
+                f"{name:>8} {result['build_us']:>7.1f}us "
+                f"{result['prompt_tokens']:>8,.0f} {result['prefix_tokens']:>8,.0f} "
+                f"{result['cached_share']:>7.1%} {result['common_prefix_share']:>7.1%} "
+                f"{result['narrator_ms']:>7.0f}ms ${result['cost_per_fight']:>10.5f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
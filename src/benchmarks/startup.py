@@ -0,0 +1,203 @@
+"""Benchmark of the startup: import time of the entry points, and the agent in process workers.
+
+Each entry point is imported in a new interpreter with `python -X importtime`, which
+reports the time of every import: the benchmark sums them and lists the heaviest
+packages. It also times `python src/main.py --help`, the wall-clock time until the CLI
+answers. Then an agent is pickled and sent to a pool of process workers, which compile
+its graph on their first fight and reuse it for the next ones. Run it from the root
+directory:
+
+    python -m src.benchmarks.startup --budget-ms 100
+
+It exits with an error if the import of the CLI (src/main.py) takes longer than the
+budget, so that a heavy import at the top of the CLI does not go unnoticed.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import modifiers, special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+from src.tournament import run_fight
+from src.utils.checkpointer import SQLiteSaver
+from src.utils.databases import FightersRepository, set_repository
+from src.utils.logger import logger
+
+MODULES = ("src.main", "src.tournament", "src.server", "src.agents.agent")
+
+
+def import_times(module: str) -> list[tuple[str, int, int]]:
+    """Import a module in a new interpreter, with `-X importtime`.
+
+    Returns:
+        list[tuple[str, int, int]]: The name and the self and cumulative microseconds of
+            each import of the module, itself last, without the imports of the
+            interpreter startup (site).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        # Each import is reported once it is done, indented under the one importing it:
+        # the imports of the module follow the last top-level import before it
+        if not name.startswith("  "):
+            if name.strip() != module:
+                times = []
+                continue
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def heaviest_packages(times: list, top: int) -> list[tuple[str, int]]:
+    """Top-level packages with the largest cumulative import time, in microseconds.
+
+    The cumulative time of a package includes the packages that it imports, so the
+    times of nested packages overlap.
+    """
+    packages = {}
+    for name, _, cumulative_us in times:
+        package = name.split(".")[0]
+        if package != "src":
+            packages[package] = max(packages.get(package, 0), cumulative_us)
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def help_time(runs: int) -> float:
+    """Best wall-clock time of `python src/main.py --help`, in seconds."""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "src/main.py", "--help"],
+            capture_output=True,
+            check=True,
+        )
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Process workers
+##################
+# Agent of each worker, unpickled once when the worker starts
+_agent = None
+
+
+def _start_worker(data: bytes, database: str):
+    global _agent
+    logger.setLevel(logging.WARNING)
+    set_repository(FightersRepository(database))
+    _agent = pickle.loads(data)
+
+
+def _worker_fight(thread_id: str) -> tuple[int, bool, float]:
+    # The graph is compiled on the first fight of the worker only
+    compiled = "graph" not in vars(_agent)
+    start = time.perf_counter()
+    state = asyncio.run(run_fight(_agent, thread_id, FIGHTERS, MOVES))
+    assert state is not None
+    return os.getpid(), compiled, time.perf_counter() - start
+
+
+def run_workers(abot: AgenticFight, database: str, workers: int, fights: int) -> dict:
+    """Run fights on a pool of process workers, each one with a copy of the agent.
+
+    Returns:
+        dict: The pickled size of the agent, the pickling times, the graph compilations
+            and the throughput of the pool.
+    """
+    start = time.perf_counter()
+    data = pickle.dumps(abot)
+    dumps = time.perf_counter() - start
+    start = time.perf_counter()
+    pickle.loads(data)
+    loads = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # New interpreters, as on macOS and Windows: the agent only reaches them pickled
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_start_worker,
+        initargs=(data, database),
+    ) as pool:
+        results = list(
+            pool.map(_worker_fight, (f"startup-{index}" for index in range(fights)))
+        )
+    elapsed = time.perf_counter() - start
+
+    return {
+        "bytes": len(data),
+        "dumps_ms": dumps * 1e3,
+        "loads_ms": loads * 1e3,
+        "workers": len({pid for pid, _, _ in results}),
+        "compilations": sum(compiled for _, compiled, _ in results),
+        "fights_per_second": fights / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--fights", type=int, default=16)
+    args = parser.parse_args()
+
+    # Silence the per-node logs of the fights
+    logger.setLevel(logging.WARNING)
+
+    print(f"{'module':>16} {'import':>9}  heaviest packages")
+    totals = {}
+    for module in MODULES:
+        times = import_times(module)
+        totals[module] = times[-1][2] / 1e3
+        packages = ", ".join(
+            f"{package} {cumulative_us / 1e3:.0f}ms"
+            for package, cumulative_us in heaviest_packages(times, args.top)
+        )
+        print(f"{module:>16} {totals[module]:>7.0f}ms  {packages}")
+    print(f"\npython src/main.py --help: {help_time(args.runs) * 1e3:.0f}ms\n")
+
+    with temporary_database() as repository, tempfile.TemporaryDirectory() as tmp_dir:
+        abot = AgenticFight(
+            FakeFightModel(),
+            [special_hits, modifiers],
+            checkpointer=SQLiteSaver(os.path.join(tmp_dir, "checkpoints.db")),
+        )
+        result = run_workers(abot, repository.path, args.workers, args.fights)
+    print(
+        f"Agent pickled in {result['bytes']:,} bytes "
+        f"({result['dumps_ms']:.1f}ms, unpickled in {result['loads_ms']:.1f}ms): "
+        f"{args.fights} fights on {result['workers']} process workers, "
+        f"{result['compilations']} graph compilations, "
+        f"{result['fights_per_second']:.1f} fights/s"
+    )
+
+    if totals["src.main"] > args.budget_ms:
+        sys.exit(
+            f"The import of src.main takes {totals['src.main']:.0f}ms, "
+            f"over the budget of {args.budget_ms:.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
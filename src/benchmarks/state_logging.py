@@ -0,0 +1,153 @@
+"""Benchmark of the overhead of `log_state` on the nodes, before and after the lazy logging.
+
+"Before" is the eager version: the state is serialized on every call and written to the
+file by the calling thread. "After" is `log_state`: the state is only serialized if a
+handler emits it, in the thread of the queue listener. Each one logs a node update and
+the full state of a fight, with the DEBUG file handler enabled and disabled. Run it
+from the root directory:
+
+    python -m src.benchmarks.state_logging --calls 2000
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+from langchain_core.messages import HumanMessage
+
+from src.agents.state import FighterStats
+from src.benchmarks.common import FIGHTERS, NARRATION
+from src.utils.logger import DeferredQueueHandler, file_format
+from src.utils.utils import _to_json, log_state
+
+ROUNDS = 10
+
+
+def eager_log_state(logger, state):
+    """`log_state` before the lazy logging: the state is always serialized."""
+    state_log = {}
+    if "messages" in state.keys():
+        state_log["messages"] = [msg.content for msg in state["messages"]]
+    if "fight_evolution" in state.keys():
+        state_log["fight_evolution"] = state["fight_evolution"]
+
+    state_log.update(
+        {
+            key: value
+            for key, value in state.items()
+            if key not in ["messages", "fight_evolution"]
+        }
+    )
+
+    logger.debug(json.dumps(state_log, indent=4, default=_to_json))
+
+
+def fight_states() -> tuple[dict, dict, dict]:
+    """A node update, and the full state of a fight before and after it."""
+    fighters = [
+        FighterStats(name, "Benchmark fighter", 3, 4, 5, 3) for name in FIGHTERS
+    ]
+    previous = {
+        "messages": [HumanMessage(content="Moves") for _ in range(ROUNDS)],
+        "fighters": fighters,
+        "health": [50, 40],
+        "fight_evolution": ["Escenario"] + [NARRATION * 10] * (2 * ROUNDS),
+        "round": ROUNDS,
+        "modifiers": "",
+    }
+    update = {
+        "health": [45, 30],
+        "fight_evolution": [NARRATION * 10],
+        "modifiers": "",
+    }
+    state = {
+        **previous,
+        "health": update["health"],
+        "fight_evolution": previous["fight_evolution"] + update["fight_evolution"],
+    }
+    return update, previous, state
+
+
+def time_calls(log, calls: int, drain=None) -> tuple[float, float]:
+    """Call `log` `calls` times.
+
+    Returns:
+        tuple[float, float]: The mean time of a call, in microseconds, on the calling thread and until the records are written.
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        log()
+    caller = time.perf_counter() - start
+    if drain is not None:
+        drain()
+    total = time.perf_counter() - start
+    return caller / calls * 1e6, total / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    update, previous, state = fight_states()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Before: the file handler on the logger itself
+        file_handler = logging.FileHandler(os.path.join(tmp_dir, "before.log"))
+        file_handler.setFormatter(file_format)
+        before = logging.getLogger("benchmark.before")
+        before.propagate = False
+        before.setLevel(logging.DEBUG)
+        before.addHandler(file_handler)
+
+        # After: the file handler behind a queue
+        queued_handler = logging.FileHandler(os.path.join(tmp_dir, "after.log"))
+        queued_handler.setFormatter(file_format)
+        log_queue = queue.SimpleQueue()
+        after = logging.getLogger("benchmark.after")
+        after.propagate = False
+        after.setLevel(logging.DEBUG)
+        after.addHandler(DeferredQueueHandler(log_queue))
+
+        def drain():
+            # Stopping the listener waits for every queued record to be written
+            listener.stop()
+            listener.start()
+
+        cases = {
+            "update, before": (lambda: eager_log_state(before, update), None),
+            "update, after": (lambda: log_state(after, update), drain),
+            "state, before": (lambda: eager_log_state(before, state), None),
+            "state, after": (lambda: log_state(after, state), drain),
+            "state diff, after": (lambda: log_state(after, state, previous), drain),
+        }
+        for debug in (True, False):
+            level = logging.DEBUG if debug else logging.INFO
+            file_handler.setLevel(level)
+            queued_handler.setLevel(level)
+            for handler in after.handlers:
+                handler.setLevel(level)
+            listener = QueueListener(
+                log_queue, queued_handler, respect_handler_level=True
+            )
+            listener.start()
+
+            print(f"\nDEBUG file handler {'enabled' if debug else 'disabled'}")
+            print(f"{'':>18} {'caller':>10} {'written':>10}")
+            for name, (log, drain_queue) in cases.items():
+                caller, total = time_calls(log, args.calls, drain_queue)
+                print(f"{name:>18} {caller:>8.1f}us {total:>8.1f}us")
+            listener.stop()
+
+        size = os.path.getsize(os.path.join(tmp_dir, "after.log"))
+        print(f"\nafter.log: {size / 2**20:,.1f} MiB")
+        file_handler.close()
+        queued_handler.close()
+
+
+if __name__ == "__main__":
+    main()
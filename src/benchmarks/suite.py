@@ -0,0 +1,222 @@
+"""End-to-end performance suite of whole fights, and the regression gate of performance work.
+
+The fights run on the offline fake model (src/agents/fake_llm.py), with the SQLite
+checkpointer and the fight store on a temporary database, at 1, 10 and 100 concurrent
+fights. For each concurrency it measures the throughput, the latency percentiles of a
+fight, the peak memory, the checkpoint size of a fight and a digest of the outcomes of
+the fights, which are reproducible bit-for-bit: the thread_ids, the seed of the fights
+and the fake model are fixed. Run it from the root directory to save a baseline, then
+to compare a change against it:
+
+    python -m src.benchmarks.suite --save baseline.json
+    python -m src.benchmarks.suite --compare baseline.json --tolerance 0.2
+
+With --compare, it exits with an error if any measure is worse than the baseline by
+more than the tolerance, or if the outcomes of the fights changed.
+"""
+
+import argparse
+import asyncio
+import gc
+import hashlib
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import modifiers, special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+from src.tournament import run_fight
+from src.utils.checkpointer import SQLiteSaver
+from src.utils.fight_store import FightStore
+from src.utils.logger import logger
+
+CONCURRENCY = (1, 10, 100)
+
+# Whether a higher value of each measure is better, to detect the regressions
+HIGHER_IS_BETTER = {
+    "fights_per_second": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "peak_rss_mib": False,
+    "checkpoint_bytes": False,
+}
+
+
+class MeasuredSaver(SQLiteSaver):
+    """SQLite checkpointer measuring the checkpoints of each fight before pruning them."""
+
+    def __init__(self, path: str, executor=None):
+        super().__init__(path, executor=executor)
+        self.sizes = []
+
+    def prune(self, thread_id: str, keep_last: int = 1):
+        self.sizes.append(self.thread_size(thread_id))
+        super().prune(thread_id, keep_last)
+
+
+async def run_fights(
+    abot: AgenticFight, fights: int, concurrency: int
+) -> list[tuple[float, dict]]:
+    """Run `fights` fights, with at most `concurrency` fights at once.
+
+    Returns:
+        list[tuple[float, dict]]: The latency of each fight, in seconds, and its final state.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed_fight(index: int) -> tuple[float, dict]:
+        async with semaphore:
+            start = time.perf_counter()
+            state = await run_fight(
+                abot, f"suite-{concurrency}-{index}", FIGHTERS, MOVES
+            )
+            return time.perf_counter() - start, state
+
+    return await asyncio.gather(*(timed_fight(index) for index in range(fights)))
+
+
+def outcomes_digest(states: list[dict]) -> str:
+    """Digest of the health, narrations and winner of every fight, in order."""
+    outcomes = [
+        [state["health"], state["fight_evolution"], state["winner"]] for state in states
+    ]
+    return hashlib.sha256(json.dumps(outcomes).encode()).hexdigest()[:16]
+
+
+def measure(
+    concurrency: int, fights: int, latency: float, tmp_dir: str
+) -> dict[str, float]:
+    """Measure `fights` fights at a concurrency.
+
+    Returns:
+        dict[str, float]: The measures, with the keys of HIGHER_IS_BETTER, and the digest of the outcomes.
+    """
+    # Threads of the blocking I/O, one per fight at once
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    checkpointer = MeasuredSaver(
+        os.path.join(tmp_dir, f"checkpoints-{concurrency}.db"), executor
+    )
+    store = FightStore(os.path.join(tmp_dir, f"fights-{concurrency}.db"))
+    abot = AgenticFight(
+        FakeFightModel(latency=latency),
+        [special_hits, modifiers],
+        checkpointer=checkpointer,
+        store=store,
+        executor=executor,
+    )
+
+    gc.collect()
+    start = time.perf_counter()
+    latencies, states = zip(*asyncio.run(run_fights(abot, fights, concurrency)))
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    store.flush()
+    store.close()
+    checkpointer.db.close()
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "fights_per_second": fights / elapsed,
+        "p50_ms": percentiles[49] * 1e3,
+        "p95_ms": percentiles[94] * 1e3,
+        "p99_ms": percentiles[98] * 1e3,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "checkpoint_bytes": statistics.mean(checkpointer.sizes),
+        "outcomes": outcomes_digest(states),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Find the measures that are worse than the baseline by more than the tolerance.
+
+    Returns:
+        list[str]: A description of each regression.
+    """
+    regressions = []
+    for concurrency, measures in results.items():
+        for name, value in measures.items():
+            reference = baseline.get(concurrency, {}).get(name)
+            if not reference:
+                continue
+            if name == "outcomes":
+                if value != reference:
+                    regressions.append(
+                        f"outcomes at concurrency {concurrency}: {value} "
+                        f"(baseline {reference}), the fights are not the same"
+                    )
+                continue
+            change = value / reference - 1
+            if HIGHER_IS_BETTER[name]:
+                change = -change
+            if change > tolerance:
+                regressions.append(
+                    f"{name} at concurrency {concurrency}: {value:,.1f} "
+                    f"(baseline {reference:,.1f}, {change:+.0%} worse)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--fights-per-slot", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(CONCURRENCY))
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Silence the per-node logs of the fights
+    logger.setLevel(logging.WARNING)
+
+    print(f"Fake model latency: {args.latency}s per call")
+    print(
+        f"{'concurrency':>11} {'fights/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} "
+        f"{'peak RSS':>10} {'checkpoints':>12} {'outcomes':>16}"
+    )
+    results = {}
+    with temporary_database(), tempfile.TemporaryDirectory() as tmp_dir:
+        # Warm up the imports, the roster cache and the graph compilation
+        measure(1, 2, 0, tmp_dir)
+
+        for concurrency in args.concurrency:
+            fights = max(concurrency * args.fights_per_slot, 2)
+            measures = measure(concurrency, fights, args.latency, tmp_dir)
+            results[str(concurrency)] = measures
+            print(
+                f"{concurrency:>11} {measures['fights_per_second']:>9.1f} "
+                f"{measures['p50_ms']:>7.0f}ms {measures['p95_ms']:>7.0f}ms "
+                f"{measures['p99_ms']:>7.0f}ms {measures['peak_rss_mib']:>6.0f} MiB "
+                f"{measures['checkpoint_bytes']:>10,.0f} B {measures['outcomes']:>16}"
+            )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"latency": args.latency, "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["latency"] != args.latency:
+            sys.exit(
+                f"The baseline was measured with a latency of {baseline['latency']}s"
+            )
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print(f"\nNo regression above {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
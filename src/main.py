@@ -1,18 +1,12 @@
+import argparse
 import getpass
-import json
 import os
 import sys
+import uuid
 
 sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
 
-from langchain_core.messages import SystemMessage
-from langchain_openai import ChatOpenAI
-from langgraph.checkpoint.memory import MemorySaver
-
-from src.agents.agent import AgenticFight
-from src.agents.agentic_tools import modifiers, special_hits
-from src.utils.logger import logger
-from src.utils.utils import log_state
+from src.utils.logger import logger, setup_logging
 
 
 # Get and set API keys
@@ -21,68 +15,135 @@ def _set_env(var: str):
         os.environ[var] = getpass.getpass(f"{var}: ")
 
 
-_set_env("OPENAI_API_KEY")
-
-# _set_env("LANGSMITH_API_KEY")
-# os.environ["LANGSMITH_TRACING"] = "true"
-# os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
-# os.environ["LANGSMITH_PROJECT"] = "agentic-fighters"
-# _set_env("LANGCHAIN_API_KEY")
-# os.environ["LANGCHAIN_TRACING_V2"] = "true"
-# os.environ["LANGCHAIN_PROJECT"] = "agentic-fighters"
-
-# Create llm instance and add tools
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=1)
-tools = [special_hits]  # , modifiers]
-llm_with_tools = llm.bind_tools(tools)
-
-# Create agent
-abot = AgenticFight(llm_with_tools, tools, checkpointer=MemorySaver())
-thread = {"configurable": {"thread_id": "fight1"}}
-
-# THE FIGHT BEGINS!
-first = True
-while True:
-    # First iteration: run the graph until the first interruption
-    if first:
+def main():
+    parser = argparse.ArgumentParser(description="Agentic fighters!")
+    parser.add_argument(
+        "--thread-id",
+        default=f"fight-{uuid.uuid4().hex[:8]}",
+        help="thread of the fight in the checkpoints database",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the interrupted fight of --thread-id",
+    )
+    parser.add_argument(
+        "--fake-llm",
+        action="store_true",
+        help="use the offline fake model instead of OpenAI, see src/agents/fake_llm.py",
+    )
+    args = parser.parse_args()
+    setup_logging()
+
+    if not args.fake_llm:
+        _set_env("OPENAI_API_KEY")
+
+    # _set_env("LANGSMITH_API_KEY")
+    # os.environ["LANGSMITH_TRACING"] = "true"
+    # os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
+    # os.environ["LANGSMITH_PROJECT"] = "agentic-fighters"
+    # _set_env("LANGCHAIN_API_KEY")
+    # os.environ["LANGCHAIN_TRACING_V2"] = "true"
+    # os.environ["LANGCHAIN_PROJECT"] = "agentic-fighters"
+
+    # The agent, LangGraph and the model clients take most of the startup time: they
+    # are imported once the arguments are parsed, so --help, the argument errors and
+    # the API key prompt answer right away, and only the model of the fight is imported
+    from langchain_core.messages import SystemMessage
+
+    from src.agents.agent import AgenticFight
+    from src.agents.agentic_tools import modifiers, special_hits
+    from src.utils.checkpointer import SQLiteSaver
+    from src.utils.databases import create_tables
+    from src.utils.fight_store import FightStore
+    from src.utils.pacing import DelayPacing
+    from src.utils.utils import log_state
+
+    # Create llm instance and add tools
+    if args.fake_llm:
+        from src.agents.fake_llm import FakeFightModel
+
+        llm = FakeFightModel(latency=0.5, token_latency=0.02)
+    else:
+        from langchain_openai import ChatOpenAI
+
+        llm = ChatOpenAI(model="gpt-4o-mini", temperature=1)
+    tools = [special_hits, modifiers]
+
+    # Create database and tables, if they do not exist
+    create_tables()
+    logger.info("Tables created!")
+
+    # Create agent, recording every round as soon as it is narrated
+    checkpointer = SQLiteSaver()
+    store = FightStore(flush_every=1)
+    abot = AgenticFight(
+        llm, tools, checkpointer=checkpointer, pacing=DelayPacing(3), store=store
+    )
+    thread = {"configurable": {"thread_id": args.thread_id}}
+    logger.info(f"Fight thread: {args.thread_id}")
+
+    # THE FIGHT BEGINS!
+    if args.resume:
+        # Continue from the last characters_moves interruption
+        if not abot.graph.get_state(thread).next:
+            sys.exit(f"There is no interrupted fight with thread {args.thread_id}")
+    else:
+        # Run the graph until the first interruption
+        previous = None
         for event in abot.graph.stream(
             {"messages": [SystemMessage(content="Let the fight begin!")]},
             thread,
             stream_mode="values",
         ):
-            first = False
-            break
+            # Only what changed since the previous step is logged
+            log_state(logger, event, previous)
+            previous = event
 
-    # Further iterations without the first system message
-    for event in abot.graph.stream(None, thread, stream_mode="values"):
-        log_state(logger, event)
+    while True:
+        snapshot = abot.graph.get_state(thread)
 
-        pass
+        # Last iteration (next node is empty)
+        if snapshot.next == ():
+            store.flush()
+            logger.debug(
+                f"Fight saved, export it with: python -m src.utils.fight_store export "
+                f"--fight-id {args.thread_id}"
+            )
 
-    # Last iteration (next node is empty)
-    if abot.graph.get_state(thread).next == ():
-        fight_dict = {
-            "messages": [str(msg.content) for msg in event["messages"]],
-            "fight_evolution": event["fight_evolution"],
-        }
-        fight_json_filename = "./data/fight1.json"
-        with open(fight_json_filename, "w", encoding="utf-8") as f:
-            json.dump(fight_dict, f, ensure_ascii=False, indent=4)
+            # Only the final state of a finished fight is kept
+            checkpointer.prune(args.thread_id)
 
-        logger.debug(f"Fight saved to {fight_json_filename}")
-
-        break
+            break
 
-    # Get user input to define characters' moves
-    fighter1_move = input("\nTell me the next move for the fighter 1: ")
-    fighter2_move = input("\nTell me the next move for the fighter 2: ")
+        # Get user input to define characters' moves
+        moves = []
+        for number, fighter in enumerate(snapshot.values["fighters"], start=1):
+            move = input(
+                f"\nTell me the next move for the fighter {number} ({fighter.name}): "
+            )
+            logger.info(f"Fighter {number} move: {move}")
+            moves.append(move)
+
+        # Update the state as if we are the characters_moves node
+        abot.graph.update_state(
+            thread,
+            {"moves": moves},
+            # as_node="characters_moves",
+        )
+
+        # Show the narration while it is generated
+        previous = snapshot.values
+        for mode, payload in abot.graph.stream(
+            None, thread, stream_mode=["values", "messages"]
+        ):
+            if mode == "values":
+                log_state(logger, payload, previous)
+                previous = payload
+            elif payload[1].get("langgraph_node") == "narrator":
+                print(payload[0].content, end="", flush=True)
+        print()
 
-    logger.info(f"Fighter 1 move: {fighter1_move}")
-    logger.info(f"Fighter 2 move: {fighter2_move}")
 
-    # Update the state as if we are the characters_moves node
-    abot.graph.update_state(
-        thread,
-        {"fighter1_move": fighter1_move, "fighter2_move": fighter2_move},
-        # as_node="characters_moves",
-    )
+if __name__ == "__main__":
+    main()
@@ -8,64 +8,89 @@ A pesar de la niebla, los dos luchadores se miran ferozmente y saben que la pele
 FIGHT_EVOLUTION_PROMPT = """Aquí tienes el escenario inicial de la pelea:
 {scenario}
 
-Aquí tienes la descripción del luchador 1, {fighter1_name}: {fighter1_description}
+{fighters_descriptions}"""
 
-Aquí tienes la descripción del luchador 2, {fighter2_name}: {fighter2_description}"""
 
+FIGHTER_DESCRIPTION_PROMPT = (
+    """Aquí tienes la descripción del luchador {number}, {name}: {description}"""
+)
 
-FIGHTERS_MOVES_PROMPT = """Aquí tienes el siguiente movimiento del luchador 1 ({fighter1_name}): {fighter1_move}
 
-Aquí tienes el siguiente movimiento del luchador 2 ({fighter2_name}): {fighter2_move}"""
+ROUND_START_PROMPT = """COMIENZA LA RONDA {round}!"""
 
 
-ORCHESTRATOR_PROMPT = """Eres un agente que busca organizar correctamente la evolución de una pelea entre dos personajes, de una manera graciosa y aleatoria. Tu objetivo es pasarle toda la información necesaria al narrador para que éste pueda generar la evolución de la pelea, una ronda cada vez.
+HISTORY_SUMMARY_PROMPT = """Resumen de las rondas anteriores:
+{summary}"""
+
+
+FIGHTER_MOVE_PROMPT = (
+    """Aquí tienes el siguiente movimiento del luchador {number} ({name}): {move}"""
+)
 
-Tienes a tu disposición algunas herramientas para generar la evolución de la pelea. Por ejemplo, puedes decidir añadir aleatoriedad a la pelea y hacer que alguno de los luchadores pueda ganar modificadores de daño (como si fuese un golpe crítico o un golpe fallado).
 
-Para que te hagas una idea, aquí tienes la evolución de la pelea hasta ahora:
-{fight_evolution}
+EMPTY_MOVE_PROMPT = """Se queda quieto, sin saber qué hacer."""
 
-Y a la vez, aquí tienes una idea de los movimientos que van a intentar hacer los luchadores.
-{fighters_moves}
 
-Por último, aquí tienes entre `` los modificadores que están generados actualmente (puede no haber ninguno todavía):
-`{modifiers}`
+# The prompts of the LLM calls start with the static instructions of their role and the
+# prefix of the fight (FIGHT_EVOLUTION_PROMPT, rendered once per fight), so that the
+# provider can cache that prefix. Only the parts that change every round come after.
+ORCHESTRATOR_INSTRUCTIONS_PROMPT = """Eres un agente que busca organizar correctamente la evolución de una pelea entre dos personajes, de una manera graciosa y aleatoria. Tu objetivo es pasarle toda la información necesaria al narrador para que éste pueda generar la evolución de la pelea, una ronda cada vez.
+
+Tienes a tu disposición algunas herramientas para generar la evolución de la pelea. Por ejemplo, puedes decidir añadir aleatoriedad a la pelea y hacer que alguno de los luchadores pueda ganar modificadores de daño (como si fuese un golpe crítico o un golpe fallado).
+
+Primero tienes el escenario y los luchadores de la pelea. Después, la evolución de la pelea hasta ahora, una idea de los movimientos que van a intentar hacer los luchadores y los modificadores que están generados actualmente (puede no haber ninguno todavía).
 
 Basándote en todo esto, y utilizando las herramientas que consideres, proporciona modificadores que puedan afectar a la pelea, para que el narrador decida incluirlas o no."""
 
 
-NARRATOR_PROMPT = """Eres un narrador que busca sorprender a tus lectores con una pelea de dos luchadores. A partir de la evolución de la pelea, los movimientos que van a intentar hacer los luchadores, las stats de cada luchador, y algun posible modificador de daño, genera una ronda de pelea. Hazlo de una manera graciosa y aleatoria, pero sin perder la esencia de la pelea original.
+NARRATOR_INSTRUCTIONS_PROMPT = """Eres un narrador que busca sorprender a tus lectores con una pelea de dos luchadores. A partir de la evolución de la pelea, los movimientos que van a intentar hacer los luchadores, las stats de cada luchador, algun posible modificador de daño y el resultado de la ronda, genera una ronda de pelea. Hazlo de una manera graciosa y aleatoria, pero sin perder la esencia de la pelea original.
+
+Primero tienes el escenario y los luchadores de la pelea, y después todo lo que ha pasado y va a pasar en esta ronda."""
+
+
+FIGHT_HISTORY_PROMPT = """Aquí tienes la evolución de la pelea hasta ahora:
+{fight_evolution}"""
+
+
+FIGHTERS_MOVES_PROMPT = """Y a la vez, aquí tienes los movimientos que van a intentar hacer los luchadores (pero depende de ti que lo consigan o no, o lo hagan mejor o peor).
+
+{fighters_moves}"""
+
+
+MODIFIERS_PROMPT = """En relación a los movimientos, el orquestador ha aportado lo siguiente al desarrollo de la ronda: {modifiers}"""
+
+
+CURRENT_MODIFIERS_PROMPT = """Aquí tienes entre `` los modificadores que están generados actualmente:
+`{modifiers}`"""
+
+
+ROUND_OUTCOME_PROMPT = """El resultado de la ronda ya está decidido, y tu narración debe respetarlo:
+{round_outcome}"""
+
+
+FIGHTERS_STATS_PROMPT = """Aquí tienes las stats de cada luchador al final de la ronda.
+{fighters_stats}"""
+
 
-Aquí tienes la evolución de la pelea hasta ahora:
-{fight_evolution}
+ATTACK_HIT_PROMPT = """- {attacker} golpea a {target} (multiplicador x{multiplier}) y le quita {damage} de vida"""
 
-Y a la vez, aquí tienes los movimientos que van a intentar hacer los luchadores (pero depende de ti que lo consigan o no, o lo hagan mejor o peor).
 
-Aquí tienes el siguiente movimiento del luchador 1 ({fighter1_name}): {fighter1_move}
+ATTACK_MISS_PROMPT = """- {attacker} intenta golpear a {target}, pero falla"""
 
-Aquí tienes el siguiente movimiento del luchador 2 ({fighter2_name}): {fighter2_move}
 
-En relación a los movimientos, el orquestador ha aportado lo siguiente al desarrollo de la ronda: {modifiers}
+FIGHTER_STATS_PROMPT = """Luchador {number}: {name}
+- vida: {health}
+- fuerza: {strength}
+- agilidad: {agility}
+- inteligencia: {intelligence}
+- armadura: {armor}
+- cansancio: {tiredness}"""
 
-Aquí tienes las stats de cada luchador en este momento.
-Luchador 1: {fighter1_name}
-- vida: {fighter1_health}
-- fuerza: {fighter1_strength}
-- agilidad: {fighter1_agility}
-- inteligencia: {fighter1_intelligence}
-- armadura: {fighter1_armor}
-- cansancio: {fighter1_tiredness}
 
-Luchador 2: {fighter2_name}
-- vida: {fighter2_health}
-- fuerza: {fighter2_strength}
-- agilidad: {fighter2_agility}
-- inteligencia: {fighter2_intelligence}
-- armadura: {fighter2_armor}
-- cansancio: {fighter2_tiredness}"""
+BATCH_PROMPT = """Vas a responder a {count} peticiones independientes a la vez, cada una de una pelea distinta. Responde a cada petición siguiendo sus propias instrucciones, sin mezclar los luchadores ni los hechos de peleas distintas, y devuelve exactamente {count} resultados, uno por petición y en el mismo orden.
 
+{requests}"""
 
-UPDATER_PROMPT = """Eres un árbitro encargado de analizar una pelea entre dos luchadores ficticios. A partir de la evolución que ha tenido la pelea, determina quién ha sido el ganador y quién el perdedor.
 
-Aquí tienes la evolución de toda la pelea:
-'{fight_evolution}'"""
+BATCH_REQUEST_PROMPT = """PETICIÓN {number}:
+{context}"""
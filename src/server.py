@@ -0,0 +1,590 @@
+"""Local HTTP/WebSocket fight service: many interactive fights hosted by a single process.
+
+Every fight runs on the same compiled graph, model client and database pools. The
+graph steps of the fights (the start of a fight, or a round once its moves are in) are
+queued and run by a fixed number of workers; when the queue is full, new steps are
+rejected with a 503 until the workers catch up. A fight that waits for its moves longer
+than the idle timeout expires and leaves the memory. Run it from the root directory:
+
+    python -m src.server --port 8080 --workers 8 --max-pending 64
+
+Endpoints:
+
+- `POST /fights` with `{"fighters": ["Carlos", "Alejandro"]}`: create a fight.
+- `POST /fights/{fight_id}/moves` with `{"moves": ["...", "..."]}`: submit the moves of
+  a round. Add `?stream=1` to get the narration as it is generated.
+- `GET /fights/{fight_id}`: status, health and result of a fight.
+- `GET /fights/{fight_id}/rounds`: the narrated rounds of a fight.
+- `GET /fights/{fight_id}/ws`: WebSocket with the narration tokens and the end of each
+  round, which also accepts the moves as `{"moves": [...]}` messages.
+- `GET /health`: workers, queued steps and fights in progress.
+"""
+
+import argparse
+import asyncio
+import getpass
+import json
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from aiohttp import WSMsgType, web
+from langchain_core.messages import SystemMessage
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import modifiers, special_hits
+from src.agents.combat import FIGHTERS_PER_FIGHT
+from src.utils.checkpointer import CHECKPOINTS_FILE, SQLiteSaver
+from src.utils.databases import create_tables, list_fighters
+from src.utils.fight_store import FightNotFound, FightStore
+from src.utils.logger import logger, setup_logging
+from src.utils.utils import run_blocking
+
+# Events buffered for each WebSocket or streaming client before it is dropped
+SUBSCRIBER_BUFFER = 10_000
+
+
+class ServiceOverloaded(Exception):
+    """Every worker is busy and the queue of graph steps is full."""
+
+
+class FightConflict(Exception):
+    """The fight cannot take the request in its current status."""
+
+
+class InvalidRequest(Exception):
+    """The body of the request is malformed or names unknown fighters."""
+
+
+@dataclass
+class FightSession:
+    """In-memory status of a fight hosted by the service."""
+
+    fight_id: str
+    fighters: list[str]
+    # starting, waiting_moves, running, finished, failed or expired
+    status: str = "starting"
+    round: int = 0
+    health: list[float] = field(default_factory=list)
+    narration: str = ""
+    winner: str = None
+    loser: str = None
+    error: str = None
+    subscribers: set = field(default_factory=set)
+    # time.monotonic() of the last change of status, to expire the idle fights
+    updated_at: float = field(default_factory=time.monotonic)
+
+    def summary(self) -> dict:
+        return {
+            "fight_id": self.fight_id,
+            "fighters": self.fighters,
+            "status": self.status,
+            "round": self.round,
+            "health": self.health,
+            "narration": self.narration,
+            "winner": self.winner,
+            "loser": self.loser,
+            "error": self.error,
+        }
+
+    def subscribe(self) -> asyncio.Queue:
+        events = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self.subscribers.add(events)
+        return events
+
+    def unsubscribe(self, events: asyncio.Queue):
+        self.subscribers.discard(events)
+
+    def publish(self, event: dict):
+        for events in list(self.subscribers):
+            try:
+                events.put_nowait(event)
+            except asyncio.QueueFull:
+                # A client that does not read its events is dropped
+                self.subscribers.discard(events)
+                while not events.empty():
+                    events.get_nowait()
+                events.put_nowait({"type": "dropped", "error": "Too slow client"})
+
+
+class FightService:
+    """Queue of the graph steps of every fight, run by a pool of workers."""
+
+    def __init__(
+        self,
+        abot: AgenticFight,
+        workers: int = 8,
+        max_pending: int = 64,
+        keep_finished: int = 1000,
+        idle_timeout: float = 3600.0,
+    ):
+        """Initialize the service.
+
+        Args:
+            abot (AgenticFight): The agent whose graph runs every fight.
+            workers (int, optional): Number of graph steps run at once. Defaults to 8.
+            max_pending (int, optional): Number of queued steps before rejecting new ones. Defaults to 64.
+            keep_finished (int, optional): Number of finished fights kept in memory, the older ones are read from the fight store. Defaults to 1000.
+            idle_timeout (float, optional): Seconds that a fight waits for its moves before it expires. Defaults to 3600.
+        """
+        self.abot = abot
+        self.workers = workers
+        self.keep_finished = keep_finished
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.finished = OrderedDict()
+        self._jobs = asyncio.Queue(maxsize=max_pending)
+        self._tasks = []
+
+    # Lifecycle
+    ############
+    async def start(self):
+        """Start the workers, on the running event loop."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._expire_idle()))
+
+    async def stop(self):
+        """Stop the workers, cancelling the steps in progress."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending_steps": self._jobs.qsize(),
+            "max_pending_steps": self._jobs.maxsize,
+            "fights_in_progress": len(self.sessions),
+        }
+
+    # Requests
+    ###########
+    def get(self, fight_id: str) -> FightSession:
+        """Get a fight in progress or recently finished.
+
+        Raises:
+            FightNotFound: If the fight is not in memory.
+        """
+        session = self.sessions.get(fight_id) or self.finished.get(fight_id)
+        if session is None:
+            raise FightNotFound(f"Fight {fight_id} not found!")
+        return session
+
+    async def create_fight(self, fighters: list[str]) -> FightSession:
+        """Create a fight and queue its start.
+
+        Args:
+            fighters (list[str]): Names of the fighters.
+
+        Returns:
+            FightSession: The new fight.
+        """
+        if not isinstance(fighters, list) or not all(
+            isinstance(name, str) for name in fighters
+        ):
+            raise InvalidRequest("The fighters must be a list of names")
+        known = {
+            fighter["name"]
+            for fighter in await run_blocking(self.abot.executor, list_fighters)
+        }
+        unknown = [name for name in fighters if name not in known]
+        if len(fighters) != FIGHTERS_PER_FIGHT or unknown:
+            raise InvalidRequest(
+                f"A fight needs {FIGHTERS_PER_FIGHT} known fighters, unknown: {unknown}"
+            )
+
+        session = FightSession(f"fight-{uuid.uuid4().hex[:12]}", list(fighters))
+        self._enqueue(session, None)
+        self.sessions[session.fight_id] = session
+        return session
+
+    def submit_moves(self, fight_id: str, moves: list[str]) -> FightSession:
+        """Queue the round of a fight that is waiting for its moves.
+
+        Args:
+            fight_id (str): The fight.
+            moves (list[str]): The move of each fighter.
+
+        Returns:
+            FightSession: The fight.
+        """
+        session = self.get(fight_id)
+        if session.status != "waiting_moves":
+            raise FightConflict(
+                f"Fight {fight_id} is {session.status}, not waiting for moves"
+            )
+        if not isinstance(moves, list) or len(moves) != len(session.fighters):
+            raise InvalidRequest(f"Expected {len(session.fighters)} moves")
+
+        self._enqueue(session, [AgenticFight.validate_move(move) for move in moves])
+        session.status, session.updated_at = "running", time.monotonic()
+        return session
+
+    def _enqueue(self, session: FightSession, moves: list[str] | None):
+        try:
+            self._jobs.put_nowait((session, moves))
+        except asyncio.QueueFull:
+            raise ServiceOverloaded(
+                f"{self._jobs.maxsize} steps already queued, retry later"
+            )
+
+    # Workers
+    ##########
+    async def _worker(self):
+        while True:
+            session, moves = await self._jobs.get()
+            try:
+                await self._step(session, moves)
+            except Exception as error:
+                logger.exception(f"Fight {session.fight_id} failed")
+                session.status, session.error = "failed", str(error)
+                self._finish(session)
+                session.publish({"type": "failed", **session.summary()})
+            finally:
+                self._jobs.task_done()
+
+    async def _step(self, session: FightSession, moves: list[str] | None):
+        """Run the graph of a fight until its next interruption, streaming the narration."""
+        graph = self.abot.graph
+        thread = {"configurable": {"thread_id": session.fight_id}}
+        if moves is None:
+            graph_input = {
+                "messages": [SystemMessage(content="Let the fight begin!")],
+                "fighter_names": session.fighters,
+            }
+        else:
+            await graph.aupdate_state(thread, {"moves": moves})
+            graph_input = None
+
+        async for mode, payload in graph.astream(
+            graph_input, thread, stream_mode=["messages", "updates"]
+        ):
+            if mode == "messages" and payload[1].get("langgraph_node") == "narrator":
+                if payload[0].content:
+                    session.publish({"type": "token", "text": payload[0].content})
+            elif mode == "updates" and payload.get("narrator"):
+                # The narration of the round, not the result that the updater adds
+                session.narration = payload["narrator"]["fight_evolution"][-1]
+
+        snapshot = await graph.aget_state(thread)
+        values = snapshot.values
+        session.round = values.get("round", 0)
+        session.health = values.get("health", [])
+
+        if snapshot.next == ():
+            session.status = "finished"
+            session.winner, session.loser = values.get("winner"), values.get("loser")
+            if hasattr(graph.checkpointer, "prune"):
+                await run_blocking(
+                    self.abot.executor, graph.checkpointer.prune, session.fight_id
+                )
+            self._finish(session)
+            session.publish({"type": "finished", **session.summary()})
+        else:
+            session.status, session.updated_at = "waiting_moves", time.monotonic()
+            session.publish({"type": "round", **session.summary()})
+
+    async def _expire_idle(self):
+        # The fights abandoned while waiting for their moves leave the memory
+        while True:
+            await asyncio.sleep(self.idle_timeout / 4)
+            deadline = time.monotonic() - self.idle_timeout
+            idle = [
+                session
+                for session in self.sessions.values()
+                if session.status == "waiting_moves" and session.updated_at < deadline
+            ]
+            for session in idle:
+                session.status = "expired"
+                session.error = f"No moves in {self.idle_timeout:g} seconds"
+                self._finish(session)
+                session.publish({"type": "expired", **session.summary()})
+                checkpointer = self.abot.graph.checkpointer
+                if hasattr(checkpointer, "prune"):
+                    await run_blocking(
+                        self.abot.executor, checkpointer.prune, session.fight_id
+                    )
+
+    def _finish(self, session: FightSession):
+        self.sessions.pop(session.fight_id, None)
+        self.finished[session.fight_id] = session
+        while len(self.finished) > self.keep_finished:
+            self.finished.popitem(last=False)
+
+
+# HTTP
+#######
+SERVICE = web.AppKey("service", FightService)
+STORE = web.AppKey("store", FightStore)
+
+
+@web.middleware
+async def errors_middleware(request: web.Request, handler):
+    # Map the errors of the service to HTTP errors
+    try:
+        return await handler(request)
+    except FightNotFound as error:
+        raise web.HTTPNotFound(text=_error(error))
+    except InvalidRequest as error:
+        raise web.HTTPBadRequest(text=_error(error))
+    except FightConflict as error:
+        raise web.HTTPConflict(text=_error(error))
+    except ServiceOverloaded as error:
+        raise web.HTTPServiceUnavailable(
+            text=_error(error), headers={"Retry-After": "1"}
+        )
+
+
+def _error(error) -> str:
+    return json.dumps({"error": str(error)}, ensure_ascii=False)
+
+
+async def _json_body(request: web.Request) -> dict:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise InvalidRequest("The body must be JSON")
+    if not isinstance(body, dict):
+        raise InvalidRequest("The body must be a JSON object")
+    return body
+
+
+async def create_fight(request: web.Request) -> web.Response:
+    body = await _json_body(request)
+    session = await request.app[SERVICE].create_fight(body.get("fighters") or [])
+    return web.json_response(session.summary(), status=201)
+
+
+async def _session(request: web.Request, fight_id: str) -> FightSession:
+    """Get a fight in memory, or raise a conflict if it only remains in the fight store."""
+    try:
+        return request.app[SERVICE].get(fight_id)
+    except FightNotFound:
+        stored = await run_blocking(
+            request.app[SERVICE].abot.executor, request.app[STORE].has_fight, fight_id
+        )
+        if stored:
+            raise FightConflict(f"Fight {fight_id} is over, not waiting for moves")
+        raise
+
+
+async def submit_moves(request: web.Request) -> web.StreamResponse:
+    service = request.app[SERVICE]
+    fight_id = request.match_info["fight_id"]
+    body = await _json_body(request)
+    session = await _session(request, fight_id)
+    if request.query.get("stream") not in ("1", "true"):
+        service.submit_moves(fight_id, body.get("moves"))
+        return web.json_response(session.summary(), status=202)
+
+    # Subscribe before the round is queued, so that no token is missed
+    events = session.subscribe()
+    try:
+        service.submit_moves(fight_id, body.get("moves"))
+        response = web.StreamResponse(headers={"Content-Type": "text/plain"})
+        await response.prepare(request)
+        while True:
+            event = await events.get()
+            if event["type"] == "token":
+                await response.write(event["text"].encode())
+            else:
+                await response.write(b"\n\n" + _event_line(event))
+                break
+        await response.write_eof()
+        return response
+    finally:
+        session.unsubscribe(events)
+
+
+def _event_line(event: dict) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode()
+
+
+async def get_fight(request: web.Request) -> web.Response:
+    fight_id = request.match_info["fight_id"]
+    try:
+        return web.json_response(request.app[SERVICE].get(fight_id).summary())
+    except FightNotFound:
+        # Evicted from memory: the stored fight
+        abot = request.app[SERVICE].abot
+        state = await run_blocking(
+            abot.executor, request.app[STORE].replay, fight_id, None, abot.history
+        )
+        # The two lines of the result of a finished fight follow its last narration
+        narration = state["fight_evolution"][-3 if state.get("winner") else -1]
+        return web.json_response(
+            {
+                "fight_id": fight_id,
+                "fighters": [fighter.name for fighter in state["fighters"]],
+                "status": "finished" if state.get("winner") else "unknown",
+                "round": state["round"],
+                "health": state["health"],
+                "narration": narration if state["round"] else "",
+                "winner": state.get("winner"),
+                "loser": state.get("loser"),
+                "error": None,
+            }
+        )
+
+
+async def get_rounds(request: web.Request) -> web.Response:
+    fight_id = request.match_info["fight_id"]
+    rounds = await run_blocking(
+        request.app[SERVICE].abot.executor,
+        lambda: list(request.app[STORE].iter_rounds(fight_id)),
+    )
+    return web.json_response(rounds)
+
+
+async def fight_websocket(request: web.Request) -> web.WebSocketResponse:
+    service = request.app[SERVICE]
+    session = await _session(request, request.match_info["fight_id"])
+
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    events = session.subscribe()
+    await ws.send_json({"type": "state", **session.summary()})
+
+    async def send_events():
+        while True:
+            event = await events.get()
+            await ws.send_json(event)
+            if event["type"] == "dropped":
+                await ws.close()
+                return
+
+    sender = asyncio.create_task(send_events())
+    try:
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            try:
+                body = json.loads(message.data)
+                if not isinstance(body, dict):
+                    raise InvalidRequest("The message must be a JSON object")
+                service.submit_moves(session.fight_id, body.get("moves"))
+            except (
+                json.JSONDecodeError,
+                InvalidRequest,
+                FightConflict,
+                ServiceOverloaded,
+            ) as error:
+                await ws.send_json({"type": "error", "error": str(error)})
+    finally:
+        session.unsubscribe(events)
+        sender.cancel()
+    return ws
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response(request.app[SERVICE].stats())
+
+
+def make_app(service: FightService, store: FightStore) -> web.Application:
+    """Build the web application of a fight service.
+
+    Args:
+        service (FightService): The service, started and stopped with the application.
+        store (FightStore): The store of the fights, to fetch the finished ones.
+
+    Returns:
+        web.Application: The application.
+    """
+    app = web.Application(middlewares=[errors_middleware])
+    app[SERVICE] = service
+    app[STORE] = store
+
+    async def lifecycle(app: web.Application):
+        await service.start()
+        yield
+        await service.stop()
+        await run_blocking(service.abot.executor, store.flush)
+
+    app.cleanup_ctx.append(lifecycle)
+    app.add_routes(
+        [
+            web.post("/fights", create_fight),
+            web.post("/fights/{fight_id}/moves", submit_moves),
+            web.get("/fights/{fight_id}", get_fight),
+            web.get("/fights/{fight_id}/rounds", get_rounds),
+            web.get("/fights/{fight_id}/ws", fight_websocket),
+            web.get("/health", health),
+        ]
+    )
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--checkpoints", default=CHECKPOINTS_FILE)
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=3600.0,
+        help="seconds that a fight waits for its moves before it expires",
+    )
+    parser.add_argument(
+        "--fake-llm",
+        type=float,
+        metavar="LATENCY",
+        help="use the offline fake model, answering after LATENCY seconds",
+    )
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.fake_llm is None and not os.environ.get("OPENAI_API_KEY"):
+        os.environ["OPENAI_API_KEY"] = getpass.getpass("OPENAI_API_KEY: ")
+
+    create_tables()
+
+    # A single model client, checkpointer and fight store for every fight
+    # Only the model of the service is imported
+    if args.fake_llm is not None:
+        from src.agents.fake_llm import FakeFightModel
+
+        llm = FakeFightModel(latency=args.fake_llm)
+    else:
+        import httpx
+        from langchain_openai import ChatOpenAI
+
+        # One HTTP connection per worker, kept alive between the requests
+        llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=1,
+            stream_usage=True,
+            http_async_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=args.workers,
+                    max_keepalive_connections=args.workers,
+                )
+            ),
+        )
+    store = FightStore(flush_every=1)
+    # Threads of the blocking I/O of the nodes, checkpoints and requests, one per worker
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    abot = AgenticFight(
+        llm,
+        [special_hits, modifiers],
+        checkpointer=SQLiteSaver(args.checkpoints, executor=executor),
+        store=store,
+        executor=executor,
+    )
+    service = FightService(
+        abot, args.workers, args.max_pending, idle_timeout=args.idle_timeout
+    )
+
+    web.run_app(make_app(service, store), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
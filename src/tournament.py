@@ -0,0 +1,326 @@
+"""Headless tournament runner: every pair of fighters of a roster fights, with scripted moves.
+
+Fights run concurrently on a single event loop, each one on its own thread_id, and the
+results are written to the database in batches. Run it from the root directory:
+
+    python -m src.tournament --moves moves.json --concurrency 16 --repeat 10
+
+where `moves.json` is a list with the moves of each fighter for each round, e.g.
+`[["Un puñetazo", "Una patada"], ["Un cabezazo", "Esquivar"]]`. If a fight lasts
+longer than the list, the moves are reused from the beginning.
+"""
+
+import argparse
+import asyncio
+import getpass
+import itertools
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from langchain_core.messages import SystemMessage
+
+from src.agents.agent import AgenticFight, RoundResult
+from src.agents.agentic_tools import modifiers, special_hits
+from src.agents.combat import FIGHTERS_PER_FIGHT, CombatEngine
+from src.utils.checkpointer import CHECKPOINTS_FILE, SQLiteSaver
+from src.utils.databases import (
+    FightResultsBuffer,
+    add_fighter,
+    create_tables,
+    roster_stats,
+)
+from src.utils.fight_store import FightStore
+from src.utils.llm_batching import StructuredOutputBatcher
+from src.utils.llm_cache import StructuredOutputCache
+from src.utils.logger import logger, setup_logging
+from src.utils.metrics import FightMetrics
+from src.utils.utils import run_blocking
+
+
+def load_roster(path: str) -> list[dict]:
+    """Load the fighters of the tournament.
+
+    Args:
+        path (str): JSON file with the fighters, either as a list or as a dictionary of fighters (like fighters.json).
+
+    Returns:
+        list[dict]: The fighters of the roster.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        roster = json.load(f)
+
+    return list(roster.values()) if isinstance(roster, dict) else roster
+
+
+def make_pairings(roster: list[dict], repeat: int = 1) -> list[tuple[str, str]]:
+    """Make every pair of fighters of the roster fight `repeat` times.
+
+    Args:
+        roster (list[dict]): The fighters of the tournament.
+        repeat (int, optional): Number of fights of each pair. Defaults to 1.
+
+    Returns:
+        list[tuple[str, str]]: The names of the fighters of each fight.
+    """
+    names = [fighter["name"] for fighter in roster]
+    return [
+        pair
+        for pair in itertools.combinations(names, FIGHTERS_PER_FIGHT)
+        for _ in range(repeat)
+    ]
+
+
+async def run_fight(
+    abot: AgenticFight,
+    thread_id: str,
+    fighters: tuple[str, ...],
+    moves: list[list[str]],
+) -> dict:
+    """Run a whole fight, feeding the scripted moves at each `characters_moves` interruption.
+
+    Args:
+        abot (AgenticFight): The agent whose graph runs the fight.
+        thread_id (str): Thread of the fight in the checkpointer.
+        fighters (tuple[str, ...]): Names of the fighters.
+        moves (list[list[str]]): Moves of each fighter for each round.
+
+    Returns:
+        dict: The final state of the fight.
+
+    Raises:
+        ValueError: If there are no moves, or a round lacks the move of a fighter.
+    """
+    if not moves or any(len(round_moves) < len(fighters) for round_moves in moves):
+        raise ValueError(
+            f"Every round of moves needs a move for each of the {len(fighters)} fighters"
+        )
+    thread = {"configurable": {"thread_id": thread_id}}
+
+    # Run the graph until the first interruption
+    await abot.graph.ainvoke(
+        {
+            "messages": [SystemMessage(content="Let the fight begin!")],
+            "fighter_names": list(fighters),
+        },
+        thread,
+    )
+
+    # Feed the moves of each round until the fight is over
+    for round_moves in itertools.cycle(moves):
+        snapshot = await abot.graph.aget_state(thread)
+        if snapshot.next == ():
+            # Only the final state of a finished fight is kept
+            if hasattr(abot.graph.checkpointer, "prune"):
+                await run_blocking(
+                    abot.executor, abot.graph.checkpointer.prune, thread_id
+                )
+            return snapshot.values
+
+        await abot.graph.aupdate_state(
+            thread, {"moves": list(round_moves[: len(fighters)])}
+        )
+        await abot.graph.ainvoke(None, thread)
+
+
+async def run_tournament(
+    abot: AgenticFight,
+    pairings: list[tuple[str, ...]],
+    moves: list[list[str]],
+    concurrency: int = 8,
+    tournament_id: str = None,
+) -> list[dict]:
+    """Run every fight of the tournament, with at most `concurrency` fights at once.
+
+    Args:
+        abot (AgenticFight): The agent whose graph runs the fights.
+        pairings (list[tuple[str, ...]]): The names of the fighters of each fight.
+        moves (list[list[str]]): Moves of each fighter for each round.
+        concurrency (int, optional): Maximum number of simultaneous fights. Defaults to 8.
+        tournament_id (str, optional): Prefix of the thread_id of the fights, which the seed of each fight derives from. Defaults to a random one.
+
+    The blocking I/O of the fights runs in the executor of the agent and of its
+    checkpointer, which should have room for `concurrency` fights.
+
+    Returns:
+        list[dict]: The final state of each fight (None for the fights that failed).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tournament_id = tournament_id or uuid.uuid4().hex[:8]
+
+    async def bounded_fight(index: int, fighters: tuple[str, ...]):
+        thread_id = f"{tournament_id}-{index}"
+        async with semaphore:
+            try:
+                state = await run_fight(abot, thread_id, fighters, moves)
+            except Exception:
+                logger.exception(f"Fight {thread_id} {fighters} failed")
+                return None
+        logger.info(f"Fight {thread_id} finished: {' vs '.join(fighters)}")
+        return state
+
+    return await asyncio.gather(
+        *(bounded_fight(index, fighters) for index, fighters in enumerate(pairings))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--roster", default="./src/prompts/fighters.json")
+    parser.add_argument("--moves", required=True)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--flush-every", type=int, default=100)
+    parser.add_argument("--checkpoints", default=CHECKPOINTS_FILE)
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse the narration of a round whose narrator prompt was already answered",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="send the narrations of up to this many fights in a single request",
+    )
+    parser.add_argument(
+        "--batch-window",
+        type=float,
+        default=0.05,
+        help="seconds to wait for more narrations before sending a batch",
+    )
+    parser.add_argument(
+        "--batch-separate",
+        action="store_true",
+        help="send each narration of a batch as its own concurrent request",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="seed of the random draws of the fights (and of the fake model)",
+    )
+    parser.add_argument(
+        "--tournament-id",
+        help="prefix of the thread_id of the fights (random by default): with the "
+        "same seed, the same fights draw the same numbers. Replay them on new "
+        "--checkpoints",
+    )
+    parser.add_argument(
+        "--tool-iterations",
+        type=int,
+        default=AgenticFight.MAX_TOOL_ITERATIONS,
+        help="maximum model calls of the orchestrator in a round, 0 to skip it",
+    )
+    parser.add_argument(
+        "--fake-llm",
+        type=float,
+        metavar="LATENCY",
+        help="use the offline fake model, answering after LATENCY seconds",
+    )
+    parser.add_argument(
+        "--metrics", help="write the metrics of the graph to this JSON file"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve the metrics in the Prometheus format on this port",
+    )
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.fake_llm is None and not os.environ.get("OPENAI_API_KEY"):
+        os.environ["OPENAI_API_KEY"] = getpass.getpass("OPENAI_API_KEY: ")
+
+    # Add the roster to the database once, before any fight
+    roster = load_roster(args.roster)
+    create_tables()
+    for fighter in roster:
+        add_fighter(fighter)
+
+    with open(args.moves, "r", encoding="utf-8") as f:
+        moves = json.load(f)
+    # The moves of the rounds are cycled until each fight is over
+    if not moves or any(
+        not isinstance(round_moves, list) or len(round_moves) < FIGHTERS_PER_FIGHT
+        for round_moves in moves
+    ):
+        sys.exit(
+            f"{args.moves} needs at least one round, each one with a move for each of "
+            f"the {FIGHTERS_PER_FIGHT} fighters"
+        )
+    pairings = make_pairings(roster, args.repeat)
+
+    # Create agent, with the fight results buffered and written in batches
+    # Only the model of the tournament is imported
+    if args.fake_llm is not None:
+        from src.agents.fake_llm import FakeFightModel
+
+        llm = FakeFightModel(latency=args.fake_llm, seed=args.seed)
+    else:
+        from langchain_openai import ChatOpenAI
+
+        llm = ChatOpenAI(model="gpt-4o-mini", temperature=1, stream_usage=True)
+    tools = [special_hits, modifiers]
+    results = FightResultsBuffer(flush_every=args.flush_every)
+    store = FightStore(flush_every=args.flush_every)
+    cache = StructuredOutputCache() if args.cache else None
+    batcher = None
+    if args.batch_size:
+        batcher = StructuredOutputBatcher(
+            llm,
+            RoundResult,
+            max_batch=args.batch_size,
+            window=args.batch_window,
+            combine=not args.batch_separate,
+        )
+    metrics = FightMetrics() if args.metrics or args.metrics_port else None
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    # Threads of the blocking I/O of the nodes and checkpoints, one per fight at once
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    abot = AgenticFight(
+        llm,
+        tools,
+        checkpointer=SQLiteSaver(args.checkpoints, executor=executor),
+        on_result=results.add,
+        cache=cache,
+        store=store,
+        metrics=metrics,
+        batcher=batcher,
+        combat=CombatEngine(seed=args.seed),
+        max_tool_iterations=args.tool_iterations,
+        executor=executor,
+    )
+
+    start = time.perf_counter()
+    try:
+        states = asyncio.run(
+            run_tournament(abot, pairings, moves, args.concurrency, args.tournament_id)
+        )
+    finally:
+        executor.shutdown()
+        results.flush()
+        store.flush()
+    elapsed = time.perf_counter() - start
+
+    finished = sum(state is not None for state in states)
+    logger.info(
+        f"{finished}/{len(pairings)} fights finished in {elapsed:.1f}s "
+        f"({finished / elapsed * 60:.1f} fights/min)"
+    )
+    logger.info(f"Roster cache: {roster_stats()}")
+    if cache is not None:
+        logger.info(f"LLM cache: {cache.stats()}")
+    if batcher is not None:
+        logger.info(f"Narration batches: {batcher.stats()}")
+    if args.metrics:
+        metrics.dump(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+"""Module with a LangGraph checkpointer that persists the fights in a SQLite database."""
+
+import random
+import threading
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.types import TASKS, ChannelProtocol
+
+from src.utils.databases import DATABASE_PATH, SQLitePool
+from src.utils.utils import run_blocking
+
+CHECKPOINTS_FILE = f"{DATABASE_PATH}/checkpoints.db"
+
+
+class SQLiteSaver(BaseCheckpointSaver):
+    """Checkpointer storing the checkpoints of every thread in a SQLite database.
+
+    Channel values are stored once per channel version, so a checkpoint only adds the
+    channels that changed in its step. Decoded values are kept in a bounded LRU cache,
+    so memory use does not grow with the number of fights.
+    """
+
+    def __init__(
+        self,
+        path: str = CHECKPOINTS_FILE,
+        cache_size: int = 1024,
+        serde=None,
+        executor=None,
+    ):
+        """Initialize the checkpointer, creating its tables if they do not exist.
+
+        Args:
+            path (str, optional): Path to the SQLite database file. Defaults to CHECKPOINTS_FILE.
+            cache_size (int, optional): Maximum number of decoded channel values kept in memory. Defaults to 1024.
+            serde (SerializerProtocol, optional): Serializer of the checkpoints. Defaults to LangGraph's.
+            executor (Executor, optional): Executor of the asynchronous methods. Defaults to the default executor of the event loop.
+        """
+        super().__init__(serde=serde)
+        self.db = SQLitePool(path)
+        self.cache_size = cache_size
+        self.executor = executor
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        with self.db.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT,
+                    checkpoint_ns TEXT,
+                    checkpoint_id TEXT,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BLOB,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    thread_id TEXT,
+                    checkpoint_ns TEXT,
+                    channel TEXT,
+                    version TEXT,
+                    type TEXT,
+                    blob BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT,
+                    checkpoint_ns TEXT,
+                    checkpoint_id TEXT,
+                    task_id TEXT,
+                    idx INTEGER,
+                    channel TEXT,
+                    type TEXT,
+                    value BLOB,
+                    task_path TEXT,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                )""")
+
+    # Pickling
+    ###########
+    # Connections, cache and lock belong to a process: a copy sent to a process worker
+    # opens its own connections to the same database file
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["db"] = (self.db.path, self.db.pool_size, self.db.timeout)
+        state["executor"] = None
+        del state["_cache"], state["_cache_lock"]
+        return state
+
+    def __setstate__(self, state: dict):
+        path, pool_size, timeout = state.pop("db")
+        self.__dict__.update(state)
+        self.db = SQLitePool(path, pool_size, timeout)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    # Channel values
+    #################
+    def _load_channel_values(
+        self, conn, thread_id: str, checkpoint_ns: str, versions: ChannelVersions
+    ) -> dict:
+        channel_values = {}
+        for channel, version in versions.items():
+            key = (thread_id, checkpoint_ns, channel, str(version))
+            with self._cache_lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    channel_values[channel] = self._cache[key]
+                    continue
+
+            row = conn.execute(
+                """SELECT type, blob FROM blobs
+                WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?""",
+                key,
+            ).fetchone()
+            if row is None or row[0] == "empty":
+                continue
+
+            value = self.serde.loads_typed((row[0], row[1]))
+            channel_values[channel] = value
+            with self._cache_lock:
+                self._cache[key] = value
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return channel_values
+
+    def _make_tuple(self, conn, row) -> CheckpointTuple:
+        (
+            thread_id,
+            checkpoint_ns,
+            checkpoint_id,
+            parent_checkpoint_id,
+            type_,
+            checkpoint_blob,
+            metadata_type,
+            metadata_blob,
+        ) = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint_blob))
+
+        pending_writes = [
+            (task_id, channel, self.serde.loads_typed((value_type, value)))
+            for task_id, channel, value_type, value in conn.execute(
+                """SELECT task_id, channel, type, value FROM writes
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                ORDER BY task_id, idx""",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+        ]
+        pending_sends = (
+            [
+                self.serde.loads_typed((value_type, value))
+                for value_type, value in conn.execute(
+                    """SELECT type, value FROM writes
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ?
+                    ORDER BY task_path, task_id, idx""",
+                    (thread_id, checkpoint_ns, parent_checkpoint_id, TASKS),
+                )
+            ]
+            if parent_checkpoint_id
+            else []
+        )
+
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_channel_values(
+                    conn, thread_id, checkpoint_ns, checkpoint["channel_versions"]
+                ),
+                "pending_sends": pending_sends,
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=pending_writes,
+        )
+
+    # Checkpointer interface
+    #########################
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Get the checkpoint of the config, or the latest one of its thread.
+
+        Args:
+            config (RunnableConfig): The config with the thread (and checkpoint) to retrieve.
+
+        Returns:
+            Optional[CheckpointTuple]: The checkpoint tuple, or None if there is no checkpoint.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        query += " ORDER BY checkpoint_id DESC LIMIT 1"
+
+        with self.db.connection() as conn:
+            row = conn.execute(query, params).fetchone()
+            return self._make_tuple(conn, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """List the checkpoints matching the criteria, newest first.
+
+        Args:
+            config (Optional[RunnableConfig]): Config with the thread (and namespace / checkpoint) to list.
+            filter (Optional[dict[str, Any]]): Metadata values the checkpoints must have.
+            before (Optional[RunnableConfig]): Only list checkpoints older than this one.
+            limit (Optional[int]): Maximum number of checkpoints to list.
+
+        Yields:
+            Iterator[CheckpointTuple]: The matching checkpoint tuples.
+        """
+        query, params = "SELECT * FROM checkpoints WHERE 1 = 1", []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if (
+                checkpoint_ns := config["configurable"].get("checkpoint_ns")
+            ) is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_checkpoint_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_checkpoint_id)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.db.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+            for row in rows:
+                if limit is not None and limit <= 0:
+                    break
+
+                checkpoint_tuple = self._make_tuple(conn, row)
+                if filter and not all(
+                    checkpoint_tuple.metadata.get(key) == value
+                    for key, value in filter.items()
+                ):
+                    continue
+
+                if limit is not None:
+                    limit -= 1
+                yield checkpoint_tuple
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Store a checkpoint, with the values of the channels that changed in its step.
+
+        Args:
+            config (RunnableConfig): The config of the parent checkpoint.
+            checkpoint (Checkpoint): The checkpoint to store.
+            metadata (CheckpointMetadata): Metadata of the checkpoint.
+            new_versions (ChannelVersions): Channel versions created in this step.
+
+        Returns:
+            RunnableConfig: The config of the stored checkpoint.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+
+        checkpoint = checkpoint.copy()
+        checkpoint.pop("pending_sends", None)
+        channel_values = checkpoint.pop("channel_values")
+
+        blobs = []
+        for channel, version in new_versions.items():
+            if channel in channel_values:
+                type_, blob = self.serde.dumps_typed(channel_values[channel])
+            else:
+                type_, blob = "empty", None
+            blobs.append((thread_id, checkpoint_ns, channel, str(version), type_, blob))
+
+        type_, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    checkpoint_blob,
+                    metadata_type,
+                    metadata_blob,
+                ),
+            )
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Store the intermediate writes of a task.
+
+        Args:
+            config (RunnableConfig): The config of the checkpoint the writes belong to.
+            writes (Sequence[tuple[str, Any]]): The (channel, value) pairs to store.
+            task_id (str): Identifier of the task creating the writes.
+            task_path (str): Path of the task creating the writes.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        # Special writes (errors, interrupts...) replace the previous ones
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        rows = [
+            (
+                thread_id,
+                checkpoint_ns,
+                checkpoint_id,
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self.serde.dumps_typed(value),
+                task_path,
+            )
+            for idx, (channel, value) in enumerate(writes)
+        ]
+
+        with self.db.transaction() as conn:
+            conn.executemany(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO writes "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Asynchronous version of get_tuple, run in a worker thread."""
+        return await run_blocking(self.executor, self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """Asynchronous version of list, run in a worker thread."""
+        checkpoint_tuples = await run_blocking(
+            self.executor,
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit)),
+        )
+        for checkpoint_tuple in checkpoint_tuples:
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Asynchronous version of put, run in a worker thread."""
+        return await run_blocking(
+            self.executor, self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Asynchronous version of put_writes, run in a worker thread."""
+        await run_blocking(
+            self.executor, self.put_writes, config, writes, task_id, task_path
+        )
+
+    def get_next_version(self, current: Optional[str], channel: ChannelProtocol) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        next_v = current_v + 1
+        next_h = random.random()
+        return f"{next_v:032}.{next_h:016}"
+
+    # Maintenance
+    ##############
+    def prune(self, thread_id: str, keep_last: int = 1):
+        """Delete the old checkpoints of a thread, e.g. once its fight is over.
+
+        The latest `keep_last` checkpoints are kept, so the final state of the fight can
+        still be retrieved.
+
+        Args:
+            thread_id (str): The thread to prune.
+            keep_last (int, optional): Number of checkpoints to keep. Defaults to 1.
+        """
+        with self.db.transaction() as conn:
+            kept = conn.execute(
+                """SELECT checkpoint_ns, checkpoint_id, type, checkpoint FROM checkpoints
+                WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT ?""",
+                (thread_id, keep_last),
+            ).fetchall()
+            kept_versions = {
+                (checkpoint_ns, channel, str(version))
+                for checkpoint_ns, _, type_, blob in kept
+                for channel, version in self.serde.loads_typed((type_, blob))[
+                    "channel_versions"
+                ].items()
+            }
+            kept_ids = [
+                (checkpoint_ns, checkpoint_id)
+                for checkpoint_ns, checkpoint_id, _, _ in kept
+            ]
+
+            stale_blobs = [
+                (thread_id, *key)
+                for key in conn.execute(
+                    "SELECT checkpoint_ns, channel, version FROM blobs WHERE thread_id = ?",
+                    (thread_id,),
+                )
+                if key not in kept_versions
+            ]
+            conn.executemany(
+                """DELETE FROM blobs
+                WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?""",
+                stale_blobs,
+            )
+
+            stale_checkpoints = [
+                (thread_id, *key)
+                for key in conn.execute(
+                    "SELECT checkpoint_ns, checkpoint_id FROM checkpoints WHERE thread_id = ?",
+                    (thread_id,),
+                )
+                if key not in kept_ids
+            ]
+            conn.executemany(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                stale_checkpoints,
+            )
+            conn.executemany(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                stale_checkpoints,
+            )
+
+    def thread_size(self, thread_id: str) -> int:
+        """Measure the serialized checkpoints, channel values and writes of a thread.
+
+        Args:
+            thread_id (str): The thread to measure.
+
+        Returns:
+            int: The total size in bytes.
+        """
+        with self.db.connection() as conn:
+            return conn.execute(
+                """SELECT
+                    (SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0)
+                        FROM checkpoints WHERE thread_id = :thread_id)
+                    + (SELECT COALESCE(SUM(LENGTH(blob)), 0)
+                        FROM blobs WHERE thread_id = :thread_id)
+                    + (SELECT COALESCE(SUM(LENGTH(value)), 0)
+                        FROM writes WHERE thread_id = :thread_id)""",
+                {"thread_id": thread_id},
+            ).fetchone()[0]
+
+    def delete_thread(self, thread_id: str):
+        """Delete every checkpoint and write of a thread.
+
+        Args:
+            thread_id (str): The thread to delete.
+        """
+        with self.db.transaction() as conn:
+            for table in ("checkpoints", "blobs", "writes"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
@@ -1,44 +1,644 @@
 """Module with functions and queries to interact with the SQLite database."""
 
+import atexit
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from src.utils.leaderboard import SortedLeaderboard, Standing
+from src.utils.metrics import record_db_time
 
 DATABASE_PATH = "./data"
+DATABASE_FILE = f"{DATABASE_PATH}/agentic_fighters.db"
+
+# Score deltas of each fight outcome
+WIN_SCORE = 3
+DEFEAT_SCORE = -2
+DRAW_SCORE = 1
+
+
+@dataclass(frozen=True)
+class FightResult:
+    """Outcome of a finished fight, as written to the database at the end of it."""
+
+    winner: str
+    loser: str
+    draw: bool = False
+    exp_gain: int = 10
+
+
+class SQLitePool:
+    """Bounded, thread-safe pool of long-lived SQLite connections.
+
+    Connections are opened lazily (up to `pool_size`), configured once with WAL
+    journaling and reused by every query, so the open/PRAGMA cost is paid only once per
+    connection. All queries are parameterized, so SQLite keeps them in each connection's
+    prepared statement cache.
+    """
+
+    def __init__(
+        self, path: str = DATABASE_FILE, pool_size: int = 4, timeout: float = 30.0
+    ):
+        """Initialize the pool. No connection is opened until the first query.
+
+        Args:
+            path (str, optional): Path to the SQLite database file. Defaults to DATABASE_FILE.
+            pool_size (int, optional): Maximum number of open connections. Defaults to 4.
+            timeout (float, optional): Seconds to wait for a free connection or a database lock. Defaults to 30.0.
+        """
+        self.path = path
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    # Connection management
+    ########################
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly in `transaction`
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=128,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.pool_size:
+                self._opened += 1
+                open_new = True
+            else:
+                open_new = False
+
+        if open_new:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        try:
+            return self._pool.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"No database connection available after {self.timeout} seconds"
+            ) from None
+
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._pool.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool, in autocommit mode.
+
+        Yields:
+            sqlite3.Connection: A pooled connection, returned to the pool on exit.
+        """
+        start = time.perf_counter()
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+            record_db_time(time.perf_counter() - start)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection and run the enclosed statements in a single transaction.
+
+        The transaction is committed if the block succeeds and rolled back otherwise.
+
+        Yields:
+            sqlite3.Connection: A pooled connection with an open write transaction.
+        """
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        """Close every idle connection of the pool."""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+class FightersRepository(SQLitePool):
+    """Repository with the queries on the fighters, leaderboard and matchups tables.
+
+    The info of the fighters is cached in memory by name: the fighters table is read
+    once, and again only after a write changes the cached columns. Likewise, the
+    leaderboard is kept sorted in memory for hot reads once `ranking` is first used, and
+    updated with the results recorded by the repository. The caches only see the writes
+    of this process.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize the repository, with the same arguments as `SQLitePool`."""
+        super().__init__(*args, **kwargs)
+
+        self._roster = None
+        self._roster_version = 0  # bumped by every invalidation
+        self._roster_lock = threading.Lock()
+        self._roster_stats = {"hits": 0, "misses": 0, "loads": 0, "invalidations": 0}
+
+        self._ranking = None
+        self._ranking_version = 0  # bumped by every leaderboard write
+        self._ranking_lock = threading.Lock()
+
+    # Roster cache
+    ###############
+    def _cached_roster(self) -> dict[str, dict]:
+        with self._roster_lock:
+            roster, version = self._roster, self._roster_version
+        if roster is not None:
+            return roster
+
+        with self.connection() as conn:
+            rows = conn.execute(
+                """SELECT name, description, health, strength, speed, agility, intelligence, armor, tiredness
+                FROM fighters ORDER BY name"""
+            ).fetchall()
+        roster = {row[0]: self._fighter_info(row) for row in rows}
+
+        with self._roster_lock:
+            # Do not cache a table read that overlapped with a write
+            if self._roster_version == version:
+                self._roster = roster
+            self._roster_stats["loads"] += 1
+        return roster
+
+    def invalidate_roster(self):
+        """Drop the cached info of the fighters, so it is read again on next use."""
+        with self._roster_lock:
+            self._roster = None
+            self._roster_version += 1
+            self._roster_stats["invalidations"] += 1
+
+    def roster_stats(self) -> dict:
+        """Get the statistics of the roster cache.
+
+        Returns:
+            dict: Number of hits, misses, loads of the table and invalidations, and cached fighters.
+        """
+        with self._roster_lock:
+            return {
+                **self._roster_stats,
+                "fighters": len(self._roster) if self._roster is not None else 0,
+            }
+
+    # Ranking cache
+    ################
+    def ranking(self) -> SortedLeaderboard:
+        """Get the in-memory leaderboard, reading the table on first use.
+
+        The returned object is shared and kept up to date by the repository: read it,
+        without any lock, but do not modify it.
+
+        Returns:
+            SortedLeaderboard: The leaderboard sorted by score.
+        """
+        with self._ranking_lock:
+            ranking, version = self._ranking, self._ranking_version
+        if ranking is not None:
+            return ranking
+
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT fighter, wins, defeats, draws, score FROM leaderboard"
+            ).fetchall()
+        ranking = SortedLeaderboard(Standing(*row) for row in rows)
+
+        with self._ranking_lock:
+            # Do not cache a table read that overlapped with a write
+            if self._ranking_version == version:
+                self._ranking = ranking
+        return ranking
+
+    def invalidate_ranking(self):
+        """Drop the in-memory leaderboard, so it is read again on next use."""
+        with self._ranking_lock:
+            self._ranking = None
+            self._ranking_version += 1
+
+    @staticmethod
+    def _fighter_info(row: tuple) -> dict:
+        return {
+            "name": row[0],
+            "description": row[1],
+            "health": row[2],
+            "strength": row[3],
+            "speed": row[4],
+            "agility": row[5],
+            "intelligence": row[6],
+            "armor": row[7],
+            "tiredness": row[8],
+        }
+
+    # Queries
+    ##########
+    def create_tables(self):
+        """Create the necessary tables."""
+        with self.transaction() as conn:
+            # Fighters table
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fighters (
+                    name TEXT PRIMARY KEY,
+                    description TEXT,
+                    health INTEGER,
+                    strength INTEGER,
+                    speed INTEGER,
+                    agility INTEGER,
+                    intelligence INTEGER,
+                    armor INTEGER,
+                    level INTEGER,
+                    exp INTEGER,
+                    tiredness INTEGER
+                )""")
+
+            # Leaderboard table
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leaderboard (
+                    fighter TEXT PRIMARY KEY,
+                    latest_oponent TEXT,
+                    wins INTEGER,
+                    defeats INTEGER,
+                    draws INTEGER,
+                    score INTEGER,
+                    FOREIGN KEY (fighter) REFERENCES fighters(name)
+                )""")
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS leaderboard_score
+                ON leaderboard (score DESC, fighter)""")
+
+            # Head-to-head table, one row per pair of fighters (fighter_a < fighter_b)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS matchups (
+                    fighter_a TEXT,
+                    fighter_b TEXT,
+                    wins_a INTEGER,
+                    wins_b INTEGER,
+                    draws INTEGER,
+                    PRIMARY KEY (fighter_a, fighter_b)
+                ) WITHOUT ROWID""")
+
+    def add_fighter(self, fighter: dict):
+        """Add a fighter to the fighters table, if there's no conflict.
+
+        Args:
+            fighter (dict): A dictionary with the fighter's information.
+        """
+        stats = fighter["stats"]
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                """INSERT INTO fighters (name, description, health, strength, speed, agility, intelligence, armor, level, exp, tiredness)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (name) DO NOTHING""",
+                (
+                    fighter["name"],
+                    fighter["description"],
+                    stats["health"],
+                    stats["strength"],
+                    stats["speed"],
+                    stats["agility"],
+                    stats["intelligence"],
+                    stats["armor"],
+                    stats["level"],
+                    stats["exp"],
+                    stats["tiredness"],
+                ),
+            )
+        if cursor.rowcount:
+            self.invalidate_roster()
+
+    def get_fighter_info(self, fighter_name: str) -> dict:
+        """Get a fighter's information from the database.
+
+        Args:
+            fighter_name (str): The name of the fighter to retrieve information for.
+
+        Returns:
+            dict: A dictionary containing the fighter's information.
+        """
+        roster = self._cached_roster()
+        if fighter_name in roster:
+            with self._roster_lock:
+                self._roster_stats["hits"] += 1
+            return dict(roster[fighter_name])
+
+        # Not cached: the fighter may have been added by another process
+        with self._roster_lock:
+            self._roster_stats["misses"] += 1
+        with self.connection() as conn:
+            row = conn.execute(
+                """SELECT name, description, health, strength, speed, agility, intelligence, armor, tiredness
+                FROM fighters WHERE name = ?""",
+                (fighter_name,),
+            ).fetchone()
+
+        if row:
+            self.invalidate_roster()
+            return self._fighter_info(row)
+        else:
+            raise Exception(f"Fighter {fighter_name} not found!")
+
+    def list_fighters(self) -> list[dict]:
+        """Get the information of every fighter in the database.
+
+        Returns:
+            list[dict]: A dictionary with the information of each fighter.
+        """
+        return [dict(fighter) for fighter in self._cached_roster().values()]
+
+    def update_leaderboard(self, winner: str, loser: str):
+        """Update the leaderboard table with the winner and loser of a fight.
+
+        Args:
+            winner (str): The name of the winner of the fight.
+            loser (str): The name of the loser of the fight.
+        """
+        with self.transaction() as conn:
+            conn.execute(
+                """INSERT INTO leaderboard (fighter, latest_oponent, wins, defeats, draws, score)
+                VALUES (?, ?, 1, 0, 0, 3)
+                ON CONFLICT (fighter) DO UPDATE SET
+                    latest_oponent = excluded.latest_oponent,
+                    wins = wins + 1""",
+                (winner, loser),
+            )
+            conn.execute(
+                """INSERT INTO leaderboard (fighter, latest_oponent, wins, defeats, draws, score)
+                VALUES (?, ?, 0, 1, 0, -2)
+                ON CONFLICT (fighter) DO UPDATE SET
+                    latest_oponent = excluded.latest_oponent,
+                    defeats = defeats + 1""",
+                (loser, winner),
+            )
+        self.invalidate_ranking()
+
+    def record_fight_results(self, results: list[FightResult]):
+        """Write the outcome of a batch of finished fights in a single transaction.
+
+        The fights are aggregated first, so each fighter and each pair of fighters is
+        written once per batch: the wins/defeats/draws counters and the score of the
+        fighters are updated incrementally, as well as their head-to-head record, and
+        the winners get their exp. Either all the fights of the batch are recorded or
+        none of them is.
+
+        Args:
+            results (list[FightResult]): The finished fights to record.
+        """
+        # fighter -> [latest opponent, wins, defeats, draws, score]
+        standings = {}
+        # (fighter_a, fighter_b) -> [wins of a, wins of b, draws]
+        matchups = {}
+        exp = {}
+        for result in results:
+            winner = standings.setdefault(result.winner, [None, 0, 0, 0, 0])
+            loser = standings.setdefault(result.loser, [None, 0, 0, 0, 0])
+            winner[0], loser[0] = result.loser, result.winner
+
+            pair = tuple(sorted((result.winner, result.loser)))
+            matchup = matchups.setdefault(pair, [0, 0, 0])
+            if result.draw:
+                winner[3] += 1
+                winner[4] += DRAW_SCORE
+                loser[3] += 1
+                loser[4] += DRAW_SCORE
+                matchup[2] += 1
+            else:
+                winner[1] += 1
+                winner[4] += WIN_SCORE
+                loser[2] += 1
+                loser[4] += DEFEAT_SCORE
+                matchup[0 if pair[0] == result.winner else 1] += 1
+                exp[result.winner] = exp.get(result.winner, 0) + result.exp_gain
+
+        with self.transaction() as conn:
+            conn.executemany(
+                """INSERT INTO leaderboard (fighter, latest_oponent, wins, defeats, draws, score)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (fighter) DO UPDATE SET
+                    latest_oponent = excluded.latest_oponent,
+                    wins = wins + excluded.wins,
+                    defeats = defeats + excluded.defeats,
+                    draws = draws + excluded.draws,
+                    score = score + excluded.score""",
+                [(fighter, *standing) for fighter, standing in standings.items()],
+            )
+            conn.executemany(
+                """INSERT INTO matchups (fighter_a, fighter_b, wins_a, wins_b, draws)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (fighter_a, fighter_b) DO UPDATE SET
+                    wins_a = wins_a + excluded.wins_a,
+                    wins_b = wins_b + excluded.wins_b,
+                    draws = draws + excluded.draws""",
+                [(*pair, *matchup) for pair, matchup in matchups.items()],
+            )
+            # exp is not part of the cached info of the fighters: no invalidation
+            conn.executemany(
+                "UPDATE fighters SET exp = exp + ? WHERE name = ?",
+                [(gain, fighter) for fighter, gain in exp.items()],
+            )
+
+        # Apply the same deltas to the in-memory leaderboard, if it is loaded
+        with self._ranking_lock:
+            self._ranking_version += 1
+            if self._ranking is not None:
+                self._ranking.apply(
+                    {
+                        fighter: (wins, defeats, draws, score)
+                        for fighter, (
+                            _,
+                            wins,
+                            defeats,
+                            draws,
+                            score,
+                        ) in standings.items()
+                    }
+                )
+
+    def update_scores(self):
+        """Recompute the score of every fighter in the leaderboard.
+
+        `record_fight_results` already keeps the scores up to date: this full rewrite is
+        only needed to repair the table, e.g. after `update_leaderboard`.
+        """
+        with self.transaction() as conn:
+            conn.execute("UPDATE leaderboard SET score = wins*3 - defeats*2 + draws")
+        self.invalidate_ranking()
+
+    def top_fighters(self, limit: int = 10, offset: int = 0) -> list[Standing]:
+        """Get a page of the leaderboard, sorted by score, with the score index.
+
+        Args:
+            limit (int, optional): Number of fighters of the page. Defaults to 10.
+            offset (int, optional): Number of fighters before the page. Defaults to 0.
+
+        Returns:
+            list[Standing]: The records of the fighters of the page, best first.
+        """
+        with self.connection() as conn:
+            rows = conn.execute(
+                """SELECT fighter, wins, defeats, draws, score FROM leaderboard
+                ORDER BY score DESC, fighter LIMIT ? OFFSET ?""",
+                (limit, offset),
+            ).fetchall()
+
+        return [Standing(*row) for row in rows]
+
+    def fighter_rank(self, fighter: str) -> int | None:
+        """Get the rank of a fighter: 1 plus the number of fighters with a higher score.
+
+        Args:
+            fighter (str): The name of the fighter.
+
+        Returns:
+            int | None: The rank of the fighter, or None if it is not in the leaderboard.
+        """
+        with self.connection() as conn:
+            row = conn.execute(
+                """SELECT 1 + (
+                    SELECT COUNT(*) FROM leaderboard WHERE score > target.score
+                ) FROM leaderboard AS target WHERE fighter = ?""",
+                (fighter,),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def head_to_head(self, fighter: str, opponent: str) -> dict:
+        """Get the record of the fights between two fighters.
+
+        Args:
+            fighter (str): The name of the fighter.
+            opponent (str): The name of the opponent.
+
+        Returns:
+            dict: The wins, defeats and draws of `fighter` against `opponent`.
+        """
+        pair = tuple(sorted((fighter, opponent)))
+        with self.connection() as conn:
+            row = conn.execute(
+                """SELECT wins_a, wins_b, draws FROM matchups
+                WHERE fighter_a = ? AND fighter_b = ?""",
+                pair,
+            ).fetchone()
+
+        wins_a, wins_b, draws = row or (0, 0, 0)
+        if pair[0] != fighter:
+            wins_a, wins_b = wins_b, wins_a
+        return {"wins": wins_a, "defeats": wins_b, "draws": draws}
+
+    def add_exp_to_winner(self, winner: str, exp_gain: int = 10):
+        """Add exp to the winner of a fight.
+
+        Args:
+            winner (str): The name of the winner of the fight.
+            exp_gain (int, optional): The amount of exp to add to the winner. Defaults to 10.
+        """
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE fighters SET exp = exp + ? WHERE name = ?", (exp_gain, winner)
+            )
+
+
+class FightResultsBuffer:
+    """Thread-safe buffer of fight results, flushed to the database in batches."""
+
+    def __init__(self, repository: FightersRepository = None, flush_every: int = 100):
+        """Initialize the buffer.
+
+        Args:
+            repository (FightersRepository, optional): Repository to write to. Defaults to the default repository.
+            flush_every (int, optional): Number of buffered results that triggers a flush. Defaults to 100.
+        """
+        self.repository = repository
+        self.flush_every = flush_every
+
+        self._results = []
+        self._lock = threading.Lock()
+
+    def add(self, result: FightResult):
+        """Buffer a fight result, flushing the buffer if it is full.
+
+        Args:
+            result (FightResult): The result of a finished fight.
+        """
+        with self._lock:
+            self._results.append(result)
+            full = len(self._results) >= self.flush_every
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered result in a single transaction."""
+        with self._lock:
+            results, self._results = self._results, []
+        if results:
+            (self.repository or get_repository()).record_fight_results(results)
+
+
+# Default repository, shared by the module-level functions
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository() -> FightersRepository:
+    """Get the default repository, creating it on first use.
+
+    Returns:
+        FightersRepository: The repository used by the module-level functions.
+    """
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                _repository = FightersRepository()
+                atexit.register(_repository.close)
+    return _repository
+
+
+def set_repository(repository: FightersRepository):
+    """Replace the default repository (e.g. to point to another database file).
+
+    Args:
+        repository (FightersRepository): The repository to use from now on.
+    """
+    global _repository
+    with _repository_lock:
+        _repository = repository
 
 
 def create_tables():
     """Create the necessary tables."""
-    conn = sqlite3.connect(f"{DATABASE_PATH}/agentic_fighters.db")
-    cursor = conn.cursor()
-
-    # Fighters table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS fighters (
-            name TEXT PRIMARY KEY,
-            description TEXT,
-            health INTEGER,
-            strength INTEGER,
-            speed INTEGER,
-            agility INTEGER,
-            intelligence INTEGER,
-            armor INTEGER,
-            level INTEGER,
-            exp INTEGER,
-            tiredness INTEGER
-        )""")
-
-    # Leaderboard table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS leaderboard (
-            fighter TEXT PRIMARY KEY,
-            latest_oponent TEXT,
-            wins INTEGER,
-            defeats INTEGER,
-            draws INTEGER,
-            score INTEGER,
-            FOREIGN KEY (fighter) REFERENCES fighters(name)
-        )""")
-
-    conn.commit()
+    get_repository().create_tables()
 
 
 def add_fighter(fighter: dict):
@@ -47,28 +647,7 @@ def add_fighter(fighter: dict):
     Args:
         fighter (dict): A dictionary with the fighter's information.
     """
-    conn = sqlite3.connect(f"{DATABASE_PATH}/agentic_fighters.db")
-    cursor = conn.cursor()
-
-    query = f'''INSERT INTO fighters (name, description, health, strength, speed, agility, intelligence, armor, level, exp, tiredness)
-        VALUES (
-            "{fighter["name"]}",
-            "{fighter["description"]}",
-            {fighter["stats"]["health"]},
-            {fighter["stats"]["strength"]},
-            {fighter["stats"]["speed"]},
-            {fighter["stats"]["agility"]},
-            {fighter["stats"]["intelligence"]},
-            {fighter["stats"]["armor"]},
-            {fighter["stats"]["level"]},
-            {fighter["stats"]["exp"]},
-            {fighter["stats"]["tiredness"]}
-        )
-        ON CONFLICT (name) DO NOTHING'''
-
-    cursor.execute(query)
-
-    conn.commit()
+    get_repository().add_fighter(fighter)
 
 
 def get_fighter_info(fighter_name: str) -> dict:
@@ -80,27 +659,25 @@ def get_fighter_info(fighter_name: str) -> dict:
     Returns:
         dict: A dictionary containing the fighter's information.
     """
-    conn = sqlite3.connect(f"{DATABASE_PATH}/agentic_fighters.db")
-    cursor = conn.cursor()
-
-    cursor.execute(
-        f'''SELECT name, description, health, strength, speed, agility, intelligence, armor, tiredness FROM fighters WHERE name = "{fighter_name}"'''
-    )
-    row = cursor.fetchone()
-    if row:
-        return {
-            "name": row[0],
-            "description": row[1],
-            "health": row[2],
-            "strength": row[3],
-            "speed": row[4],
-            "agility": row[5],
-            "intelligence": row[6],
-            "armor": row[7],
-            "tiredness": row[8],
-        }
-    else:
-        raise Exception(f"Fighter {fighter_name} not found!")
+    return get_repository().get_fighter_info(fighter_name)
+
+
+def list_fighters() -> list[dict]:
+    """Get the information of every fighter in the database.
+
+    Returns:
+        list[dict]: A dictionary with the information of each fighter.
+    """
+    return get_repository().list_fighters()
+
+
+def roster_stats() -> dict:
+    """Get the statistics of the roster cache of the default repository.
+
+    Returns:
+        dict: Number of hits, misses, loads of the table and invalidations, and cached fighters.
+    """
+    return get_repository().roster_stats()
 
 
 def update_leaderboard(winner: str, loser: str):
@@ -110,52 +687,68 @@ def update_leaderboard(winner: str, loser: str):
         winner (str): The name of the winner of the fight.
         loser (str): The name of the loser of the fight.
     """
-    conn = sqlite3.connect(f"{DATABASE_PATH}/agentic_fighters.db")
-    cursor = conn.cursor()
-
-    cursor.execute(f'''
-        INSERT INTO leaderboard (fighter, latest_oponent, wins, defeats, draws, score)
-        VALUES (
-            "{winner}",
-            "{loser}",
-            1,
-            0,
-            0,
-            3
-        ) ON CONFLICT (fighter) DO UPDATE SET
-            latest_oponent = excluded.latest_oponent,
-            wins = wins + 1
-        ''')
-
-    cursor.execute(f'''
-        INSERT INTO leaderboard (fighter, latest_oponent, wins, defeats, draws, score)
-        VALUES (
-            "{loser}",
-            "{winner}",
-            0,
-            1,
-            0,
-            -2
-        ) ON CONFLICT (fighter) DO UPDATE SET
-            latest_oponent = excluded.latest_oponent,
-            defeats = defeats + 1
-        ''')
-
-    conn.commit()
+    get_repository().update_leaderboard(winner, loser)
+
+
+def record_fight_results(results: list[FightResult]):
+    """Write the outcome of a batch of finished fights in a single transaction.
+
+    Args:
+        results (list[FightResult]): The finished fights to record.
+    """
+    get_repository().record_fight_results(results)
 
 
 def update_scores():
-    """_summary_"""
-    conn = sqlite3.connect(f"{DATABASE_PATH}/agentic_fighters.db")
-    cursor = conn.cursor()
+    """Recompute the score of every fighter in the leaderboard."""
+    get_repository().update_scores()
+
 
-    cursor.execute("""
-        UPDATE leaderboard
-        SET
-            score = wins*3 - defeats*2 + draws
-        """)
+def top_fighters(limit: int = 10, offset: int = 0) -> list[Standing]:
+    """Get a page of the leaderboard, sorted by score.
+
+    Args:
+        limit (int, optional): Number of fighters of the page. Defaults to 10.
+        offset (int, optional): Number of fighters before the page. Defaults to 0.
 
-    conn.commit()
+    Returns:
+        list[Standing]: The records of the fighters of the page, best first.
+    """
+    return get_repository().top_fighters(limit, offset)
+
+
+def fighter_rank(fighter: str) -> int | None:
+    """Get the rank of a fighter in the leaderboard.
+
+    Args:
+        fighter (str): The name of the fighter.
+
+    Returns:
+        int | None: The rank of the fighter, or None if it is not in the leaderboard.
+    """
+    return get_repository().fighter_rank(fighter)
+
+
+def head_to_head(fighter: str, opponent: str) -> dict:
+    """Get the record of the fights between two fighters.
+
+    Args:
+        fighter (str): The name of the fighter.
+        opponent (str): The name of the opponent.
+
+    Returns:
+        dict: The wins, defeats and draws of `fighter` against `opponent`.
+    """
+    return get_repository().head_to_head(fighter, opponent)
+
+
+def ranking() -> SortedLeaderboard:
+    """Get the in-memory leaderboard of the default repository, for hot reads.
+
+    Returns:
+        SortedLeaderboard: The leaderboard sorted by score.
+    """
+    return get_repository().ranking()
 
 
 def add_exp_to_winner(winner: str, exp_gain=10):
@@ -165,12 +758,4 @@ def add_exp_to_winner(winner: str, exp_gain=10):
         winner (str): The name of the winner of the fight.
         exp_gain (int, optional): The amount of exp to add to the winner. Defaults to 10.
     """
-    conn = sqlite3.connect(f"{DATABASE_PATH}/agentic_fighters.db")
-    cursor = conn.cursor()
-
-    cursor.execute(f'''
-        UPDATE fighters
-        SET
-            exp = exp + {exp_gain}
-        WHERE name = "{winner}"
-        ''')
+    get_repository().add_exp_to_winner(winner, exp_gain)
@@ -0,0 +1,432 @@
+"""Module with the append-only store of every fight and round, with an exporter and a replay API.
+
+The rounds of a fight are buffered and written in batches, and rows are only ever
+inserted: a row written twice (e.g. when a node runs again after resuming a fight) is
+ignored. Run it from the root directory to export or replay the stored fights:
+
+    python -m src.utils.fight_store export --format jsonl --output rounds.jsonl
+    python -m src.utils.fight_store replay <fight_id> --round 2
+"""
+
+import argparse
+import csv
+import json
+import sys
+import threading
+import time
+from dataclasses import asdict
+from functools import partial
+
+from src.agents.history import FightHistory
+from src.agents.state import (
+    FightDraws,
+    FighterAnalysis,
+    FighterStats,
+    FightState,
+    RoundDraws,
+)
+from src.prompts.prompts import ROUND_START_PROMPT
+from src.utils.databases import DATABASE_FILE, SQLitePool
+
+EXPORT_COLUMNS = (
+    "fight_id",
+    "round",
+    "fighters",
+    "moves",
+    "modifiers",
+    "hit_multipliers",
+    "health",
+    "narration",
+)
+
+
+class FightNotFound(LookupError):
+    """The fight is not in the store."""
+
+
+class FightStore(SQLitePool):
+    """SQLite store of the fights, their rounds and their outcomes."""
+
+    def __init__(self, path: str = DATABASE_FILE, flush_every: int = 100):
+        """Initialize the store, creating its tables if they do not exist.
+
+        Args:
+            path (str, optional): Path to the SQLite database file. Defaults to DATABASE_FILE.
+            flush_every (int, optional): Number of buffered rows that triggers a flush. Defaults to 100.
+        """
+        super().__init__(path, pool_size=2)
+        self.flush_every = flush_every
+
+        self._pending = {"fights": [], "rounds": [], "outcomes": []}
+        self._lock = threading.Lock()
+
+        with self.transaction() as conn:
+            # One row per fight, written when it starts
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fights (
+                    fight_id TEXT PRIMARY KEY,
+                    created_at REAL,
+                    fighters TEXT,
+                    health TEXT,
+                    scenario TEXT,
+                    draws TEXT
+                )""")
+
+            # One row per round, written when it is narrated
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rounds (
+                    fight_id TEXT,
+                    round INTEGER,
+                    moves TEXT,
+                    modifiers TEXT,
+                    hit_multipliers TEXT,
+                    health TEXT,
+                    narration TEXT,
+                    analyses TEXT,
+                    PRIMARY KEY (fight_id, round)
+                ) WITHOUT ROWID""")
+
+            # One row per finished fight
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outcomes (
+                    fight_id TEXT PRIMARY KEY,
+                    winner TEXT,
+                    loser TEXT,
+                    draw INTEGER,
+                    rounds INTEGER
+                )""")
+
+            # Stores created before the draws and analyses were recorded
+            for table, column in (("fights", "draws"), ("rounds", "analyses")):
+                columns = [
+                    row[1] for row in conn.execute(f"PRAGMA table_info({table})")
+                ]
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+
+    # Writes
+    #########
+    def add_fight(
+        self,
+        fight_id: str,
+        fighters: list[FighterStats],
+        health: list[float],
+        scenario: str,
+        draws: FightDraws = None,
+    ):
+        """Buffer the start of a fight.
+
+        Args:
+            fight_id (str): Identifier of the fight, e.g. its thread_id.
+            fighters (list[FighterStats]): The fighters.
+            health (list[float]): Initial health of each fighter.
+            scenario (str): The first entry of the fight evolution.
+            draws (FightDraws, optional): The seed and random draws of the fight. Defaults to None.
+        """
+        fighters = json.dumps([asdict(fighter) for fighter in fighters])
+        self._add(
+            "fights",
+            (
+                fight_id,
+                time.time(),
+                fighters,
+                json.dumps(health),
+                scenario,
+                json.dumps(asdict(draws)) if draws is not None else None,
+            ),
+        )
+
+    def add_round(
+        self,
+        fight_id: str,
+        round_number: int,
+        moves: list[str],
+        modifiers: str,
+        hit_multipliers: list[float],
+        health: list[float],
+        narration: str,
+        analyses: dict[int, FighterAnalysis] = None,
+    ):
+        """Buffer a narrated round.
+
+        Args:
+            fight_id (str): Identifier of the fight.
+            round_number (int): The number of the round.
+            moves (list[str]): Move of each fighter.
+            modifiers (str): Modifiers of the round, as given to the narrator.
+            hit_multipliers (list[float]): Special hit multiplier of each fighter.
+            health (list[float]): Health of each fighter at the end of the round.
+            narration (str): The narration of the round.
+            analyses (dict[int, FighterAnalysis], optional): Analysis of each fighter branch, by fighter index. Defaults to None.
+        """
+        self._add(
+            "rounds",
+            (
+                fight_id,
+                round_number,
+                json.dumps(moves, ensure_ascii=False),
+                modifiers,
+                json.dumps(hit_multipliers),
+                json.dumps(health),
+                narration,
+                json.dumps(
+                    {index: asdict(analysis) for index, analysis in analyses.items()},
+                    ensure_ascii=False,
+                )
+                if analyses
+                else None,
+            ),
+        )
+
+    def add_outcome(
+        self, fight_id: str, winner: str, loser: str, draw: bool, rounds: int
+    ):
+        """Buffer the outcome of a finished fight.
+
+        Args:
+            fight_id (str): Identifier of the fight.
+            winner (str): The name of the winner.
+            loser (str): The name of the loser.
+            draw (bool): Whether the fight was a draw.
+            rounds (int): Number of rounds of the fight.
+        """
+        self._add("outcomes", (fight_id, winner, loser, int(draw), rounds))
+
+    def _add(self, table: str, row: tuple):
+        with self._lock:
+            self._pending[table].append(row)
+            full = sum(map(len, self._pending.values())) >= self.flush_every
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered row in a single transaction."""
+        with self._lock:
+            pending = self._pending
+            self._pending = {table: [] for table in pending}
+        if not any(pending.values()):
+            return
+
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO fights VALUES (?, ?, ?, ?, ?, ?)",
+                pending["fights"],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO rounds VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                pending["rounds"],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO outcomes VALUES (?, ?, ?, ?, ?)",
+                pending["outcomes"],
+            )
+
+    # Reads
+    ########
+    def _raw_rounds(self, fight_id: str = None):
+        """Iterate over the stored rounds, with the lists still encoded as JSON."""
+        query = """SELECT rounds.fight_id, round, fighters, moves, modifiers, hit_multipliers, rounds.health, narration
+            FROM rounds JOIN fights USING (fight_id)"""
+        params = ()
+        if fight_id is not None:
+            query += " WHERE rounds.fight_id = ?"
+            params = (fight_id,)
+        query += " ORDER BY rounds.fight_id, round"
+
+        # The rounds of a fight are consecutive: decode its fighters once
+        current_fight, names = None, None
+        with self.connection() as conn:
+            for row in conn.execute(query, params):
+                if row[0] != current_fight:
+                    current_fight = row[0]
+                    names = json.dumps(
+                        [fighter["name"] for fighter in json.loads(row[2])],
+                        ensure_ascii=False,
+                    )
+                yield (row[0], row[1], names, *row[3:])
+
+    def iter_rounds(self, fight_id: str = None):
+        """Iterate over the stored rounds, reading them from the database as they are consumed.
+
+        Args:
+            fight_id (str, optional): Only the rounds of this fight. Defaults to every fight.
+
+        Yields:
+            dict: The round, with the names of the fighters of the fight.
+        """
+        for row in self._raw_rounds(fight_id):
+            yield {
+                "fight_id": row[0],
+                "round": row[1],
+                "fighters": json.loads(row[2]),
+                "moves": json.loads(row[3]),
+                "modifiers": row[4],
+                "hit_multipliers": json.loads(row[5]),
+                "health": json.loads(row[6]),
+                "narration": row[7],
+            }
+
+    def export(self, file, format: str = "jsonl", fight_id: str = None) -> int:
+        """Export the stored rounds, in constant memory.
+
+        The lists are written as stored, without decoding them.
+
+        Args:
+            file: A text file open for writing.
+            format (str, optional): "jsonl", one JSON object per round, or "csv", with the lists as JSON. Defaults to "jsonl".
+            fight_id (str, optional): Only the rounds of this fight. Defaults to every fight.
+
+        Returns:
+            int: The number of exported rounds.
+        """
+        rows = self._raw_rounds(fight_id)
+        count = 0
+        if format == "csv":
+            writer = csv.writer(file)
+            writer.writerow(EXPORT_COLUMNS)
+            for count, row in enumerate(rows, start=1):
+                writer.writerow(row)
+            return count
+
+        dumps = partial(json.dumps, ensure_ascii=False)
+        for count, row in enumerate(rows, start=1):
+            file.write(
+                f'{{"fight_id": {dumps(row[0])}, "round": {row[1]}, '
+                f'"fighters": {row[2]}, "moves": {row[3]}, '
+                f'"modifiers": {dumps(row[4])}, "hit_multipliers": {row[5]}, '
+                f'"health": {row[6]}, "narration": {dumps(row[7])}}}\n'
+            )
+        return count
+
+    def has_fight(self, fight_id: str) -> bool:
+        """Whether the start of a fight is stored."""
+        with self.connection() as conn:
+            return (
+                conn.execute(
+                    "SELECT 1 FROM fights WHERE fight_id = ?", (fight_id,)
+                ).fetchone()
+                is not None
+            )
+
+    def replay(
+        self, fight_id: str, round_number: int = None, history: FightHistory = None
+    ) -> FightState:
+        """Rebuild the state of a fight at the end of one of its rounds.
+
+        The messages are not stored, so they are not part of the rebuilt state, nor are
+        the draws and analyses of fights stored before they were recorded.
+
+        Args:
+            fight_id (str): Identifier of the fight.
+            round_number (int, optional): The round, 0 for the start of the fight. Defaults to the last stored round.
+            history (FightHistory, optional): The history of the agent that ran the fight, to fold the oldest rounds as it did. Defaults to a FightHistory with the default settings.
+
+        Returns:
+            FightState: The state of the fight, as the graph had it after that round.
+
+        Raises:
+            FightNotFound: If the fight is not stored.
+        """
+        with self.connection() as conn:
+            fight = conn.execute(
+                "SELECT fighters, health, scenario, draws FROM fights WHERE fight_id = ?",
+                (fight_id,),
+            ).fetchone()
+            if fight is None:
+                raise FightNotFound(f"Fight {fight_id} not found!")
+
+            rounds = conn.execute(
+                """SELECT round, moves, hit_multipliers, health, narration, analyses FROM rounds
+                WHERE fight_id = ? AND round <= ? ORDER BY round""",
+                (fight_id, sys.maxsize if round_number is None else round_number),
+            ).fetchall()
+            outcome = conn.execute(
+                "SELECT winner, loser, rounds, draw FROM outcomes WHERE fight_id = ?",
+                (fight_id,),
+            ).fetchone()
+
+        fighters = [FighterStats(**fighter) for fighter in json.loads(fight[0])]
+        state = {
+            "fighter_names": [fighter.name for fighter in fighters],
+            "fighters": fighters,
+            "health": json.loads(fight[1]),
+            "moves": [],
+            "round": 0,
+            "modifiers": "",
+            "hit_multipliers": [1.0] * len(fighters),
+            "analyses": {},
+            "fight_evolution": [fight[2]],
+            "prompt_prefix": fight[2],
+        }
+        if fight[3] is not None:
+            draws = json.loads(fight[3])
+            state["draws"] = FightDraws(
+                draws["seed"], [RoundDraws(**draw) for draw in draws["rounds"]]
+            )
+        for number, moves, hit_multipliers, health, narration, analyses in rounds:
+            state["round"] = number
+            state["moves"] = json.loads(moves)
+            state["hit_multipliers"] = json.loads(hit_multipliers)
+            state["health"] = json.loads(health)
+            state["analyses"] = {
+                int(index): FighterAnalysis(**analysis)
+                for index, analysis in json.loads(analyses or "{}").items()
+            }
+            state["fight_evolution"] += [
+                ROUND_START_PROMPT.format(round=number),
+                narration,
+            ]
+
+        history = history or FightHistory()
+        state["history_summary"], state["summarized_rounds"] = history.fold(
+            state["fight_evolution"], "", 0
+        )
+        if outcome is not None and state["round"] == outcome[2]:
+            state["winner"], state["loser"] = outcome[0], outcome[1]
+            state["fight_evolution"] += [
+                "FIN DE LA PELEA!",
+                f"EMPATE: {outcome[0]} y {outcome[1]}"
+                if outcome[3]
+                else f"GANADOR: {outcome[0]}\nPERDEDOR: {outcome[1]}",
+            ]
+
+        return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default=DATABASE_FILE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="export the stored rounds")
+    export_parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    export_parser.add_argument("--output", help="output file, stdout by default")
+    export_parser.add_argument("--fight-id")
+
+    replay_parser = subparsers.add_parser("replay", help="rebuild the state of a fight")
+    replay_parser.add_argument("fight_id")
+    replay_parser.add_argument("--round", type=int)
+    args = parser.parse_args()
+
+    store = FightStore(args.database)
+    if args.command == "export":
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as f:
+                count = store.export(f, args.format, args.fight_id)
+        else:
+            count = store.export(sys.stdout, args.format, args.fight_id)
+        print(f"{count} rounds exported", file=sys.stderr)
+    else:
+        state = store.replay(args.fight_id, args.round)
+        state["fighters"] = [asdict(fighter) for fighter in state["fighters"]]
+        state["analyses"] = {
+            index: asdict(analysis) for index, analysis in state["analyses"].items()
+        }
+        if "draws" in state:
+            state["draws"] = asdict(state["draws"])
+        print(json.dumps(state, ensure_ascii=False, indent=4))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
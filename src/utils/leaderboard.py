@@ -0,0 +1,116 @@
+"""Module with the in-memory ranking of the leaderboard, for hot reads.
+
+The leaderboard table is the source of truth; `SortedLeaderboard` keeps a copy of it
+sorted by score, updated with the same deltas as the table, so the top fighters and
+the rank of a fighter are read in O(log n) without any query.
+"""
+
+from bisect import bisect_left, insort
+from dataclasses import dataclass, replace
+from typing import Iterable
+
+
+@dataclass(slots=True)
+class Standing:
+    """Record of a fighter in the leaderboard."""
+
+    fighter: str
+    wins: int = 0
+    defeats: int = 0
+    draws: int = 0
+    score: int = 0
+
+
+class SortedLeaderboard:
+    """Leaderboard sorted by descending score, then by fighter name.
+
+    The records and the sorted keys form a snapshot that `apply` rebuilds and swaps in
+    with a single assignment: the reads take no lock and never see half of a batch.
+    """
+
+    def __init__(self, standings: Iterable[Standing] = ()):
+        """Initialize the ranking.
+
+        Args:
+            standings (Iterable[Standing], optional): The current records of the fighters. Defaults to ().
+        """
+        standings = {standing.fighter: standing for standing in standings}
+        keys = sorted(self._key(standing) for standing in standings.values())
+        self._snapshot = standings, keys
+
+    @staticmethod
+    def _key(standing: Standing) -> tuple[int, str]:
+        return -standing.score, standing.fighter
+
+    def __len__(self) -> int:
+        return len(self._snapshot[1])
+
+    def apply(self, deltas: dict[str, tuple[int, int, int, int]]):
+        """Add the deltas of some fights to the records of the fighters.
+
+        The writers must not run at the same time, e.g. by holding a lock.
+
+        Args:
+            deltas (dict[str, tuple[int, int, int, int]]): New wins, defeats, draws and score delta of each fighter.
+        """
+        standings, keys = self._snapshot
+        standings, keys = dict(standings), list(keys)
+        for fighter, (wins, defeats, draws, score) in deltas.items():
+            standing = standings.get(fighter)
+            if standing is None:
+                standing = Standing(fighter)
+            else:
+                del keys[bisect_left(keys, self._key(standing))]
+
+            # The records of the previous snapshot are not modified
+            standing = standings[fighter] = Standing(
+                fighter,
+                standing.wins + wins,
+                standing.defeats + defeats,
+                standing.draws + draws,
+                standing.score + score,
+            )
+            insort(keys, self._key(standing))
+        self._snapshot = standings, keys
+
+    def top(self, limit: int = 10, offset: int = 0) -> list[Standing]:
+        """Get a page of the ranking.
+
+        Args:
+            limit (int, optional): Number of fighters of the page. Defaults to 10.
+            offset (int, optional): Number of fighters before the page. Defaults to 0.
+
+        Returns:
+            list[Standing]: The records of the fighters of the page, best first.
+        """
+        standings, keys = self._snapshot
+        return [
+            replace(standings[fighter]) for _, fighter in keys[offset : offset + limit]
+        ]
+
+    def rank(self, fighter: str) -> int | None:
+        """Get the rank of a fighter: 1 plus the number of fighters with a higher score.
+
+        Args:
+            fighter (str): The name of the fighter.
+
+        Returns:
+            int | None: The rank of the fighter, or None if it is not in the leaderboard.
+        """
+        standings, keys = self._snapshot
+        standing = standings.get(fighter)
+        if standing is None:
+            return None
+        return bisect_left(keys, (-standing.score, "")) + 1
+
+    def get(self, fighter: str) -> Standing | None:
+        """Get the record of a fighter.
+
+        Args:
+            fighter (str): The name of the fighter.
+
+        Returns:
+            Standing | None: A copy of the record, or None if it is not in the leaderboard.
+        """
+        standing = self._snapshot[0].get(fighter)
+        return replace(standing) if standing is not None else None
@@ -0,0 +1,205 @@
+"""Module with the batching of the structured outputs of many concurrent fights.
+
+In a tournament, every fight waits for its own narrator request at the same time. The
+batcher collects the requests made within a short window, up to a maximum batch size,
+and sends them as a single request whose structured output holds one result per
+request, then dispatches each result back to its fight. Fewer, larger requests save
+round-trips at the cost of the time spent waiting for the window to close.
+"""
+
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel, Field, create_model
+
+from src.prompts.prompts import BATCH_PROMPT, BATCH_REQUEST_PROMPT
+from src.utils.logger import logger
+from src.utils.utils import prompt_text
+
+
+class StructuredOutputBatcher:
+    """Batches the structured output requests of the coroutines of an event loop."""
+
+    def __init__(
+        self,
+        model,
+        schema: type[BaseModel],
+        max_batch: int = 8,
+        window: float = 0.05,
+        combine: bool = True,
+    ):
+        """Initialize the batcher.
+
+        Args:
+            model: The chat model.
+            schema (type[BaseModel]): The structured output of each request.
+            max_batch (int, optional): Maximum number of requests in a batch. Defaults to 8.
+            window (float, optional): Seconds to wait for more requests after the first one of a batch. Defaults to 0.05.
+            combine (bool, optional): Whether to send a batch as a single request, or as concurrent requests with the model's `abatch`. Defaults to True.
+        """
+        self.model = model
+        self.schema = schema
+        self.max_batch = max_batch
+        self.window = window
+        self.combine = combine
+        # Structured output of a combined request: a list of results
+        self.batch_schema = create_model(
+            f"{schema.__name__}Batch",
+            results=(
+                list[schema],
+                Field(description="One result per request, in order"),
+            ),
+        )
+
+        self._pending = []  # (context, future, queued_at)
+        self._timer = None
+        self._tasks = set()
+        self._stats = {
+            "batches": 0,
+            "requests": 0,
+            "model_requests": 0,
+            "fallbacks": 0,
+            "wait_seconds": 0.0,
+            "model_seconds": 0.0,
+        }
+
+    async def submit(self, context) -> tuple[BaseModel, float, dict]:
+        """Submit a request and wait for its result.
+
+        Args:
+            context: The prompt of the request (a string or a list of messages).
+
+        Returns:
+            tuple[BaseModel, float, dict]: The result, the latency of the model request that produced it and its share of the token usage.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((context, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Keep a reference to the task until it is done
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list):
+        contexts = [context for context, _, _ in batch]
+        start = time.perf_counter()
+        try:
+            if self.combine and len(batch) > 1:
+                results, usage = await self._combined(contexts)
+            else:
+                results, usage = await self._separate(contexts)
+        except Exception as error:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        seconds = time.perf_counter() - start
+
+        share = _share(usage, len(batch))
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result((result, seconds, share))
+
+        self._stats["batches"] += 1
+        self._stats["requests"] += len(batch)
+        self._stats["wait_seconds"] += sum(start - queued for _, _, queued in batch)
+        self._stats["model_seconds"] += seconds
+
+    async def _combined(self, contexts: list) -> tuple[list[BaseModel], dict]:
+        """Send the requests as a single request, falling back to separate ones if its results do not match."""
+        instructions, requests = _split_instructions(contexts)
+        prompt = BATCH_PROMPT.format(
+            count=len(contexts),
+            requests="\n\n".join(
+                BATCH_REQUEST_PROMPT.format(number=number, context=request)
+                for number, request in enumerate(requests, start=1)
+            ),
+        )
+        if instructions is not None:
+            prompt = [instructions, HumanMessage(content=prompt)]
+        output = await self.model.with_structured_output(
+            self.batch_schema, include_raw=True
+        ).ainvoke(prompt)
+        self._stats["model_requests"] += 1
+        usage = dict(getattr(output["raw"], "usage_metadata", None) or {})
+
+        parsed = output["parsed"]
+        if parsed is not None and len(parsed.results) == len(contexts):
+            return parsed.results, usage
+
+        # The order of the results cannot be trusted: every request is sent again
+        logger.warning(
+            f"Batch of {len(contexts)} requests answered with "
+            f"{len(parsed.results) if parsed else 'no'} results, sending them separately"
+        )
+        self._stats["fallbacks"] += 1
+        results, separate_usage = await self._separate(contexts)
+        return results, _add_usage(usage, separate_usage)
+
+    async def _separate(self, contexts: list) -> tuple[list[BaseModel], dict]:
+        """Send the requests concurrently, with the model's `abatch`."""
+        outputs = await self.model.with_structured_output(
+            self.schema, include_raw=True
+        ).abatch(contexts)
+        self._stats["model_requests"] += len(contexts)
+
+        usage = {}
+        for output in outputs:
+            if output["parsing_error"] is not None:
+                raise output["parsing_error"]
+            usage = _add_usage(usage, getattr(output["raw"], "usage_metadata", None))
+        return [output["parsed"] for output in outputs], usage
+
+    def stats(self) -> dict:
+        """Get the batch sizes, waiting time and model latency of the batches so far."""
+        stats = dict(self._stats)
+        batches = stats["batches"] or 1
+        requests = stats["requests"] or 1
+        stats["mean_batch_size"] = round(stats["requests"] / batches, 2)
+        stats["mean_wait_ms"] = round(stats.pop("wait_seconds") / requests * 1e3, 1)
+        stats["mean_model_ms"] = round(stats.pop("model_seconds") / batches * 1e3, 1)
+        return stats
+
+
+def _split_instructions(contexts: list) -> tuple[SystemMessage | None, list[str]]:
+    """Split the system instructions shared by every request, sent once, from the text of each request."""
+    first = contexts[0]
+    if not isinstance(first, str) and isinstance(first[0], SystemMessage):
+        if all(
+            not isinstance(context, str) and context[0] == first[0]
+            for context in contexts
+        ):
+            return first[0], [prompt_text(context[1:]) for context in contexts]
+    return None, [prompt_text(context) for context in contexts]
+
+
+def _add_usage(usage: dict, other: dict | None) -> dict:
+    total = dict(usage)
+    for key, value in (other or {}).items():
+        if isinstance(value, int):
+            total[key] = total.get(key, 0) + value
+        elif isinstance(value, dict):
+            total[key] = _add_usage(total.get(key, {}), value)
+    return total
+
+
+def _share(usage: dict, requests: int) -> dict:
+    # The token usage of a request of a batch, split evenly
+    return {
+        key: _share(value, requests) if isinstance(value, dict) else value // requests
+        for key, value in usage.items()
+    }
@@ -0,0 +1,178 @@
+"""Module with a persistent, content-addressed cache for the structured outputs of the LLM."""
+
+import hashlib
+import json
+import threading
+import time
+
+from pydantic import BaseModel
+
+from src.utils.databases import DATABASE_PATH, SQLitePool
+
+CACHE_FILE = f"{DATABASE_PATH}/llm_cache.db"
+
+
+def model_signature(model) -> dict:
+    """Get the parameters of a chat model that change its answers.
+
+    Args:
+        model: A chat model, possibly wrapped by `bind_tools`.
+
+    Returns:
+        dict: The model name and temperature.
+    """
+    # Unwrap models with bound tools or structured outputs
+    while hasattr(model, "bound"):
+        model = model.bound
+
+    return {
+        "model": getattr(model, "model_name", None)
+        or getattr(model, "model", None)
+        or type(model).__name__,
+        "temperature": getattr(model, "temperature", None),
+    }
+
+
+class StructuredOutputCache(SQLitePool):
+    """SQLite cache of structured outputs, keyed on the model, its temperature, the output schema and the prompt.
+
+    Entries are evicted in least-recently-used order when the stored outputs exceed
+    `max_bytes`.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, max_bytes: int = 64 * 1024 * 1024):
+        """Initialize the cache, creating its table if it does not exist.
+
+        Args:
+            path (str, optional): Path to the SQLite database file. Defaults to CACHE_FILE.
+            max_bytes (int, optional): Maximum size of the stored outputs. Defaults to 64 MiB.
+        """
+        super().__init__(path, pool_size=2)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+        with self.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS structured_outputs (
+                    key TEXT PRIMARY KEY,
+                    schema TEXT,
+                    value TEXT,
+                    size INTEGER,
+                    last_access REAL
+                )""")
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_structured_outputs_last_access
+                ON structured_outputs (last_access)""")
+            self.total_bytes = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM structured_outputs"
+            ).fetchone()[0]
+
+    @staticmethod
+    def make_key(model, schema: type[BaseModel], prompt) -> str:
+        """Compute the key of a structured output request.
+
+        Args:
+            model: The chat model that answers the request.
+            schema (type[BaseModel]): The structured output schema.
+            prompt: The rendered prompt (a string or a list of messages).
+
+        Returns:
+            str: The SHA-256 hex digest of the request.
+        """
+        if not isinstance(prompt, str):
+            prompt = [(message.type, message.content) for message in prompt]
+
+        content = json.dumps(
+            {
+                **model_signature(model),
+                "schema": schema.model_json_schema(),
+                "prompt": prompt,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, schema: type[BaseModel]):
+        """Get a cached output, refreshing its last access time.
+
+        Args:
+            key (str): The key of the request, from `make_key`.
+            schema (type[BaseModel]): The structured output schema.
+
+        Returns:
+            BaseModel: The cached output, or None if it is not in the cache.
+        """
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT value FROM structured_outputs WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE structured_outputs SET last_access = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+
+        with self._stats_lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return schema.model_validate_json(row[0]) if row else None
+
+    def put(self, key: str, value: BaseModel):
+        """Store an output, evicting the least recently used ones if the cache is full.
+
+        Args:
+            key (str): The key of the request, from `make_key`.
+            value (BaseModel): The structured output.
+        """
+        serialized = value.model_dump_json()
+        size = len(serialized.encode("utf-8"))
+
+        with self.transaction() as conn:
+            previous = conn.execute(
+                "SELECT size FROM structured_outputs WHERE key = ?", (key,)
+            ).fetchone()
+            conn.execute(
+                """INSERT OR REPLACE INTO structured_outputs (key, schema, value, size, last_access)
+                VALUES (?, ?, ?, ?, ?)""",
+                (key, type(value).__name__, serialized, size, time.time()),
+            )
+            total_bytes = self.total_bytes + size - (previous[0] if previous else 0)
+
+            # Evict least recently used entries
+            if total_bytes > self.max_bytes:
+                rows = conn.execute(
+                    "SELECT key, size FROM structured_outputs WHERE key != ? ORDER BY last_access",
+                    (key,),
+                )
+                evicted = []
+                for evicted_key, evicted_size in rows:
+                    if total_bytes <= self.max_bytes:
+                        break
+                    evicted.append((evicted_key,))
+                    total_bytes -= evicted_size
+                conn.executemany(
+                    "DELETE FROM structured_outputs WHERE key = ?", evicted
+                )
+
+            self.total_bytes = total_bytes
+
+    def stats(self) -> dict:
+        """Get the cache statistics.
+
+        Returns:
+            dict: The number of hits, misses, the hit rate and the size of the stored outputs.
+        """
+        with self._stats_lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "bytes": self.total_bytes,
+            }
@@ -1,35 +1,91 @@
-"""Module to configure the logger."""
+"""Module to configure the logger.
 
+Importing the module only creates the logger: its handlers are added by `setup_logging`,
+called by the entry points (src/main.py, src/tournament.py, src/server.py), so importing
+the agent does not create the logs directory, open a file or start a thread.
+
+The console handler writes the records right away, in order with the prints of the
+fight. The file handler runs behind a queue: a background listener thread formats the
+records and writes them to the log file, so the graph never waits for the file I/O.
+"""
+
+import atexit
 import logging
 import os
+import queue
+import threading
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+LOGS_DIR = "./.logs"
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-# HANDLERS
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-
-# File handler
-logs_dir = "./.logs"
-if not os.path.isdir(logs_dir):
-    os.mkdir(logs_dir)
-filename = datetime.today().strftime("%Y%m%d") + ".log"
-file_handler = logging.FileHandler(os.path.join(logs_dir, filename))
-file_handler.setLevel(logging.DEBUG)
-
 # FORMATTERS
 # Console formatter
 console_format = logging.Formatter("%(levelname)s - %(message)s")
-console_handler.setFormatter(console_format)
 
 # File formatter
 file_format = logging.Formatter("%(levelname)s - %(asctime)s - %(message)s")
-file_handler.setFormatter(file_format)
 
-# CRAFTING LOGGER
-# Add handlers to the logger
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+
+# QUEUE
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that leaves the formatting of the records to the listener thread.
+
+    The standard QueueHandler formats each record before queueing it, so that it can be
+    sent to another process. The queue is only read by a thread of this process, so the
+    (possibly lazy) messages are formatted there, and only by the handlers that emit them.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(logs_dir: str = LOGS_DIR) -> QueueListener:
+    """Add the console and file handlers to the logger. Later calls do nothing.
+
+    Args:
+        logs_dir (str, optional): Directory of the daily log files. Defaults to LOGS_DIR.
+
+    Returns:
+        QueueListener: The listener thread writing the records to the log file.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        # HANDLERS
+        # Console handler
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(console_format)
+
+        # File handler
+        os.makedirs(logs_dir, exist_ok=True)
+        filename = datetime.today().strftime("%Y%m%d") + ".log"
+        file_handler = logging.FileHandler(os.path.join(logs_dir, filename))
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(file_format)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        # Drop the records that the file handler would not emit
+        queue_handler.setLevel(file_handler.level)
+        _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        # Write the queued records before exiting
+        atexit.register(_listener.stop)
+
+        # CRAFTING LOGGER
+        # Add handlers to the logger
+        logger.addHandler(console_handler)
+        logger.addHandler(queue_handler)
+
+        return _listener
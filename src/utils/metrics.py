@@ -0,0 +1,508 @@
+"""Module with the metrics of the fight graph: per-node latency, LLM, tool and database time.
+
+`FightMetrics` wraps the nodes of `AgenticFight`. While a node runs, the LLM calls,
+tool calls and database queries it makes are added to its sample through the
+`record_*` functions, which do nothing when no node is instrumented. Each sample is
+aggregated into histograms per node, and the samples of a fight into histograms per
+fight, exported in the Prometheus text format or as JSON. Run it from the root
+directory to report the slowest nodes of an exported file:
+
+    python -m src.utils.metrics metrics.json --top 5
+"""
+
+import argparse
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.runnables.config import ensure_config
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+TOKENS_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+HISTOGRAMS = {
+    "fight_node_seconds": ("Wall time of each node execution.", SECONDS_BUCKETS),
+    "fight_node_llm_seconds": ("LLM time of each node execution.", SECONDS_BUCKETS),
+    "fight_node_db_seconds": ("Database time of each node execution.", SECONDS_BUCKETS),
+    "fight_llm_call_seconds": ("Latency of each LLM call.", SECONDS_BUCKETS),
+    "fight_tool_call_seconds": ("Latency of each tool call.", SECONDS_BUCKETS),
+    "fight_seconds": ("Wall time of the nodes of each fight.", SECONDS_BUCKETS),
+    "fight_tokens": ("LLM tokens of each fight.", TOKENS_BUCKETS),
+}
+COUNTERS = {
+    "fight_llm_calls_total": "LLM calls.",
+    "fight_llm_tokens_total": (
+        "LLM tokens, by kind (prompt, completion, the prefix of the prompts that is the "
+        "same for every round, or the prompt tokens read from the provider cache)."
+    ),
+    "fight_tool_calls_total": "Tool calls.",
+    "fight_tool_memo_hits_total": "Tool calls answered with the result of the same call in the round.",
+    "fight_unfinished_total": (
+        "Fights dropped from the running totals before their end, because a node "
+        "failed or too many fights were running."
+    ),
+}
+
+
+@dataclass(slots=True)
+class NodeSample:
+    """Measures of a single node execution."""
+
+    node: str
+    fight: str
+    llm_seconds: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    prefix_tokens: int = 0
+    cached_tokens: int = 0
+    tool_calls: dict = field(default_factory=dict)
+    db_seconds: float = 0.0
+
+
+# Sample of the node running in the current context, if it is instrumented, and the
+# metrics it belongs to
+_current_sample = contextvars.ContextVar("current_sample", default=None)
+_current_metrics = contextvars.ContextVar("current_metrics", default=None)
+
+
+def record_llm_call(seconds: float, usage: dict = None):
+    """Add an LLM call to the sample of the running node.
+
+    Args:
+        seconds (float): Latency of the call.
+        usage (dict, optional): The usage metadata of the answer, with input and output tokens. Defaults to None.
+    """
+    sample = _current_sample.get()
+    if sample is None:
+        return
+    sample.llm_seconds += seconds
+    sample.llm_calls += 1
+    if usage:
+        sample.prompt_tokens += usage.get("input_tokens", 0)
+        sample.completion_tokens += usage.get("output_tokens", 0)
+        details = usage.get("input_token_details") or {}
+        sample.cached_tokens += details.get("cache_read", 0)
+
+    _current_metrics.get().observe("fight_llm_call_seconds", seconds, node=sample.node)
+
+
+def record_prompt_prefix(tokens: int):
+    """Add the tokens of a prompt prefix to the sample of the running node.
+
+    Args:
+        tokens (int): Estimated tokens of the prefix shared by every round of the fight.
+    """
+    sample = _current_sample.get()
+    if sample is not None:
+        sample.prefix_tokens += tokens
+
+
+def record_tool_call(tool: str, seconds: float):
+    """Add a tool call to the sample of the running node.
+
+    Args:
+        tool (str): The name of the tool.
+        seconds (float): Latency of the call.
+    """
+    sample = _current_sample.get()
+    if sample is None:
+        return
+    sample.tool_calls[tool] = sample.tool_calls.get(tool, 0) + 1
+
+    _current_metrics.get().observe("fight_tool_call_seconds", seconds, tool=tool)
+
+
+def record_tool_memo_hit(tool: str):
+    """Count a tool call answered from the memo of the round of the running node.
+
+    Args:
+        tool (str): The name of the tool.
+    """
+    if _current_sample.get() is not None:
+        _current_metrics.get().inc("fight_tool_memo_hits_total", tool=tool)
+
+
+def record_db_time(seconds: float):
+    """Add database time to the sample of the running node.
+
+    Args:
+        seconds (float): Time spent waiting for and using a database connection.
+    """
+    sample = _current_sample.get()
+    if sample is not None:
+        sample.db_seconds += seconds
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, as in Prometheus."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile, interpolating linearly inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": self.counts,
+            "sum": self.sum,
+            "count": self.count,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Histogram":
+        histogram = cls(tuple(data["buckets"]))
+        histogram.counts = data["counts"]
+        histogram.sum = data["sum"]
+        histogram.count = data["count"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class FightMetrics:
+    """Thread-safe registry of the histograms and counters of the fight graph."""
+
+    def __init__(self, max_fights: int = 10_000):
+        """Initialize the registry.
+
+        Args:
+            max_fights (int, optional): Number of running fights whose totals are kept, the least recently active ones are dropped. Defaults to 10_000.
+        """
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> value
+        self._fights = OrderedDict()  # fight -> running totals, least recent first
+        self.max_fights = max_fights
+        self._lock = threading.Lock()
+
+    # Recording
+    ############
+    def observe(self, name: str, value: float, **labels):
+        """Add a value to a histogram.
+
+        Args:
+            name (str): The name of the histogram, one of HISTOGRAMS.
+            value (float): The observed value.
+            **labels: The labels of the histogram.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase a counter.
+
+        Args:
+            name (str): The name of the counter, one of COUNTERS.
+            value (float, optional): The increment. Defaults to 1.
+            **labels: The labels of the counter.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def instrument(self, node: str, func, ends_fight: bool = False):
+        """Wrap a node, synchronous or asynchronous, to record a sample of each execution.
+
+        Args:
+            node (str): The name of the node.
+            func: The node function.
+            ends_fight (bool, optional): Whether the fight is over after the node. Defaults to False.
+
+        Returns:
+            The wrapped node, with the same signature.
+        """
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                sample, tokens = self._start(node)
+                start = time.perf_counter()
+                failed = True
+                try:
+                    result = await func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    self._finish(
+                        sample, tokens, time.perf_counter() - start, ends_fight, failed
+                    )
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                sample, tokens = self._start(node)
+                start = time.perf_counter()
+                failed = True
+                try:
+                    result = func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    self._finish(
+                        sample, tokens, time.perf_counter() - start, ends_fight, failed
+                    )
+
+        return wrapper
+
+    def _start(self, node: str):
+        fight = ensure_config().get("configurable", {}).get("thread_id", "")
+        sample = NodeSample(node, fight)
+        return sample, (_current_sample.set(sample), _current_metrics.set(self))
+
+    def _finish(
+        self, sample: NodeSample, tokens, wall: float, ends_fight: bool, failed: bool
+    ):
+        _current_sample.reset(tokens[0])
+        _current_metrics.reset(tokens[1])
+
+        node = sample.node
+        self.observe("fight_node_seconds", wall, node=node)
+        self.observe("fight_node_llm_seconds", sample.llm_seconds, node=node)
+        self.observe("fight_node_db_seconds", sample.db_seconds, node=node)
+        if sample.llm_calls:
+            self.inc("fight_llm_calls_total", sample.llm_calls, node=node)
+            self.inc(
+                "fight_llm_tokens_total", sample.prompt_tokens, node=node, kind="prompt"
+            )
+            self.inc(
+                "fight_llm_tokens_total",
+                sample.completion_tokens,
+                node=node,
+                kind="completion",
+            )
+        for kind in ("prefix", "cached"):
+            if value := getattr(sample, f"{kind}_tokens"):
+                self.inc("fight_llm_tokens_total", value, node=node, kind=kind)
+        for tool, calls in sample.tool_calls.items():
+            self.inc("fight_tool_calls_total", calls, node=node, tool=tool)
+
+        # Totals of the fight, observed when it is over. A failed node ends the fight
+        # too, and the fights that are abandoned are dropped once there are too many
+        with self._lock:
+            totals = self._fights.pop(sample.fight, [0.0, 0])
+            totals[0] += wall
+            totals[1] += sample.prompt_tokens + sample.completion_tokens
+            if not ends_fight and not failed:
+                self._fights[sample.fight] = totals
+            unfinished = int(failed)
+            while len(self._fights) > self.max_fights:
+                self._fights.popitem(last=False)
+                unfinished += 1
+        if ends_fight and not failed:
+            self.observe("fight_seconds", totals[0])
+            self.observe("fight_tokens", totals[1])
+        if unfinished:
+            self.inc("fight_unfinished_total", unfinished)
+
+    # Export
+    #########
+    def to_json(self) -> dict:
+        """Get every histogram and counter, as a JSON-serializable dictionary."""
+        with self._lock:
+            return {
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.to_dict()}
+                    for (name, labels), histogram in sorted(self._histograms.items())
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+            }
+
+    def dump(self, path: str):
+        """Write the metrics to a JSON file.
+
+        Args:
+            path (str): Path to the JSON file.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Get the metrics in the Prometheus text exposition format."""
+        data = self.to_json()
+        lines, described = [], set()
+
+        def describe(name, kind, help_text):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for entry in data["histograms"]:
+            name = entry["name"]
+            describe(name, "histogram", HISTOGRAMS[name][0])
+            cumulative = 0
+            bounds = [*entry["buckets"], "+Inf"]
+            for bound, count in zip(bounds, entry["counts"]):
+                cumulative += count
+                labels = _labels({**entry["labels"], "le": bound})
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            lines.append(f"{name}_sum{_labels(entry['labels'])} {entry['sum']}")
+            lines.append(f"{name}_count{_labels(entry['labels'])} {entry['count']}")
+        for entry in data["counters"]:
+            name = entry["name"]
+            describe(name, "counter", COUNTERS[name])
+            lines.append(f"{name}{_labels(entry['labels'])} {entry['value']}")
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve the metrics in the Prometheus format at http://host:port/metrics, in a daemon thread.
+
+        Args:
+            port (int, optional): The port. Defaults to 9464.
+            host (str, optional): The host. Defaults to "127.0.0.1".
+
+        Returns:
+            ThreadingHTTPServer: The server, to shut it down.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_prometheus().encode()
+                self.send_response(200 if self.path == "/metrics" else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{key}="{_label_value(value)}"' for key, value in labels.items())
+        + "}"
+    )
+
+
+def _label_value(value) -> str:
+    # Backslashes, double quotes and line feeds are escaped in the text format
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def report(data: dict, top: int = 10) -> str:
+    """Render the slowest nodes of some exported metrics.
+
+    Args:
+        data (dict): The metrics, as returned by `FightMetrics.to_json`.
+        top (int, optional): Number of nodes to show. Defaults to 10.
+
+    Returns:
+        str: A table of the nodes, sorted by total wall time.
+    """
+    histograms = {
+        (entry["name"], entry["labels"].get("node")): Histogram.from_dict(entry)
+        for entry in data["histograms"]
+        if "node" in entry["labels"] and entry["name"].startswith("fight_node_")
+    }
+    nodes = sorted(
+        {node for name, node in histograms if name == "fight_node_seconds"},
+        key=lambda node: histograms["fight_node_seconds", node].sum,
+        reverse=True,
+    )
+    total = sum(histograms["fight_node_seconds", node].sum for node in nodes) or 1.0
+    tokens = {}
+    for entry in data["counters"]:
+        if entry["name"] == "fight_llm_tokens_total" and entry["labels"].get(
+            "kind"
+        ) in ("prompt", "completion"):
+            node = entry["labels"]["node"]
+            tokens[node] = tokens.get(node, 0) + entry["value"]
+
+    lines = [
+        f"{'node':>18} {'calls':>7} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9} "
+        f"{'total':>9} {'share':>6} {'llm':>6} {'db':>6} {'tokens':>8}"
+    ]
+    for node in nodes[:top]:
+        wall = histograms["fight_node_seconds", node]
+        llm = histograms.get(("fight_node_llm_seconds", node))
+        db = histograms.get(("fight_node_db_seconds", node))
+        lines.append(
+            f"{node:>18} {wall.count:>7} {wall.sum / wall.count * 1e3:>7.1f}ms "
+            f"{wall.quantile(0.5) * 1e3:>7.1f}ms {wall.quantile(0.95) * 1e3:>7.1f}ms "
+            f"{wall.max * 1e3:>7.1f}ms {wall.sum:>8.2f}s {wall.sum / total:>6.1%} "
+            f"{(llm.sum if llm else 0) / (wall.sum or 1):>6.1%} "
+            f"{(db.sum if db else 0) / (wall.sum or 1):>6.1%} {tokens.get(node, 0):>8,}"
+        )
+
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the slowest nodes of the fight graph"
+    )
+    parser.add_argument(
+        "path", help="metrics JSON file, as written by FightMetrics.dump"
+    )
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.path, "r", encoding="utf-8") as f:
+        print(report(json.load(f), args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Module with the pacing policies, i.e. the delays added between the steps of a fight."""
+
+import asyncio
+import time
+
+
+class NoPacing:
+    """Pacing policy without any delay, for batch runs and servers."""
+
+    def pause(self):
+        """Wait before continuing with the next step (here, not at all)."""
+
+    async def apause(self):
+        """Asynchronous version of `pause`."""
+
+
+class DelayPacing(NoPacing):
+    """Pacing policy that waits a fixed time after each step, so a human can follow the fight."""
+
+    def __init__(self, seconds: float = 3):
+        """Initialize the policy.
+
+        Args:
+            seconds (float, optional): Delay after each step, in seconds. Defaults to 3.
+        """
+        self.seconds = seconds
+
+    def pause(self):
+        """Wait `seconds`, blocking the current thread only."""
+        time.sleep(self.seconds)
+
+    async def apause(self):
+        """Wait `seconds` without blocking the event loop."""
+        await asyncio.sleep(self.seconds)
@@ -0,0 +1,63 @@
+"""Module with the in-memory cache of the fighters file."""
+
+import json
+import os
+import threading
+
+FIGHTERS_FILE = "./src/prompts/fighters.json"
+
+
+class FightersFile:
+    """Fighters file parsed once, and parsed again only when its mtime changes."""
+
+    def __init__(self, path: str = FIGHTERS_FILE):
+        """Initialize the cache. The file is not read until the first `load`.
+
+        Args:
+            path (str, optional): Path to the fighters file. Defaults to FIGHTERS_FILE.
+        """
+        self.path = path
+
+        self._mtime = None
+        self._fighters = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "loads": 0}
+
+    def __getstate__(self) -> dict:
+        # The lock belongs to a process, the parsed fighters are kept
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def load(self) -> tuple[dict, bool]:
+        """Get the fighters of the file, reading it only if it changed since the last load.
+
+        Returns:
+            tuple[dict, bool]: The fighters, as in the file, and whether they were read again.
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        with self._lock:
+            if mtime == self._mtime:
+                self._stats["hits"] += 1
+                return self._fighters, False
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            fighters = json.load(f)
+
+        with self._lock:
+            self._mtime, self._fighters = mtime, fighters
+            self._stats["loads"] += 1
+        return fighters, True
+
+    def stats(self) -> dict:
+        """Get the statistics of the cache.
+
+        Returns:
+            dict: Number of loads served from memory and of reads of the file.
+        """
+        with self._lock:
+            return dict(self._stats)
@@ -1,12 +1,89 @@
 """Module with utility functions."""
 
+import asyncio
+import contextvars
+import dataclasses
+import functools
+import importlib
 import json
-import time
+import logging
+import pickle
+import sys
 
+from src.utils.pacing import DelayPacing
 
-def tprint(text: str, secs: int = 2):
+FIRST_KEYS = ("messages", "fight_evolution")
+
+
+def tprint(text: str, secs: int = 2, pacing=None):
+    print(f"{text}\n")
+    (pacing or DelayPacing(secs)).pause()
+
+
+async def atprint(text: str, secs: int = 2, pacing=None):
     print(f"{text}\n")
-    time.sleep(secs)
+    await (pacing or DelayPacing(secs)).apause()
+
+
+async def run_blocking(executor, func, *args):
+    """Run a blocking call in a worker thread, with the context variables of the caller.
+
+    Like asyncio.to_thread, but in the given executor, so that a component can size
+    its own threads without replacing the default executor of the event loop.
+
+    Args:
+        executor (Executor): The executor, None for the default one of the event loop.
+        func (Callable): The blocking function.
+        *args: Its arguments.
+
+    Returns:
+        Any: What the function returns.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(context.run, func, *args)
+    )
+
+
+def tool_reference(tool) -> tuple[str, str]:
+    """Module and name of a tool defined at the top level of a module, to pickle it.
+
+    Args:
+        tool (BaseTool): Tool made with the @tool decorator.
+
+    Returns:
+        tuple[str, str]: The module and the name of the tool, see `resolve_tool`.
+    """
+    func = tool.func or tool.coroutine
+    module, name = func.__module__, func.__qualname__
+    if getattr(sys.modules.get(module), name, None) is not tool:
+        raise pickle.PicklingError(
+            f"Tool {tool.name} is not defined at the top level of a module"
+        )
+    return module, name
+
+
+def resolve_tool(reference: tuple[str, str]):
+    """Get the tool of a `tool_reference`, importing its module if needed."""
+    module, name = reference
+    return getattr(importlib.import_module(module), name)
+
+
+def message_text(message) -> str:
+    """Get the text of a message, joining the parts of a list content."""
+    if isinstance(message.content, str):
+        return message.content
+    return "\n\n".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in message.content
+    )
+
+
+def prompt_text(prompt) -> str:
+    """Get the text of a prompt: a string, or the text of its messages."""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n\n".join(message_text(message) for message in prompt)
 
 
 def pop_persisted_keys(state, keys=["messages", "fight_evolution"]):
@@ -16,19 +93,92 @@ def pop_persisted_keys(state, keys=["messages", "fight_evolution"]):
     return state
 
 
-def log_state(logger, state):
-    state_log = {}
-    if "messages" in state.keys():
-        state_log["messages"] = [msg.content for msg in state["messages"]]
-    if "fight_evolution" in state.keys():
-        state_log["fight_evolution"] = state["fight_evolution"]
+def log_state(logger, state, previous=None, level: int = logging.DEBUG):
+    """Log a state, or what changed in it, without serializing it unless it is written.
 
-    state_log.update(
-        {
-            key: value
-            for key, value in state.items()
-            if key not in ["messages", "fight_evolution"]
-        }
+    Args:
+        logger: The logger.
+        state: The state, or the update of a node.
+        previous (optional): The previous state. If given, only the keys that changed are logged, and only the new items of the lists that grew. Defaults to None.
+        level (int, optional): The level of the record. Defaults to logging.DEBUG.
+    """
+    if not will_emit(logger, level):
+        return
+
+    # Shallow copies: the record may be serialized later, in the logging thread
+    logger.log(
+        level,
+        StateLog(dict(state), None if previous is None else dict(previous)),
     )
 
-    logger.debug(json.dumps(state_log, indent=4))
+
+def will_emit(logger, level: int) -> bool:
+    """Whether any handler of the logger, or of its parents, would emit a record of the level."""
+    if not logger.isEnabledFor(level):
+        return False
+
+    current = logger
+    while current is not None:
+        if any(level >= handler.level for handler in current.handlers):
+            return True
+        if not current.propagate:
+            break
+        current = current.parent
+
+    return False
+
+
+class StateLog:
+    """Log message of a state, serialized to JSON the first time it is formatted."""
+
+    __slots__ = ("state", "previous", "_text")
+
+    def __init__(self, state: dict, previous: dict = None):
+        self.state = state
+        self.previous = previous
+        self._text = None
+
+    def __str__(self) -> str:
+        if self._text is None:
+            state = self.state if self.previous is None else self.diff()
+            # The messages and the fight evolution first, then the other keys
+            keys = sorted(state, key=lambda key: key.split(" ")[0] not in FIRST_KEYS)
+            self._text = json.dumps(
+                {key: _log_value(key, state[key]) for key in keys},
+                indent=4,
+                default=_to_json,
+            )
+        return self._text
+
+    def diff(self) -> dict:
+        """Keys of the state that changed, with only the new items of the lists that grew."""
+        changes = {}
+        for key, value in self.state.items():
+            old = self.previous.get(key)
+            if value is old or value == old:
+                continue
+            if (
+                isinstance(value, list)
+                and isinstance(old, list)
+                and len(value) > len(old)
+                and value[: len(old)] == old
+            ):
+                changes[f"{key} (+{len(value) - len(old)})"] = value[len(old) :]
+            else:
+                changes[key] = value
+
+        return changes
+
+
+def _log_value(key: str, value):
+    # Only the content of the messages is logged
+    if key.startswith("messages"):
+        return [message.content for message in value]
+    return value
+
+
+def _to_json(value):
+    # Fallback for the values json does not know how to serialize, e.g. FighterStats
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    return str(value)
@@ -0,0 +1,220 @@
+"""Tests of the SQLite checkpointer: round trip, pruning and resuming a fight.
+
+Run them from the root directory:
+
+    python -m unittest discover tests
+"""
+
+import asyncio
+import operator
+import os
+import pickle
+import tempfile
+import unittest
+from typing import Annotated, TypedDict
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Send
+
+from src.utils.checkpointer import SQLiteSaver
+
+
+def make_checkpoint(step: int, channel_values: dict, channel_versions: dict) -> dict:
+    checkpoint = empty_checkpoint()
+    checkpoint["id"] = f"checkpoint-{step:04}"
+    checkpoint["channel_values"] = channel_values
+    checkpoint["channel_versions"] = channel_versions
+    return checkpoint
+
+
+class TinyState(TypedDict, total=False):
+    items: Annotated[list[int], operator.add]
+    moves: list[str]
+
+
+def build_graph(checkpointer: SQLiteSaver):
+    """Graph shaped like the fight: interrupted before the moves, then a fan-out."""
+    builder = StateGraph(TinyState)
+    builder.add_node("prepare", lambda state: {"items": [0]})
+    builder.add_node("characters_moves", lambda state: {})
+    builder.add_node("branch", lambda branch: {"items": [branch["value"]]})
+    builder.add_edge(START, "prepare")
+    builder.add_edge("prepare", "characters_moves")
+    builder.add_conditional_edges(
+        "characters_moves",
+        lambda state: [
+            Send("branch", {"value": index})
+            for index in range(1, len(state["moves"]) + 1)
+        ],
+        ["branch"],
+    )
+    builder.add_edge("branch", END)
+    return builder.compile(
+        interrupt_before=["characters_moves"], checkpointer=checkpointer
+    )
+
+
+class SQLiteSaverTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "checkpoints.db")
+        self.savers = []
+
+    def tearDown(self):
+        for saver in self.savers:
+            saver.db.close()
+        self.tmp_dir.cleanup()
+
+    def saver(self, **kwargs) -> SQLiteSaver:
+        saver = SQLiteSaver(self.path, **kwargs)
+        self.savers.append(saver)
+        return saver
+
+    def put_steps(self, saver: SQLiteSaver, thread_id: str, steps: int) -> dict:
+        """Store `steps` checkpoints where only the channel "round" changes after the first."""
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        for step in range(1, steps + 1):
+            new_versions = {"round": step}
+            if step == 1:
+                new_versions["fighters"] = 1
+            checkpoint = make_checkpoint(
+                step,
+                {"round": step, "fighters": ["Carlos", "Alejandro"]},
+                {"round": step, "fighters": 1},
+            )
+            config = saver.put(config, checkpoint, {"step": step}, new_versions)
+        return config
+
+    # Round trip
+    #############
+    def test_round_trip(self):
+        saver = self.saver()
+        config = self.put_steps(saver, "fight", 3)
+        saver.put_writes(config, [("moves", ["puñetazo", "patada"])], "task-1")
+
+        # A new checkpointer reads what the first one stored
+        checkpoint_tuple = self.saver().get_tuple(
+            {"configurable": {"thread_id": "fight"}}
+        )
+        self.assertEqual(checkpoint_tuple.config, config)
+        self.assertEqual(
+            checkpoint_tuple.checkpoint["channel_values"],
+            {"round": 3, "fighters": ["Carlos", "Alejandro"]},
+        )
+        self.assertEqual(checkpoint_tuple.metadata["step"], 3)
+        self.assertEqual(
+            checkpoint_tuple.parent_config["configurable"]["checkpoint_id"],
+            "checkpoint-0002",
+        )
+        self.assertEqual(
+            checkpoint_tuple.pending_writes,
+            [("task-1", "moves", ["puñetazo", "patada"])],
+        )
+
+    def test_list_and_async_methods(self):
+        saver = self.saver()
+        self.put_steps(saver, "fight", 3)
+        thread = {"configurable": {"thread_id": "fight"}}
+
+        ids = [
+            checkpoint_tuple.config["configurable"]["checkpoint_id"]
+            for checkpoint_tuple in saver.list(thread)
+        ]
+        self.assertEqual(ids, ["checkpoint-0003", "checkpoint-0002", "checkpoint-0001"])
+        self.assertEqual(len(list(saver.list(thread, limit=2))), 2)
+        self.assertEqual(
+            [t.metadata["step"] for t in saver.list(thread, filter={"step": 1})], [1]
+        )
+
+        async def read():
+            latest = await saver.aget_tuple(thread)
+            listed = [
+                checkpoint_tuple async for checkpoint_tuple in saver.alist(thread)
+            ]
+            return latest, listed
+
+        latest, listed = asyncio.run(read())
+        self.assertEqual(latest.checkpoint["channel_values"]["round"], 3)
+        self.assertEqual(len(listed), 3)
+
+    def test_unchanged_channels_are_stored_once(self):
+        saver = self.saver()
+        self.put_steps(saver, "fight", 3)
+        with saver.db.connection() as conn:
+            versions = conn.execute(
+                "SELECT channel, COUNT(*) FROM blobs GROUP BY channel"
+            ).fetchall()
+        self.assertEqual(dict(versions), {"fighters": 1, "round": 3})
+
+    # Maintenance
+    ##############
+    def test_prune_keeps_the_latest_checkpoints(self):
+        saver = self.saver()
+        config = self.put_steps(saver, "fight", 4)
+        self.put_steps(saver, "other fight", 3)
+        size = saver.thread_size("fight")
+
+        saver.prune("fight")
+
+        thread = {"configurable": {"thread_id": "fight"}}
+        remaining = list(saver.list(thread))
+        self.assertEqual([t.config for t in remaining], [config])
+        # The values of the channels written in older steps are kept
+        self.assertEqual(
+            self.saver().get_tuple(thread).checkpoint["channel_values"],
+            {"round": 4, "fighters": ["Carlos", "Alejandro"]},
+        )
+        self.assertLess(saver.thread_size("fight"), size)
+        other_thread = {"configurable": {"thread_id": "other fight"}}
+        self.assertEqual(len(list(saver.list(other_thread))), 3)
+
+        saver.prune("other fight", keep_last=2)
+        self.assertEqual([t.metadata["step"] for t in saver.list(other_thread)], [3, 2])
+
+    def test_delete_thread(self):
+        saver = self.saver()
+        self.put_steps(saver, "fight", 2)
+        saver.delete_thread("fight")
+        self.assertIsNone(saver.get_tuple({"configurable": {"thread_id": "fight"}}))
+        self.assertEqual(saver.thread_size("fight"), 0)
+
+    # Resume
+    #########
+    def test_resume_an_interrupted_graph(self):
+        thread = {"configurable": {"thread_id": "fight"}}
+        build_graph(self.saver()).invoke({"items": []}, thread)
+
+        # Another process opens the same database and resumes the fight
+        graph = build_graph(pickle.loads(pickle.dumps(self.saver())))
+        self.savers.append(graph.checkpointer)
+        self.assertEqual(graph.get_state(thread).next, ("characters_moves",))
+        graph.update_state(thread, {"moves": ["puñetazo", "patada"]})
+        graph.invoke(None, thread)
+
+        snapshot = graph.get_state(thread)
+        self.assertEqual(snapshot.next, ())
+        self.assertEqual(sorted(snapshot.values["items"]), [0, 1, 2])
+
+        # Only the final state of a finished fight is kept
+        graph.checkpointer.prune("fight")
+        self.assertEqual(len(list(graph.checkpointer.list(thread))), 1)
+        self.assertEqual(sorted(graph.get_state(thread).values["items"]), [0, 1, 2])
+
+    def test_resume_asynchronously(self):
+        thread = {"configurable": {"thread_id": "fight"}}
+
+        async def run():
+            graph = build_graph(self.saver())
+            await graph.ainvoke({"items": []}, thread)
+            await graph.aupdate_state(thread, {"moves": ["a", "b", "c"]})
+            await graph.ainvoke(None, thread)
+            return await graph.aget_state(thread)
+
+        snapshot = asyncio.run(run())
+        self.assertEqual(snapshot.next, ())
+        self.assertEqual(sorted(snapshot.values["items"]), [0, 1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
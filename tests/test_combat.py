@@ -0,0 +1,117 @@
+"""Tests of the combat engine: the draws and rounds of a fight only depend on its seed.
+
+Run them from the root directory:
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from langchain_core.messages import SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import modifiers, special_hits
+from src.agents.combat import CombatEngine
+from src.agents.fake_llm import FakeFightModel
+from src.agents.state import FighterStats
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+
+FIGHTER_STATS = [
+    FighterStats("Carlos", "", strength=6, agility=4, intelligence=5, armor=3),
+    FighterStats("Alejandro", "", strength=5, agility=6, intelligence=4, armor=2),
+]
+
+
+def play_fight(engine: CombatEngine, thread_id: str) -> list[dict]:
+    """Play a fight on the fake model, with a new checkpointer.
+
+    Returns:
+        list[dict]: The draws, round, health and winner of the state after each graph step.
+    """
+    abot = AgenticFight(
+        FakeFightModel(),
+        [special_hits, modifiers],
+        checkpointer=MemorySaver(),
+        combat=engine,
+        on_result=lambda result: None,
+    )
+    thread = {"configurable": {"thread_id": thread_id}}
+    abot.graph.invoke(
+        {"messages": [SystemMessage(content="")], "fighter_names": list(FIGHTERS)},
+        thread,
+    )
+    steps = []
+    while True:
+        values = abot.graph.get_state(thread).values
+        steps.append(
+            {key: values.get(key) for key in ("draws", "round", "health", "winner")}
+        )
+        if not abot.graph.get_state(thread).next:
+            return steps
+        abot.graph.update_state(thread, {"moves": MOVES[values["round"] % len(MOVES)]})
+        abot.graph.invoke(None, thread)
+
+
+class CombatEngineTest(unittest.TestCase):
+    # Draws
+    ########
+    def test_same_seed_and_thread_give_the_same_draws(self):
+        draws = CombatEngine(seed=7).draw_fight("tournament-3", 2)
+        self.assertEqual(CombatEngine(seed=7).draw_fight("tournament-3", 2), draws)
+        self.assertEqual(len(draws.rounds), 3)
+        self.assertEqual(len(draws.round(1).special_hits), 2)
+
+        self.assertNotEqual(CombatEngine(seed=7).draw_fight("tournament-4", 2), draws)
+        self.assertNotEqual(CombatEngine(seed=8).draw_fight("tournament-3", 2), draws)
+
+    # Rounds
+    #########
+    def test_same_seed_and_thread_give_the_same_rounds(self):
+        def rounds(engine: CombatEngine) -> list:
+            draws = engine.draw_fight("tournament-3", 2)
+            health, outcomes = [50.0, 50.0], []
+            for round_number in range(1, 4):
+                health, attacks = engine.resolve_round(
+                    engine.round_rng(draws.seed, round_number),
+                    FIGHTER_STATS,
+                    health,
+                    draws.round(round_number).special_hits,
+                )
+                outcomes.append((health, attacks))
+            return outcomes
+
+        self.assertEqual(rounds(CombatEngine(seed=7)), rounds(CombatEngine(seed=7)))
+        self.assertEqual(
+            CombatEngine(seed=7).simulate_fight(FIGHTER_STATS, [50, 50], "fight"),
+            CombatEngine(seed=7).simulate_fight(FIGHTER_STATS, [50, 50], "fight"),
+        )
+
+    def test_a_fight_played_again_gives_the_same_rounds(self):
+        with temporary_database():
+            steps = play_fight(CombatEngine(seed=7), "fight-1")
+            self.assertEqual(play_fight(CombatEngine(seed=7), "fight-1"), steps)
+
+        self.assertEqual(
+            steps[0]["draws"], CombatEngine(seed=7).draw_fight("fight-1", 2)
+        )
+        self.assertEqual([step["round"] for step in steps], list(range(len(steps))))
+        self.assertIsNotNone(steps[-1]["winner"])
+
+    # Result
+    #########
+    def test_fight_result(self):
+        self.assertEqual(
+            CombatEngine.fight_result(FIGHTER_STATS, [0.0, 12.5]),
+            ("Alejandro", "Carlos", False),
+        )
+        self.assertEqual(
+            CombatEngine.fight_result(FIGHTER_STATS, [10.0, 10.0]),
+            ("Carlos", "Alejandro", True),
+        )
+        with self.assertRaises(ValueError):
+            CombatEngine.fight_result([*FIGHTER_STATS, FIGHTER_STATS[0]], [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
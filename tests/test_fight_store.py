@@ -0,0 +1,122 @@
+"""Tests of the fight store: replaying a stored fight gives back the state of the graph.
+
+Run them from the root directory:
+
+    python -m unittest discover tests
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from langchain_core.messages import SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.agents.agent import AgenticFight
+from src.agents.agentic_tools import modifiers, special_hits
+from src.agents.fake_llm import FakeFightModel
+from src.agents.history import FightHistory
+from src.agents.state import FighterStats
+from src.benchmarks.common import FIGHTERS, MOVES, temporary_database
+from src.utils.fight_store import FightNotFound, FightStore
+
+
+class FightStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "fights.db")
+        self.store = FightStore(self.path, flush_every=1)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def play_fight(self, abot: AgenticFight, thread_id: str) -> list[dict]:
+        """Play a fight on the fake model.
+
+        Returns:
+            list[dict]: The state of the graph when each round starts, and at the end.
+        """
+        thread = {"configurable": {"thread_id": thread_id}}
+        abot.graph.invoke(
+            {"messages": [SystemMessage(content="")], "fighter_names": list(FIGHTERS)},
+            thread,
+        )
+        states = [abot.graph.get_state(thread).values]
+        while abot.graph.get_state(thread).next:
+            moves = MOVES[states[-1]["round"] % len(MOVES)]
+            abot.graph.update_state(thread, {"moves": moves})
+            abot.graph.invoke(None, thread)
+            states.append(abot.graph.get_state(thread).values)
+        return states
+
+    # Replay
+    #########
+    def test_replay_a_stored_fight(self):
+        # A short history, so that the oldest rounds are folded into the summary
+        history = FightHistory(keep_rounds=1, summary_chars=60)
+        with temporary_database():
+            abot = AgenticFight(
+                FakeFightModel(),
+                [special_hits, modifiers],
+                checkpointer=MemorySaver(),
+                history=history,
+                store=self.store,
+                on_result=lambda result: None,
+            )
+            states = self.play_fight(abot, "fight-1")
+
+        final = {key: value for key, value in states[-1].items() if key != "messages"}
+        self.assertIsNotNone(final["winner"])
+        self.assertGreater(final["summarized_rounds"], 0)
+        self.assertEqual(self.store.replay("fight-1", history=history), final)
+
+        # The state of each round, before the moves of the next one
+        for state in states[:-1]:
+            replayed = self.store.replay("fight-1", state["round"], history)
+            for key in (
+                "round",
+                "health",
+                "fight_evolution",
+                "draws",
+                "summarized_rounds",
+            ):
+                self.assertEqual(replayed[key], state[key])
+
+    def test_replay_an_unknown_fight(self):
+        self.assertFalse(self.store.has_fight("fight-1"))
+        with self.assertRaises(FightNotFound):
+            self.store.replay("fight-1")
+
+    def test_replay_a_fight_stored_before_its_draws(self):
+        self.store.close()
+        os.remove(self.path)
+        # The tables of the stores that did not record the draws and analyses
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE fights (fight_id TEXT PRIMARY KEY, created_at REAL, "
+                "fighters TEXT, health TEXT, scenario TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE rounds (fight_id TEXT, round INTEGER, moves TEXT, "
+                "modifiers TEXT, hit_multipliers TEXT, health TEXT, narration TEXT, "
+                "PRIMARY KEY (fight_id, round)) WITHOUT ROWID"
+            )
+        conn.close()
+
+        self.store = FightStore(self.path, flush_every=1)
+        fighters = [FighterStats(name, "", 5, 5, 5, 5) for name in FIGHTERS]
+        self.store.add_fight("fight-1", fighters, [50.0, 50.0], "Escenario")
+        self.store.add_round(
+            "fight-1", 1, MOVES[0], "", [1.0, 1.0], [40.0, 45.0], "Narración"
+        )
+
+        state = self.store.replay("fight-1")
+        self.assertEqual(state["health"], [40.0, 45.0])
+        self.assertEqual(state["analyses"], {})
+        self.assertNotIn("draws", state)
+
+
+if __name__ == "__main__":
+    unittest.main()
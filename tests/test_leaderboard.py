@@ -0,0 +1,89 @@
+"""Tests of the leaderboard: the batched results against a full rebuild of the scores.
+
+Run them from the root directory:
+
+    python -m unittest discover tests
+"""
+
+import os
+import random
+import tempfile
+import unittest
+
+from src.utils.databases import FightersRepository, FightResult
+
+NAMES = [f"Fighter {i}" for i in range(12)]
+
+
+def random_results(rng: random.Random, fights: int) -> list[FightResult]:
+    results = []
+    for _ in range(fights):
+        winner, loser = rng.sample(NAMES, 2)
+        results.append(FightResult(winner, loser, draw=rng.random() < 0.2))
+    return results
+
+
+class LeaderboardTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.repository = FightersRepository(
+            os.path.join(self.tmp_dir.name, "fighters.db")
+        )
+        self.repository.create_tables()
+
+    def tearDown(self):
+        self.repository.close()
+        self.tmp_dir.cleanup()
+
+    # Batches
+    ##########
+    def test_record_fight_results_matches_a_rebuild(self):
+        rng = random.Random(0)
+        # Loaded before the fights: kept up to date with the deltas of each batch
+        ranking = self.repository.ranking()
+        results = []
+        for batch_size in (1, 7, 50, 200):
+            batch = random_results(rng, batch_size)
+            self.repository.record_fight_results(batch)
+            results += batch
+
+        recorded = self.repository.top_fighters(len(NAMES))
+        self.assertEqual(ranking.top(len(NAMES)), recorded)
+        self.assertEqual(
+            sum(
+                standing.wins + standing.defeats + standing.draws
+                for standing in recorded
+            ),
+            2 * len(results),
+        )
+
+        self.repository.update_scores()
+        self.assertEqual(self.repository.top_fighters(len(NAMES)), recorded)
+        self.assertEqual(self.repository.ranking().top(len(NAMES)), recorded)
+        for standing in recorded:
+            self.assertEqual(
+                self.repository.ranking().rank(standing.fighter),
+                self.repository.fighter_rank(standing.fighter),
+            )
+
+    def test_head_to_head(self):
+        self.repository.record_fight_results(
+            [
+                FightResult("Carlos", "Alejandro"),
+                FightResult("Alejandro", "Carlos"),
+                FightResult("Carlos", "Alejandro", draw=True),
+            ]
+        )
+        self.repository.record_fight_results([FightResult("Carlos", "Alejandro")])
+        self.assertEqual(
+            self.repository.head_to_head("Carlos", "Alejandro"),
+            {"wins": 2, "defeats": 1, "draws": 1},
+        )
+        self.assertEqual(
+            self.repository.head_to_head("Alejandro", "Carlos"),
+            {"wins": 1, "defeats": 2, "draws": 1},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()